@@ -0,0 +1,150 @@
+"""
+Admin commands that don't go through the agents.
+
+    python admin.py import-orders --user BeNhiLiuGrace orders.csv
+    python admin.py import-orders --user ACME --session <session id> orders.json
+    python admin.py import-orders --user ACME --server http://127.0.0.1:8000 orders.csv
+    python admin.py find-order 1a2b3c4d
+    python admin.py slot-orders "19.10.2026 15:00"
+    python admin.py orders --phone 0908353308
+    python admin.py orders --customer "Yen Nhi" --from "19.10.2026 10:00" --to "20.10.2026 10:00"
+    python admin.py rebuild-orders
+
+import-orders places a CSV or JSON batch of orders (see
+agent/helpers/bulkOrders.py for the columns) into the user's latest
+session, or the given one, and prints the result of every order. While
+server.py (or supervisor.py) is running, pass --server: the import then
+goes through POST /orders/import of the worker that holds the session in
+its write-back cache. Writing the database directly under a running server
+would make that worker's cached copy of the session stale. The other
+commands query the orders tables of every customer
+(agent/helpers/orderIndex.py).
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from agent.helpers import parseBulkOrders, ingestOrders, findOrder, slotOrders, findOrders, rebuildOrderIndex
+from agent.helpers import HistoryBatch, releaseSlot
+from main import APP_NAME, get_or_create_session, make_session_service
+
+
+async def place_orders(session_service, user_id, session_id, text):
+    """Place a CSV/JSON batch of orders into one session (see import-orders)."""
+    from google.adk.events import Event, EventActions
+    from google.adk.sessions.state import State
+
+    orders = parseBulkOrders(text)
+    session = await session_service.get_session(app_name = APP_NAME, user_id = user_id, session_id = session_id)
+    if session is None:
+        raise LookupError(f"No session {session_id} for user {user_id}")
+
+    # The history rows are only written if the orders reach the session
+    async with HistoryBatch():
+        # Same state view the tools get, the changes are collected in `delta`
+        delta = {}
+        result = await ingestOrders(State(dict(session.state), delta), orders,
+                                    APP_NAME, user_id, session_id, source="admin")
+
+        # One event carries every new order into the session
+        if delta:
+            try:
+                await session_service.append_event(session, Event(
+                    author = "admin",
+                    invocation_id = f"admin-{int(time.time())}",
+                    actions = EventActions(state_delta = delta),
+                ))
+            except Exception:
+                # No order was placed: give their delivery slots back
+                for order in result["results"]:
+                    if order["status"] == "success":
+                        await asyncio.to_thread(releaseSlot, order["order_id"])
+                raise
+
+    return {"session_id": session_id, **result}
+
+
+async def import_orders(path, user_id, session_id = None):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    session_service = make_session_service()
+    try:
+        if session_id is None:
+            session_id, _ = await get_or_create_session(session_service, APP_NAME, user_id)
+        return await place_orders(session_service, user_id, session_id, text)
+    except LookupError as e:
+        raise SystemExit(str(e))
+    finally:
+        if hasattr(session_service, "close"):
+            await session_service.close()
+
+
+def import_orders_remote(server, path, user_id, session_id = None):
+    """import-orders through a running server.py / supervisor.py."""
+    import httpx
+
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    response = httpx.post(f"{server.rstrip('/')}/orders/import", timeout = 300,
+                          json = {"user_id": user_id, "session_id": session_id, "orders": text})
+    if response.status_code != 200:
+        raise SystemExit(f"Import failed ({response.status_code}): {response.json().get('detail')}")
+    return response.json()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Customer service admin commands")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    import_parser = commands.add_parser("import-orders", help = "place a CSV/JSON batch of orders")
+    import_parser.add_argument("file", help = "CSV or JSON file with the orders")
+    import_parser.add_argument("--user", required = True, help = "user id the orders belong to")
+    import_parser.add_argument("--session", help = "session id (default: the user's latest session)")
+    import_parser.add_argument("--server", help = "URL of the running server, required while one is running")
+
+    find_parser = commands.add_parser("find-order", help = "show one order of any customer")
+    find_parser.add_argument("order_id")
+
+    slot_parser = commands.add_parser("slot-orders", help = "list the deliveries of a delivery slot")
+    slot_parser.add_argument("time", help = 'a time in the slot, "dd.mm.YYYY HH:MM"')
+    slot_parser.add_argument("--cancelled", action = "store_true", help = "include cancelled orders")
+
+    orders_parser = commands.add_parser("orders", help = "search orders by phone, customer or delivery time")
+    orders_parser.add_argument("--phone")
+    orders_parser.add_argument("--customer")
+    orders_parser.add_argument("--from", dest = "start", help = 'earliest delivery time, "dd.mm.YYYY HH:MM"')
+    orders_parser.add_argument("--to", dest = "end", help = 'delivery time to stop before, "dd.mm.YYYY HH:MM"')
+    orders_parser.add_argument("--cancelled", action = "store_true", help = "include cancelled orders")
+    orders_parser.add_argument("--limit", type = int, default = 100)
+
+    commands.add_parser("rebuild-orders", help = "refill the orders tables from the sessions")
+
+    args = parser.parse_args(argv)
+    if args.command == "import-orders":
+        if args.server:
+            result = import_orders_remote(args.server, args.file, args.user, args.session)
+        else:
+            result = asyncio.run(import_orders(args.file, args.user, args.session))
+        print(json.dumps(result, indent = 2, ensure_ascii = False))
+        return 0 if result["accepted"] else 1
+
+    if args.command == "find-order":
+        result = findOrder(args.order_id)
+        if result is None:
+            print(f"No order {args.order_id}")
+            return 1
+    elif args.command == "slot-orders":
+        result = slotOrders(args.time, include_cancelled = args.cancelled)
+    elif args.command == "orders":
+        result = findOrders(args.phone, args.customer, args.start, args.end,
+                            include_cancelled = args.cancelled, limit = args.limit)
+    else:
+        result = rebuildOrderIndex()
+    print(json.dumps(result, indent = 2, ensure_ascii = False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
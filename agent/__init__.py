@@ -1 +1,11 @@
-from .agent import *
\ No newline at end of file
+# Building the agents imports google.adk and google.genai, so it is deferred
+# until one of them is first needed (e.g. when a Runner is created).
+# `import agent.helpers` alone stays cheap.
+_LAZY_NAMES = {"root_agent", "policyAgent", "saleAgent", "orderAgent", "gemini_model"}
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        from . import agent
+        return getattr(agent, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,12 +3,15 @@ from google.adk.agents import Agent
 from .subAgents.policyAgent import policyAgent
 from .subAgents.orderAgent import orderAgent
 from .subAgents.saleAgent import saleAgent
+from .router import preRouteCallback
+from .helpers import budgetContext
+from .scheduledModel import scheduledModel
 
 gemini_model = "gemini-2.0-flash"
 
 root_agent = Agent(
     name = "orchestor_agent",
-    model = gemini_model,
+    model = scheduledModel(gemini_model),
     description = "Orchestor Agent for customer service's innhi cookies",
     instruction = """
     You are the main routing agent for the innhi cookies in customer service. 
@@ -43,6 +46,8 @@ root_agent = Agent(
     - ONLY Order Agent can execute cancellations using cancelOrder tool.
     """,
     sub_agents = [policyAgent, saleAgent, orderAgent],
+    # Obvious requests skip the routing LLM call, see router.py
+    before_model_callback = [preRouteCallback, budgetContext],
     
 )
 
@@ -1 +1,15 @@
-from .helpers import *
\ No newline at end of file
+from .helpers import *
+from .orderStore import *
+from .database import *
+from .historyLog import *
+from .answerCache import *
+from .catalog import *
+from .shipping import *
+from .deliverySlots import *
+from .bulkOrders import *
+from .orderIndex import *
+from .compaction import *
+from .contextBudget import *
+from .modelScheduler import *
+from .tracing import *
+from .structuredLog import *
\ No newline at end of file
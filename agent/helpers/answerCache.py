@@ -0,0 +1,166 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+# Filler words that don't change what a question is about
+STOP_WORDS = set("""
+a an the is are am do does did i you your we our my me can could would should
+to of for in on at what whats how it this that be there any please
+""".split())
+
+
+_NUMBER_WORDS = {
+    word: str(value) for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve".split()
+    )
+}
+
+
+def normalizeQuestion(text: str) -> str:
+    text = re.sub(r"[^\w\s]", "", text.lower())
+    return " ".join(_NUMBER_WORDS.get(word, word) for word in text.split() if word not in STOP_WORDS)
+
+
+def _numbers(key: str) -> list:
+    # "5 hours" and "2 hours" are different questions however similar the rest
+    return sorted(re.findall(r"\d+", key))
+
+
+def _terms(text: str) -> Counter:
+    # Words plus character 3-grams, so small paraphrases and typos still match
+    words = text.split()
+    grams = [text[i:i + 3] for i in range(len(text) - 2)]
+    return Counter(words + grams)
+
+
+def instructionVersion(instruction: str) -> str:
+    return hashlib.sha1(instruction.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Paraphrase-tolerant question -> answer cache.
+
+    Questions are normalized and compared with TF-IDF weighted cosine
+    similarity over words and character 3-grams. A cached question only
+    matches if it has exactly the same numbers (hours, quantities, ...). Entries expire after
+    `ttl` seconds, the least recently used one is evicted past
+    `max_entries`, and the whole cache is dropped when `version`
+    (e.g. a hash of the agent instruction) changes.
+
+    Args:
+        ttl: seconds an answer stays valid
+        max_entries: LRU capacity
+        threshold: minimum similarity to count as the same question
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_entries: int = 512, threshold: float = 0.8):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.version = None
+        self.stats = {"hits": 0, "misses": 0}
+
+        self._entries = OrderedDict()   # normalized question -> (terms, answer, stored_at)
+        self._postings = {}             # term -> set of normalized questions
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _checkVersion(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self._postings.clear()
+            self.version = version
+
+    def _remove(self, key):
+        terms, _, _ = self._entries.pop(key)
+        for term in terms:
+            questions = self._postings.get(term)
+            if questions:
+                questions.discard(key)
+                if not questions:
+                    del self._postings[term]
+
+    def _idf(self, term) -> float:
+        df = len(self._postings.get(term, ()))
+        return math.log((len(self._entries) + 1) / (df + 1)) + 1
+
+    def _similarity(self, query_terms, query_norm, entry_terms) -> float:
+        dot = 0.0
+        for term, count in query_terms.items():
+            if term in entry_terms:
+                dot += count * entry_terms[term] * self._idf(term) ** 2
+        if not dot:
+            return 0.0
+        entry_norm = math.sqrt(sum((c * self._idf(t)) ** 2 for t, c in entry_terms.items()))
+        return dot / (query_norm * entry_norm)
+
+    def get(self, question: str, version=None):
+        """Return the cached answer for a similar question, or None."""
+        key = normalizeQuestion(question)
+        now = time.monotonic()
+
+        with self._lock:
+            self._checkVersion(version)
+
+            candidates = {key} if key in self._entries else set()
+            if not candidates:
+                query_terms = _terms(key)
+                for term in query_terms:
+                    candidates |= self._postings.get(term, set())
+
+            best_key, best_score = None, 0.0
+            if key in candidates:
+                best_key, best_score = key, 1.0
+            elif candidates:
+                query_norm = math.sqrt(sum((c * self._idf(t)) ** 2 for t, c in query_terms.items()))
+                query_numbers = _numbers(key)
+                for candidate in candidates:
+                    if _numbers(candidate) != query_numbers:
+                        continue
+                    score = self._similarity(query_terms, query_norm, self._entries[candidate][0])
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+
+            if best_key is None or best_score < self.threshold:
+                self.stats["misses"] += 1
+                return None
+
+            _, answer, stored_at = self._entries[best_key]
+            if now - stored_at > self.ttl:
+                self._remove(best_key)
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.stats["hits"] += 1
+            return answer
+
+    def put(self, question: str, answer: str, version=None):
+        key = normalizeQuestion(question)
+        if not key or not answer:
+            return
+
+        with self._lock:
+            self._checkVersion(version)
+            if key in self._entries:
+                self._remove(key)
+
+            terms = _terms(key)
+            self._entries[key] = (terms, answer, time.monotonic())
+            for term in terms:
+                self._postings.setdefault(term, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
@@ -0,0 +1,203 @@
+"""
+Bulk order ingestion (corporate and batch orders).
+
+A CSV or JSON list of orders is checked in one pass. The pass parses the
+delivery times (memoized per phrase), applies the checkOrderValid rules,
+prices the lines from the catalog, compares them with any expected
+total (products only) and quotes the shipping fee of the address. Then
+the valid orders get their delivery slots, RESERVE_CHUNK orders per
+transaction in a worker thread, all accepted orders go into the state with
+one index write, and their history rows are committed together.
+
+CSV: one row per order line, with the columns
+    order_ref (optional; rows sharing it form one order), customer, product,
+    quantity, delivery_time, phone, address, total (optional)
+JSON: a list of orders shaped like purchaseProduct's arguments, or of flat
+rows as in the CSV.
+"""
+import asyncio
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from .catalog import getCatalog
+from .deliverySlots import nextAvailableSlots, reserveSlots
+from .helpers import checkOrderValid, timeConvert
+from .historyLog import HistoryBatch, appendInteraction
+from .orderStore import OrderStore
+from .shipping import getShippingTable
+
+__all__ = ["MAX_BULK_ORDERS", "parseBulkOrders", "ingestOrders"]
+
+MAX_BULK_ORDERS = 1000
+# Slot reservations per write transaction, so a big batch never holds the
+# SQLite write lock for long while other sessions wait
+RESERVE_CHUNK = 100
+
+_REQUIRED = ("customer", "delivery_time", "phone", "address")
+
+
+def parseBulkOrders(data) -> list:
+    """
+    Turn CSV text, JSON text or an already parsed list into orders.
+
+    Returns:
+        list: orders with "rows" (1-based source rows), "customer",
+              "products" [{"name", "quantity"}], "delivery_time", "phone",
+              "address" and optional "total"
+    """
+    if isinstance(data, str):
+        text = data.strip()
+        if text.startswith("[") or text.startswith("{"):
+            data = json.loads(text)
+            if isinstance(data, dict):
+                data = data.get("orders", [data])
+        else:
+            data = list(csv.DictReader(io.StringIO(text)))
+
+    orders = []
+    grouped = {}
+    for row_number, row in enumerate(data, 1):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+
+        if "products" in row:
+            products = row["products"]
+        else:
+            products = [{"name": row.get("product"), "quantity": row.get("quantity")}]
+
+        ref = row.get("order_ref")
+        if ref and ref in grouped:
+            # Another line of an order already seen
+            grouped[ref]["products"].extend(products)
+            grouped[ref]["rows"].append(row_number)
+            continue
+
+        order = {
+            "rows": [row_number],
+            "customer": row.get("customer"),
+            "products": list(products),
+            "delivery_time": row.get("delivery_time"),
+            "phone": row.get("phone"),
+            "address": row.get("address"),
+            "total": row.get("total"),
+        }
+        if ref:
+            grouped[ref] = order
+        orders.append(order)
+    return orders
+
+
+def _validate(order: dict, ordered_time: str) -> dict:
+    """Check one order; returns the order record or {"error": message}."""
+    missing = [field for field in _REQUIRED if not order.get(field)]
+    if missing:
+        return {"error": f"Missing {', '.join(missing)}."}
+
+    try:
+        deli_time = timeConvert(str(order["delivery_time"]))
+    except ValueError:
+        return {"error": f"Can't read the delivery time '{order['delivery_time']}'."}
+
+    check_result = checkOrderValid(ordered_time, deli_time)
+    if not check_result["valid"]:
+        return {"error": check_result["message"]}
+
+    priced = getCatalog().price(order["products"])
+    if priced["invalid"]:
+        return {"error": f"Invalid quantity of {', '.join(map(str, priced['invalid']))}."}
+    if priced["unknown"] or not priced["products"]:
+        return {"error": f"Unknown products: {', '.join(map(str, priced['unknown'])) or 'none given'}."}
+
+    if order.get("total") not in (None, ""):
+        try:
+            expected = float(order["total"])
+        except (TypeError, ValueError):
+            return {"error": f"Invalid total '{order['total']}'."}
+        if abs(expected - priced["total"]) > 0.005:
+            return {"error": f"Total {order['total']} doesn't match the catalog price {priced['total']}."}
+
+    shipping = getShippingTable().quote(order["address"])
+    if shipping["fee"] is None:
+        return {"error": f"Can't find the district of '{order['address']}'." if shipping["district"] is None
+                else f"We don't deliver to {shipping['district'].title()}."}
+
+    return {
+        "order_id": str(uuid.uuid4())[:8],
+        "customer_name": order["customer"],
+        "products": priced["products"],
+        "delivery_time": deli_time,
+        "address": order["address"],
+        "phone": str(order["phone"]),
+        "temp_total_not_include_shipping_fee": priced["total"],
+        "shipping_fee": shipping["fee"],
+        "total": priced["total"] + shipping["fee"],
+        "purchased_time": ordered_time,
+    }
+
+
+async def ingestOrders(state, orders: list, app_name: str, user_id: str, session_id: str,
+                 source: str = "bulk") -> dict:
+    """
+    Validate and place many orders at once.
+
+    Args:
+        state: tool_context.state, or an ADK State over a session's state
+        orders: output of parseBulkOrders
+        source: recorded in the interaction history ("tool", "admin", ...)
+
+    Returns:
+        dict: "accepted" and "rejected" counts, and one result per order
+              with its source "rows", "status", "order_id" or "message"
+    """
+    if len(orders) > MAX_BULK_ORDERS:
+        return {"status": "error", "message": f"At most {MAX_BULK_ORDERS} orders per batch.",
+                "accepted": 0, "rejected": len(orders), "results": []}
+
+    ordered_time = datetime.now().strftime("%d.%m.%Y %H:%M")
+    results = []
+    valid = []
+    for order in orders:
+        record = _validate(order, ordered_time)
+        if "error" in record:
+            results.append({"rows": order["rows"], "status": "error", "message": record["error"]})
+        else:
+            results.append({"rows": order["rows"], "status": "pending"})
+            valid.append((len(results) - 1, record))
+
+    # Off the event loop: the session service may hold the write lock there
+    requests = [(record["order_id"], record["delivery_time"], 1) for _, record in valid]
+    reserved = []
+    for first in range(0, len(requests), RESERVE_CHUNK):
+        reserved += await asyncio.to_thread(reserveSlots, requests[first:first + RESERVE_CHUNK])
+
+    accepted = []
+    for (index, record), ok in zip(valid, reserved):
+        if not ok:
+            slots = await asyncio.to_thread(nextAvailableSlots, 3, after=record["delivery_time"])
+            suggestions = ", ".join(slot["slot"] for slot in slots)
+            results[index].update(status="error",
+                                  message=f"Fully booked at {record['delivery_time']}, next free: {suggestions}")
+            continue
+        results[index].update(status="success", order_id=record["order_id"],
+                              subtotal=record["temp_total_not_include_shipping_fee"],
+                              shipping_fee=record["shipping_fee"], total=record["total"])
+        accepted.append(record)
+
+    # One state write for all orders, one history transaction
+    OrderStore(state).addMany(accepted)
+    async with HistoryBatch():
+        for record in accepted:
+            appendInteraction(app_name, user_id, session_id, {
+                "action": "purchase_product",
+                "order_id": record["order_id"],
+                "source": source,
+                "timestamp": ordered_time,
+            })
+
+    return {
+        "status": "success" if accepted else "error",
+        "accepted": len(accepted),
+        "rejected": len(results) - len(accepted),
+        "results": results,
+    }
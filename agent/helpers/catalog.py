@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import threading
+
+__all__ = ["CATALOG_PATH", "setCatalogPath", "getCatalog", "Catalog", "normalizeProductName"]
+
+# Product table shipped with the agents, edit it to change the menu
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json")
+
+# Words that don't tell products apart ("2 jars of chocolate cookies")
+_FILLER_WORDS = {"cookie", "cookies", "jar", "jars", "of", "the", "a", "an", "box", "boxes"}
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def normalizeProductName(name: str) -> str:
+    words = re.findall(r"[a-z0-9]+", name.lower())
+    return " ".join(sorted(word for word in words if word not in _FILLER_WORDS))
+
+
+def _quantity(value):
+    # Whole number of at least 1 (3, 3.0, "3"), None for anything else
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.isdigit() and int(value) >= 1 else None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return value if isinstance(value, int) and value >= 1 else None
+
+
+class Catalog:
+    """
+    Product table loaded once into memory.
+
+    Products are indexed by SKU and by every normalized name and alias, so
+    "Cookies Chocolate", "chocolate cookies" and "choco" all resolve to
+    the same SKU. Anything else ("white chocolate") matches nothing, so
+    the agent asks the customer instead of guessing. Menu renderings are
+    cached per query.
+
+    Args:
+        products: list of {"sku", "name", "price", "unit", "category",
+                  "aliases", "available"}
+        currency: symbol used in the menu
+    """
+
+    def __init__(self, products: list, currency: str = "$"):
+        self.currency = currency
+        self.products = {product["sku"]: product for product in products}
+        self._index = {}
+        self._menus = {}
+
+        for product in products:
+            for name in [product["name"], product["sku"], *product.get("aliases", [])]:
+                key = normalizeProductName(name)
+                if key:
+                    self._index.setdefault(key, product["sku"])
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["products"], data.get("currency", "$"))
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def lookup(self, name: str):
+        """Return the product a name or alias refers to, or None."""
+        if not name:
+            return None
+        if name in self.products:
+            return self.products[name]
+
+        sku = self._index.get(normalizeProductName(name))
+        return self.products.get(sku) if sku else None
+
+    def menu(self, query: str = None) -> str:
+        """Menu text of the available products (matching `query` if given)."""
+        key = normalizeProductName(query) if query else ""
+        menu = self._menus.get(key)
+        if menu is None:
+            words = set(key.split())
+            lines = []
+            for product in self.products.values():
+                if not product.get("available", True):
+                    continue
+                searchable = set(normalizeProductName(
+                    " ".join([product["name"], product.get("category", ""), *product.get("aliases", [])])
+                ).split())
+                if words and not words & searchable:
+                    continue
+                lines.append(f"- {product['name']}: {self.currency}{product['price']} per {product.get('unit', 'item')}")
+            menu = "\n".join(lines)
+            self._menus[key] = menu
+        return menu
+
+    def price(self, items: list) -> dict:
+        """
+        Price order lines from the catalog, ignoring any price they carry.
+
+        Args:
+            items: [{"name": str, "quantity": int}]
+
+        Returns:
+            dict: "products" (canonical lines with sku and unit price),
+                  "total", "unknown" (names that matched no product) and
+                  "invalid" (names whose quantity is missing or not a
+                  whole number of at least 1)
+        """
+        products, unknown, invalid, total = [], [], [], 0
+        for item in items:
+            product = self.lookup(str(item.get("name") or item.get("sku") or ""))
+            if product is None or not product.get("available", True):
+                unknown.append(item.get("name"))
+                continue
+            quantity = _quantity(item.get("quantity"))
+            if quantity is None:
+                invalid.append(item.get("name"))
+                continue
+            products.append({
+                "sku": product["sku"],
+                "name": product["name"],
+                "quantity": quantity,
+                "price": product["price"],
+            })
+            total += product["price"] * quantity
+        return {"products": products, "total": total, "unknown": unknown, "invalid": invalid}
+
+
+def setCatalogPath(path: str):
+    """Use another catalog file, loaded on the next getCatalog()."""
+    global CATALOG_PATH, _catalog
+    with _lock:
+        CATALOG_PATH = path
+        _catalog = None
+
+
+def getCatalog() -> Catalog:
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = Catalog.load(CATALOG_PATH)
+    return _catalog
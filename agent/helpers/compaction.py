@@ -0,0 +1,241 @@
+"""
+Event-log compaction for long-lived sessions.
+
+Old events of a session are folded into a checkpoint kept in the session
+state (`conversation_checkpoint`: a short transcript summary plus how many
+events it covers) and deleted, so only a recent tail stays in `events`.
+The session state column already holds the folded state of every event,
+so nothing else is lost. Session loads and the model's context then stay
+the same size however old the conversation is.
+
+Offline job (only touches sessions idle for --idle-minutes):
+    python -m agent.helpers.compaction --keep 40 --min-events 120
+
+Online mode: run_turn calls maybeCompact after each turn once
+setOnlineCompaction() has been called.
+"""
+import argparse
+import json
+from datetime import datetime, timedelta, timezone
+from . import database
+from .tracing import span
+
+__all__ = [
+    "CHECKPOINT_KEY", "setOnlineCompaction", "onlineCompactionEnabled", "onlineCompactionThreshold",
+    "compactSession", "maybeCompact", "compactAll",
+    "summaryLine", "foldLines",
+]
+
+CHECKPOINT_KEY = "conversation_checkpoint"
+
+# Defaults: compact a session once it has MIN_EVENTS events, keep KEEP_EVENTS
+KEEP_EVENTS = 40
+MIN_EVENTS = 120
+MAX_SUMMARY_CHARS = 2000
+MAX_LINE_CHARS = 200
+
+_online = {"enabled": False, "keep": KEEP_EVENTS, "min_events": MIN_EVENTS}
+
+
+def setOnlineCompaction(enabled: bool = True,
+                        keep: int = KEEP_EVENTS,
+                        min_events: int = MIN_EVENTS):
+    _online.update(enabled=enabled, keep=keep, min_events=min_events)
+
+
+def onlineCompactionEnabled() -> bool:
+    return _online["enabled"]
+
+
+def onlineCompactionThreshold() -> int:
+    return _online["min_events"]
+
+
+def summaryLine(author: str, text: str) -> str:
+    """One transcript line of a summary, whitespace collapsed and truncated."""
+    text = " ".join(text.split())
+    if not text:
+        return ""
+    if len(text) > MAX_LINE_CHARS:
+        text = text[:MAX_LINE_CHARS - 3] + "..."
+    return f"{'customer' if author == 'user' else author}: {text}"
+
+
+def foldLines(previous_summary: str, lines: list) -> str:
+    """Append lines to a summary, keeping its newest MAX_SUMMARY_CHARS."""
+    summary = "\n".join(([previous_summary] if previous_summary else []) + [line for line in lines if line])
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = "..." + summary[-(MAX_SUMMARY_CHARS - 3):]
+    return summary
+
+
+def _eventText(author: str, content) -> str:
+    # Only plain text is worth summarizing, tool calls are already in state
+    if not content:
+        return ""
+    try:
+        parts = (json.loads(content) if isinstance(content, str) else content).get("parts") or []
+    except (ValueError, AttributeError):
+        return ""
+    return summaryLine(author, " ".join(part["text"].strip() for part in parts if part.get("text")))
+
+
+def summarize(previous_summary: str, events: list) -> str:
+    """Append the folded events' text to the previous summary, keeping the newest part."""
+    return foldLines(previous_summary, [_eventText(author, content) for author, content in events])
+
+
+def _loadEvents(conn, key: tuple) -> list:
+    # [(id, author, content, timestamp)] of a session, oldest first. Older
+    # ADK versions store author/content columns, newer ones one event_data
+    # JSON document per event
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    if "author" in columns:
+        return conn.execute(
+            "SELECT id, author, content, timestamp FROM events "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ? "
+            "ORDER BY timestamp",
+            key,
+        ).fetchall()
+
+    rows = []
+    for event_id, data, timestamp in conn.execute(
+        "SELECT id, event_data, timestamp FROM events "
+        "WHERE app_name = ? AND user_id = ? AND session_id = ? "
+        "ORDER BY timestamp",
+        key,
+    ):
+        event = json.loads(data or "{}")
+        rows.append((event_id, event.get("author"), event.get("content"), timestamp))
+    return rows
+
+
+def compactSession(app_name: str,
+                   user_id: str,
+                   session_id: str,
+                   keep: int = KEEP_EVENTS,
+                   min_events: int = MIN_EVENTS) -> int:
+    """
+    Fold all but the last `keep` events of one session into its checkpoint.
+
+    The cut is moved back to the start of a customer turn, so a tool call
+    is never separated from its response.
+
+    Returns:
+        int: number of events folded (0 if the session was small enough)
+    """
+    conn = database.connect()
+    key = (app_name, user_id, session_id)
+
+    # BEGIN IMMEDIATE so no other writer slips in between read and write
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = _loadEvents(conn, key)
+
+        if len(rows) < max(min_events, keep + 1):
+            conn.execute("ROLLBACK")
+            return 0
+
+        cut = len(rows) - keep
+        while cut > 0 and rows[cut][1] != "user":
+            cut -= 1
+        if cut == 0:
+            conn.execute("ROLLBACK")
+            return 0
+
+        folded = rows[:cut]
+        state_row = conn.execute(
+            "SELECT state FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            key,
+        ).fetchone()
+        state = json.loads(state_row[0]) if state_row else {}
+
+        checkpoint = state.get(CHECKPOINT_KEY) or {}
+        state[CHECKPOINT_KEY] = {
+            "summary": summarize(checkpoint.get("summary", ""),
+                                 [(author, content) for _, author, content, _ in folded]),
+            "folded_events": checkpoint.get("folded_events", 0) + len(folded),
+            "through": str(folded[-1][3]),
+        }
+
+        # update_time moves on, so a copy loaded before the compaction is
+        # seen as stale by the session service instead of overwriting it
+        conn.execute(
+            "UPDATE sessions SET state = ?, update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (json.dumps(state, ensure_ascii=False),
+             datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"), *key),
+        )
+        conn.executemany(
+            "DELETE FROM events WHERE id = ? AND app_name = ? AND user_id = ? AND session_id = ?",
+            [(event_id, *key) for event_id, *_ in folded],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = ""
+
+    return len(folded)
+
+
+def maybeCompact(app_name: str, user_id: str, session_id: str) -> int:
+    """Online mode: compact the session if it grew past the threshold."""
+    if not _online["enabled"]:
+        return 0
+
+    count = database.connect().execute(
+        "SELECT COUNT(*) FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+        (app_name, user_id, session_id),
+    ).fetchone()[0]
+    if count < _online["min_events"]:
+        return 0
+    with span("compaction", session_id=session_id, events=count):
+        return compactSession(app_name, user_id, session_id, _online["keep"], _online["min_events"])
+
+
+def compactAll(keep: int = KEEP_EVENTS,
+               min_events: int = MIN_EVENTS,
+               idle_minutes: float = 30) -> dict:
+    """Offline job: compact every large session that has been idle for a while."""
+    # update_time is stored in UTC
+    idle_since = datetime.now(timezone.utc) - timedelta(minutes=idle_minutes)
+    candidates = database.connect().execute(
+        "SELECT s.app_name, s.user_id, s.id FROM sessions s "
+        "JOIN events e ON e.app_name = s.app_name AND e.user_id = s.user_id AND e.session_id = s.id "
+        "WHERE s.update_time <= ? "
+        "GROUP BY s.app_name, s.user_id, s.id HAVING COUNT(*) >= ?",
+        (idle_since.strftime("%Y-%m-%d %H:%M:%S.%f"), min_events),
+    ).fetchall()
+
+    report = {"sessions": 0, "folded_events": 0, "orphan_events": 0}
+
+    # SQLite doesn't enforce the events -> sessions foreign key unless asked
+    # to, so deleted sessions can leave their events behind
+    conn = database.connect()
+    with conn:
+        report["orphan_events"] = conn.execute(
+            "DELETE FROM events WHERE NOT EXISTS ("
+            "SELECT 1 FROM sessions s WHERE s.app_name = events.app_name "
+            "AND s.user_id = events.user_id AND s.id = events.session_id)"
+        ).rowcount
+
+    for app_name, user_id, session_id in candidates:
+        folded = compactSession(app_name, user_id, session_id, keep, min_events)
+        if folded:
+            report["sessions"] += 1
+            report["folded_events"] += folded
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the events of long-lived sessions.")
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--keep", type=int, default=KEEP_EVENTS)
+    parser.add_argument("--min-events", type=int, default=MIN_EVENTS)
+    parser.add_argument("--idle-minutes", type=float, default=30)
+    args = parser.parse_args()
+
+    database.setDatabasePath(args.db)
+    print(compactAll(args.keep, args.min_events, args.idle_minutes))
@@ -0,0 +1,178 @@
+"""
+Context budgeting for every model call.
+
+Without it the whole session history goes to the model on every call, so
+prompts grow with the customer's lifetime. budgetContext (a
+before_model_callback) keeps only the last KEEP_TURNS customer turns
+verbatim. Older turns become a rolling summary appended to the
+instruction, together with the compaction checkpoint. Once turns are left
+out (here or by compaction), a short digest of the latest orders is added
+too, since the orders may no longer be in the history. When the request is
+still over the agent's CONTEXT_BUDGETS entry, more old turns are folded
+into the summary, but never the current one.
+
+Tokens are estimated at CHARS_PER_TOKEN characters per token. The prompt
+tokens saved by each turn are reported through popTokensSaved (and the
+"saved" token counter of the tracing metrics).
+"""
+import json
+from .compaction import CHECKPOINT_KEY, foldLines, summaryLine
+from .orderStore import OrderStore
+from .tracing import addTokens
+
+__all__ = [
+    "KEEP_TURNS", "CONTEXT_BUDGETS", "CONTEXT_STATS",
+    "estimateTokens", "orderDigest", "budgetContext", "popTokensSaved",
+]
+
+# Customer turns always sent verbatim
+KEEP_TURNS = 6
+CHARS_PER_TOKEN = 4
+
+# Prompt token budget per agent (instruction + summary + history)
+DEFAULT_BUDGET = 4000
+CONTEXT_BUDGETS = {
+    "orchestor_agent": 2500,
+    "Seller": 4000,
+    "Order": 4000,
+    "Policy": 2500,
+}
+
+# Agents that get the order digest, and how many orders it lists
+DIGEST_AGENTS = {"orchestor_agent", "Seller", "Order"}
+DIGEST_ORDERS = 5
+
+CONTEXT_STATS = {"calls": 0, "trimmed_calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+# invocation_id -> prompt tokens saved by the model calls of that turn
+_saved = {}
+
+
+def _contentChars(content) -> int:
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        elif part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        elif part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars
+
+
+def estimateTokens(text_or_contents) -> int:
+    """Rough token count of a string or a list of Content."""
+    if isinstance(text_or_contents, str):
+        return len(text_or_contents) // CHARS_PER_TOKEN
+    return sum(_contentChars(content) for content in text_or_contents) // CHARS_PER_TOKEN
+
+
+def _text(content) -> str:
+    return " ".join(part.text for part in content.parts or [] if part.text)
+
+
+def _isCustomerTurn(content) -> bool:
+    # Other agents' messages are also sent as "user" contents ("For context: ...")
+    if content.role != "user" or any(part.function_response for part in content.parts or []):
+        return False
+    text = _text(content)
+    return bool(text) and not text.startswith("For context")
+
+
+def _summaryLine(content) -> str:
+    text = _text(content)
+    if content.role == "user" and text.startswith("For context"):
+        return summaryLine("context", text[len("For context:"):])
+    return summaryLine("user" if content.role == "user" else "agent", text)
+
+
+def orderDigest(state, limit: int = DIGEST_ORDERS) -> str:
+    """One line per recent order, instead of the full order records."""
+    orders = OrderStore(state)
+    if not orders:
+        return ""
+
+    lines = []
+    for order in orders.recent(limit):
+        if not order:
+            continue
+        products = ", ".join(
+            f"{product.get('quantity', 1)}x {product.get('name', '?')}" for product in order.get("products", [])
+        )
+        # Orders placed before shipping was quoted only have a subtotal
+        total = f"| shipping {order['shipping_fee']} | total {order['total']} " if order.get("total") is not None else ""
+        lines.append(
+            f"- {order.get('order_id')}: {products} | deliver {order.get('delivery_time')} "
+            f"to {order.get('address')} | subtotal {order.get('temp_total_not_include_shipping_fee')} "
+            f"{total}| placed {order.get('purchased_time')}"
+        )
+    older = len(orders) - len(lines)
+    if older > 0:
+        lines.append(f"- ... and {older} older orders (ask for the order id)")
+    return "\n".join(lines)
+
+
+def popTokensSaved(invocation_id: str) -> int:
+    """Prompt tokens budgetContext saved during one turn (invocation)."""
+    return _saved.pop(invocation_id, 0)
+
+
+def budgetContext(callback_context, llm_request):
+    """before_model_callback keeping the request within the agent's token budget."""
+    agent_name = callback_context.agent_name
+    budget = CONTEXT_BUDGETS.get(agent_name, DEFAULT_BUDGET)
+    contents = llm_request.contents or []
+    instruction = str(llm_request.config.system_instruction or "") if llm_request.config else ""
+    instruction_tokens = estimateTokens(instruction)
+    before = instruction_tokens + estimateTokens(contents)
+
+    state = callback_context.state
+    checkpoint = state.get(CHECKPOINT_KEY) or {}
+    digest = orderDigest(state) if agent_name in DIGEST_AGENTS else ""
+
+    # The kept history always starts at a customer turn, so tool calls and
+    # their responses are never split
+    starts = [i for i, content in enumerate(contents) if _isCustomerTurn(content)]
+    cut_options = starts[-KEEP_TURNS:] if starts else [0]
+    if len(starts) <= KEEP_TURNS:
+        cut_options = [0] + cut_options[1:]
+
+    def extras(cut):
+        summary = foldLines(checkpoint.get("summary", ""), [_summaryLine(content) for content in contents[:cut]])
+        parts = []
+        if summary:
+            parts.append("Summary of the earlier conversation with this customer "
+                         "(older messages are no longer shown):\n" + summary)
+        # The orders are only missing from the history once turns are left out
+        if digest and (cut or checkpoint.get("summary")):
+            parts.append("The customer's latest orders:\n" + digest)
+        return parts
+
+    # Fold more turns while over budget, the current turn always stays
+    cut = cut_options[0]
+    for option in cut_options:
+        cut = option
+        total = instruction_tokens + estimateTokens("\n".join(extras(cut))) + estimateTokens(contents[cut:])
+        if total <= budget:
+            break
+
+    added = extras(cut)
+    if cut:
+        llm_request.contents = contents[cut:]
+    if added:
+        llm_request.append_instructions(added)
+
+    after = instruction_tokens + estimateTokens("\n".join(added)) + estimateTokens(llm_request.contents)
+    CONTEXT_STATS["calls"] += 1
+    CONTEXT_STATS["trimmed_calls"] += bool(cut)
+    CONTEXT_STATS["tokens_before"] += before
+    CONTEXT_STATS["tokens_after"] += after
+
+    saved = max(0, before - after)
+    if saved:
+        if len(_saved) > 1000:
+            _saved.clear()
+        invocation_id = callback_context.invocation_id
+        _saved[invocation_id] = _saved.get(invocation_id, 0) + saved
+        addTokens(agent_name, saved=saved)
+    return None
@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+__all__ = [
+    "setDatabasePath", "dbPathFromUrl", "connect",
+    "SQLITE_PRAGMAS", "applyPragmas", "engineOptions", "useStorageProfile", "migrate",
+]
+
+# Same SQLite file the DatabaseSessionService writes to
+DB_PATH = "./cookies_customer_service_data.db"
+
+# Storage profile applied to every connection, ours and the session service's.
+# WAL lets readers run while one turn writes, and with synchronous=NORMAL a
+# commit no longer waits for fsync (a power cut can lose the last commits,
+# never corrupt the file).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,            # ms
+    "cache_size": -64000,             # 64 MB page cache per connection
+    "mmap_size": 256 * 1024 * 1024,   # read pages through mmap
+    "temp_store": "MEMORY",
+}
+
+# Indexes for the session service's access patterns, applied once per file
+MIGRATIONS = [
+    # Loading a session's events in order
+    ("001_events_session_timestamp",
+     "CREATE INDEX IF NOT EXISTS ix_events_session_timestamp "
+     "ON events (app_name, user_id, session_id, timestamp)"),
+    # Finding a user's most recent session, and idle sessions for compaction
+    ("002_sessions_update_time",
+     "CREATE INDEX IF NOT EXISTS ix_sessions_user_update_time "
+     "ON sessions (app_name, user_id, update_time)"),
+    ("003_sessions_update_time_global",
+     "CREATE INDEX IF NOT EXISTS ix_sessions_update_time ON sessions (update_time)"),
+]
+
+# Our indexes that the session service now creates itself: from ADK 2 on,
+# events come with an index on (app_name, user_id, session_id, timestamp, id)
+REPLACED_BY = {
+    "ix_events_session_timestamp": "idx_events_app_user_session_ts_id",
+}
+
+_local = threading.local()
+
+
+def setDatabasePath(path: str):
+    """Point the helper tables at another SQLite file (e.g. for benchmarks)."""
+    global DB_PATH
+    DB_PATH = path
+    _local.__dict__.clear()
+
+
+def dbPathFromUrl(db_url: str) -> str:
+    # "sqlite:///./file.db" or "sqlite+aiosqlite:///./file.db" -> "./file.db"
+    return db_url.split(":///", 1)[-1]
+
+
+def applyPragmas(conn, pragmas: dict = None):
+    """Apply the storage profile to a DB-API connection."""
+    cursor = conn.cursor()
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Return this thread's connection to DB_PATH.
+
+    Connections are opened once per thread and reused, so a single append
+    doesn't pay for opening the database file again.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        applyPragmas(conn)
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
+
+
+def engineOptions(pool_size: int = 16) -> dict:
+    """
+    Engine arguments for DatabaseSessionService(db_url=..., **engineOptions()).
+
+    One pooled connection per concurrent turn, so turns don't queue for a
+    connection; SQLite itself still serializes the writes.
+    """
+    return {
+        "pool_size": pool_size,
+        "max_overflow": pool_size,
+        "pool_timeout": 30,
+        "connect_args": {"timeout": 30, "check_same_thread": False},
+    }
+
+
+def useStorageProfile(engine):
+    """Apply SQLITE_PRAGMAS to every connection the SQLAlchemy engine opens."""
+    from sqlalchemy import event
+
+    # Async engines register pool events on their sync counterpart
+    engine = getattr(engine, "sync_engine", engine)
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _onConnect(dbapi_connection, connection_record):
+        applyPragmas(dbapi_connection)
+
+
+def migrate(path: str = None) -> list:
+    """
+    Apply the pending MIGRATIONS to the database at `path` (default DB_PATH).
+
+    Run it after the session service has created its tables. Migrations
+    whose tables don't exist yet are left for the next run. An index in
+    REPLACED_BY is not created when its replacement exists, and dropped if
+    an earlier run created it.
+
+    Returns:
+        list: names of the migrations applied now
+    """
+    conn = sqlite3.connect(path or DB_PATH, timeout=30)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(name VARCHAR(128) PRIMARY KEY, applied_at VARCHAR(32) NOT NULL)"
+        )
+        done = {row[0] for row in conn.execute("SELECT name FROM schema_migrations")}
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+        applied = []
+        for name, sql in MIGRATIONS:
+            index = sql.split(" EXISTS ", 1)[1].split()[0]
+            table = sql.split(" ON ", 1)[1].split()[0]
+            if REPLACED_BY.get(index) in indexes and index in indexes:
+                with conn:
+                    conn.execute(f"DROP INDEX {index}")
+            if name in done or table not in tables:
+                continue
+            with conn:
+                if REPLACED_BY.get(index) not in indexes:
+                    conn.execute(sql)
+                conn.execute(
+                    "INSERT INTO schema_migrations (name, applied_at) VALUES (?, ?)",
+                    (name, datetime.now().isoformat()),
+                )
+            applied.append(name)
+        return applied
+    finally:
+        conn.close()
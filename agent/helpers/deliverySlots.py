@@ -0,0 +1,223 @@
+"""
+Delivery slot capacity.
+
+The delivery window (OPEN_HOUR-CLOSE_HOUR) is cut into SLOT_MINUTES
+buckets, each taking at most its capacity in orders (SLOT_CAPACITY unless
+set with setSlotCapacity). Buckets are rows of `delivery_slots`, keyed and
+ordered by their start time, so availability over a time range is one
+index range scan; buckets without a row are still empty. Each order holds
+one row in `slot_reservations`.
+
+reserveSlot(s) / releaseSlot run in one BEGIN IMMEDIATE transaction each, so
+concurrent sessions (and processes) can never oversell a bucket. They block
+while another connection writes: async code (the tools) calls them through
+asyncio.to_thread, since the session service's own write transaction may be
+waiting on the event loop to commit.
+"""
+from datetime import datetime, timedelta
+from . import database
+
+__all__ = [
+    "SLOT_MINUTES", "SLOT_CAPACITY", "slotStart", "setSlotCapacity",
+    "reserveSlot", "reserveSlots", "releaseSlot", "reservedSlot", "nextAvailableSlots",
+]
+
+SLOT_MINUTES = 30
+SLOT_CAPACITY = 4
+OPEN_HOUR = 10
+CLOSE_HOUR = 21
+LEAD_HOURS = 4
+# How far ahead nextAvailableSlots looks
+HORIZON_DAYS = 14
+
+TIME_FORMAT = "%d.%m.%Y %H:%M"
+# Sortable key of a bucket
+_KEY_FORMAT = "%Y-%m-%d %H:%M"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS delivery_slots (
+    slot_start VARCHAR(16) PRIMARY KEY,
+    capacity INTEGER NOT NULL,
+    reserved INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS slot_reservations (
+    order_id VARCHAR(64) PRIMARY KEY,
+    slot_start VARCHAR(16) NOT NULL,
+    units INTEGER NOT NULL,
+    created_at VARCHAR(32) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_slot_reservations_slot ON slot_reservations (slot_start);
+"""
+
+_ready = set()
+
+
+def _conn():
+    conn = database.connect()
+    if database.DB_PATH not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(database.DB_PATH)
+    return conn
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on this thread's connection."""
+
+    def __enter__(self):
+        self.conn = _conn()
+        self.conn.isolation_level = None
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.isolation_level = ""
+        return False
+
+
+def slotStart(when) -> datetime:
+    """Start of the bucket `when` ("dd.mm.YYYY HH:MM" or datetime) falls in."""
+    if isinstance(when, str):
+        when = datetime.strptime(when, TIME_FORMAT)
+    return when.replace(minute=when.minute - when.minute % SLOT_MINUTES, second=0, microsecond=0)
+
+
+def _key(start: datetime) -> str:
+    return start.strftime(_KEY_FORMAT)
+
+
+def setSlotCapacity(when, capacity: int):
+    """Change one bucket's capacity (e.g. fewer couriers on a holiday)."""
+    key = _key(slotStart(when))
+    with _Transaction() as conn:
+        conn.execute(
+            "INSERT INTO delivery_slots (slot_start, capacity, reserved) VALUES (?, ?, 0) "
+            "ON CONFLICT(slot_start) DO UPDATE SET capacity = excluded.capacity",
+            (key, capacity),
+        )
+
+
+def _reserve(conn, order_id: str, delivery_time, units: int) -> bool:
+    key = _key(slotStart(delivery_time))
+    if conn.execute("SELECT 1 FROM slot_reservations WHERE order_id = ?", (order_id,)).fetchone():
+        return True
+
+    conn.execute(
+        "INSERT OR IGNORE INTO delivery_slots (slot_start, capacity, reserved) VALUES (?, ?, 0)",
+        (key, SLOT_CAPACITY),
+    )
+    taken = conn.execute(
+        "UPDATE delivery_slots SET reserved = reserved + ? "
+        "WHERE slot_start = ? AND reserved + ? <= capacity",
+        (units, key, units),
+    ).rowcount
+    if not taken:
+        return False
+
+    conn.execute(
+        "INSERT INTO slot_reservations (order_id, slot_start, units, created_at) VALUES (?, ?, ?, ?)",
+        (order_id, key, units, datetime.now().isoformat()),
+    )
+    return True
+
+
+def reserveSlot(order_id: str, delivery_time, units: int = 1) -> bool:
+    """
+    Take `units` of capacity in the bucket of `delivery_time` for an order.
+
+    Reserving the same order again is a no-op that returns True.
+
+    Returns:
+        bool: False if the bucket is full
+    """
+    with _Transaction() as conn:
+        return _reserve(conn, order_id, delivery_time, units)
+
+
+def reserveSlots(requests: list) -> list:
+    """
+    reserveSlot for many orders in one transaction.
+
+    Args:
+        requests: [(order_id, delivery_time, units)]
+
+    Returns:
+        list: one bool per request, in order
+    """
+    with _Transaction() as conn:
+        return [_reserve(conn, order_id, delivery_time, units) for order_id, delivery_time, units in requests]
+
+
+def releaseSlot(order_id: str) -> bool:
+    """Give an order's capacity back. Returns False if it held none."""
+    with _Transaction() as conn:
+        row = conn.execute(
+            "SELECT slot_start, units FROM slot_reservations WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        conn.execute("DELETE FROM slot_reservations WHERE order_id = ?", (order_id,))
+        conn.execute(
+            "UPDATE delivery_slots SET reserved = MAX(reserved - ?, 0) WHERE slot_start = ?",
+            (row[1], row[0]),
+        )
+    return True
+
+
+def reservedSlot(order_id: str):
+    """Bucket start ("dd.mm.YYYY HH:MM") the order holds, or None."""
+    row = _conn().execute(
+        "SELECT slot_start FROM slot_reservations WHERE order_id = ?", (order_id,)
+    ).fetchone()
+    return datetime.strptime(row[0], _KEY_FORMAT).strftime(TIME_FORMAT) if row else None
+
+
+def _buckets(start: datetime, end: datetime):
+    # Bucket starts inside the opening hours, from `start` (rounded up) to `end`
+    current = slotStart(start)
+    if current < start:
+        current += timedelta(minutes=SLOT_MINUTES)
+    while current < end:
+        if current.hour < OPEN_HOUR:
+            current = current.replace(hour=OPEN_HOUR, minute=0)
+            continue
+        if current.hour >= CLOSE_HOUR:
+            current = (current + timedelta(days=1)).replace(hour=OPEN_HOUR, minute=0)
+            continue
+        yield current
+        current += timedelta(minutes=SLOT_MINUTES)
+
+
+def nextAvailableSlots(count: int = 3, after=None, units: int = 1, now: datetime = None) -> list:
+    """
+    The first `count` buckets with room for `units`, at or after `after`
+    and at least LEAD_HOURS from now.
+
+    Returns:
+        list: [{"slot": "dd.mm.YYYY HH:MM", "available": int}]
+    """
+    now = now or datetime.now()
+    earliest = now + timedelta(hours=LEAD_HOURS)
+    if after is not None:
+        after = datetime.strptime(after, TIME_FORMAT) if isinstance(after, str) else after
+        earliest = max(earliest, after)
+    end = earliest + timedelta(days=HORIZON_DAYS)
+
+    # One range scan over the buckets that have reservations or overrides
+    rows = _conn().execute(
+        "SELECT slot_start, capacity - reserved FROM delivery_slots "
+        "WHERE slot_start >= ? AND slot_start < ?",
+        (_key(slotStart(earliest)), _key(end)),
+    ).fetchall()
+    free = dict(rows)
+
+    slots = []
+    for start in _buckets(earliest, end):
+        available = free.get(_key(start), SLOT_CAPACITY)
+        if available >= units:
+            slots.append({"slot": start.strftime(TIME_FORMAT), "available": available})
+            if len(slots) == count:
+                break
+    return slots
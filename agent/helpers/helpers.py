@@ -1,19 +1,133 @@
-from datetime import datetime
-import dateparser
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from .tracing import span
 
 
-# Parse the time
-def timeConvert(time_str: str,
-               format: str = "%d.%m.%Y %H:%M"):
+# Fast path for the delivery phrases customers usually send, e.g.
+# "3pm tomorrow", "tomorrow at 15:30", "10:00 25.12", "15h30", "in 5 hours".
+# dateparser is only used when none of these match.
+_TIME = r"(?P<hour>\d{1,2})(?:(?P<sep>[:h])(?P<minute>\d{2})?)?\s*(?P<ampm>am|pm)?"
+_DATE = r"(?P<day>\d{1,2})[./-](?P<month>\d{1,2})(?:[./-](?P<year>\d{2,4}))?"
+_DAY_WORD = r"(?P<dayword>today|tonight|tomorrow|tmr|tmrw|day after tomorrow)"
+
+_DAY_OFFSETS = {"today": 0, "tonight": 0, "tomorrow": 1, "tmr": 1, "tmrw": 1, "day after tomorrow": 2}
+
+_FAST_PATTERNS = [
+    re.compile(rf"^{_TIME}$"),
+    re.compile(rf"^{_TIME} {_DAY_WORD}$"),
+    re.compile(rf"^{_DAY_WORD} {_TIME}$"),
+    re.compile(rf"^{_TIME} {_DATE}$"),
+    re.compile(rf"^{_DATE} {_TIME}$"),
+]
+_DELTA_PATTERN = re.compile(r"^in (?P<amount>\d+) (?P<unit>hours?|hrs?|h|minutes?|mins?)$")
+
+
+def _normalizePhrase(time_str: str) -> str:
+    phrase = time_str.strip().lower().replace(",", " ")
+    phrase = re.sub(r"\b(at|on|by|around)\b", " ", phrase)
+    return re.sub(r"\s+", " ", phrase).strip()
+
+
+@lru_cache(maxsize=1024)
+def _fastPlan(phrase: str):
+    """
+    Compile a phrase into a plan that doesn't depend on the current time.
+
+    Returns:
+        ("delta", minutes), ("day", offset, hour, minute),
+        ("date", day, month, year, hour, minute) or None if not recognised
+    """
+    match = _DELTA_PATTERN.match(phrase)
+    if match:
+        amount = int(match["amount"])
+        return ("delta", amount * 60 if match["unit"].startswith("h") else amount)
+
+    for pattern in _FAST_PATTERNS:
+        match = pattern.match(phrase)
+        if not match:
+            continue
+
+        parts = match.groupdict()
+        # A bare number like "15" is too ambiguous to guess
+        if parts["sep"] is None and parts["ampm"] is None:
+            return None
+
+        hour, minute = int(parts["hour"]), int(parts["minute"] or 0)
+        if parts["ampm"]:
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if parts["ampm"] == "pm" else 0)
+        if hour > 23 or minute > 59:
+            return None
+
+        if parts.get("day"):
+            year = parts["year"]
+            if year:
+                year = int(year) + (2000 if len(year) == 2 else 0)
+            return ("date", int(parts["day"]), int(parts["month"]), year, hour, minute)
+
+        return ("day", _DAY_OFFSETS.get(parts.get("dayword"), 0), hour, minute)
+
+    return None
+
+
+def _applyPlan(plan, now: datetime) -> datetime:
+    kind = plan[0]
+    if kind == "delta":
+        return now.replace(second=0, microsecond=0) + timedelta(minutes=plan[1])
+    if kind == "day":
+        _, offset, hour, minute = plan
+        day = now + timedelta(days=offset)
+        return day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    _, day, month, year, hour, minute = plan
+    return datetime(year or now.year, month, day, hour, minute)
+
+
+@lru_cache(maxsize=1024)
+def _slowParse(phrase: str, reference: datetime):
+    # dateparser loads a lot of locale data, so import it on first use only
+    import dateparser
+    with span("dateparser"):
+        return dateparser.parse(phrase, settings={"RELATIVE_BASE": reference})
+
+
+def parseDeliveryTime(time_str: str,
+                      now: datetime = None,
+                      format: str = "%d.%m.%Y %H:%M") -> datetime:
+    """
+    Parse a delivery phrase into a datetime.
+
+    Tries the exact format, then the compiled fast patterns (memoized per
+    phrase), and only then dateparser (memoized per phrase and minute).
+    """
     try:
-        date_parsed = datetime.strptime(time_str, format)
-        return date_parsed
+        return datetime.strptime(time_str, format)
     except Exception:
-        date_parsed = dateparser.parse(time_str)
-        if not date_parsed:
-            raise ValueError(f"Invalid time format: {time_str}")
-    
-    return date_parsed.strftime(format)
+        pass
+
+    now = now or datetime.now()
+    phrase = _normalizePhrase(time_str)
+
+    plan = _fastPlan(phrase)
+    if plan is not None:
+        try:
+            return _applyPlan(plan, now)
+        except ValueError:
+            # e.g. "10:00 31.02", let dateparser have a go
+            pass
+
+    date_parsed = _slowParse(phrase, now.replace(second=0, microsecond=0))
+    if not date_parsed:
+        raise ValueError(f"Invalid time format: {time_str}")
+    return date_parsed
+
+
+# Parse the time
+def timeConvert(time_str: str,
+               format: str = "%d.%m.%Y %H:%M",
+               now: datetime = None) -> str:
+    return parseDeliveryTime(time_str, now, format).strftime(format)
     
 def timeParse(time_str: str, format: str = "%d.%m.%Y %H:%M") -> datetime:
     return datetime.strptime(time_str, format)
@@ -46,7 +160,7 @@ def checkRefund(purchased_time: str,
                 delivery_time: str):
     try:
         # deli_time = datetime.strptime(order["delivery_time"], "%d.%m.%Y %H:%M")
-        deli_time = timeConvert(delivery_time)
+        deli_time = parseDeliveryTime(delivery_time)
     except Exception:
         return {"status": "error", 
                 "message": "Delivery time format invalid."}
@@ -0,0 +1,219 @@
+import asyncio
+import contextvars
+import json
+from datetime import datetime
+from . import database
+from .tracing import span
+
+HISTORY_TABLE = "interaction_history"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name VARCHAR(128) NOT NULL,
+    user_id VARCHAR(128) NOT NULL,
+    session_id VARCHAR(128) NOT NULL,
+    action VARCHAR(64) NOT NULL,
+    entry TEXT NOT NULL,
+    timestamp VARCHAR(32) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_{HISTORY_TABLE}_session
+    ON {HISTORY_TABLE} (app_name, user_id, session_id, seq);
+"""
+
+_INSERT = (f"INSERT INTO {HISTORY_TABLE} "
+           "(app_name, user_id, session_id, action, entry, timestamp) "
+           "VALUES (?, ?, ?, ?, ?, ?)")
+
+_ready = set()
+
+_current_batch = contextvars.ContextVar("history_batch", default=None)
+
+
+def _conn():
+    conn = database.connect()
+    if database.DB_PATH not in _ready:
+        conn.executescript(_SCHEMA)
+        _ready.add(database.DB_PATH)
+    return conn
+
+
+class HistoryBatch:
+    """
+    Turn-scoped unit of work for the interaction history.
+
+    While a batch is open every appendInteraction is buffered, and all rows
+    are written in one transaction when the outermost batch exits. Nested
+    batches join the outer one. If the block raises, or rollback() is
+    called, the buffered rows are dropped. rollback(savepoint()) only drops
+    the rows added after the savepoint, and the batch stays open.
+
+    Example:
+        with HistoryBatch() as turn:
+            appendInteraction(app_name, user_id, session_id, entry)
+            ...
+
+    In async code use `async with HistoryBatch()`: the commit then runs in a
+    worker thread, so the event loop keeps serving other sessions (and the
+    session service's own transactions) while SQLite waits for its lock.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.rolled_back = False
+        self._outer = None
+        self._token = None
+
+    def __enter__(self):
+        self._outer = _current_batch.get()
+        if self._outer is not None:
+            return self._outer
+        self._token = _current_batch.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._outer is not None:
+            if exc_type is not None:
+                self._outer.rollback()
+            return False
+
+        _current_batch.reset(self._token)
+        if exc_type is not None:
+            self.rollback()
+        self.commit()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._outer is not None or exc_type is not None:
+            return self.__exit__(exc_type, exc, tb)
+
+        _current_batch.reset(self._token)
+        rows, self.rows = self.rows, []
+        if rows:
+            await asyncio.to_thread(_insertRows, rows)
+        return False
+
+    def add(self, row: tuple):
+        if not self.rolled_back:
+            self.rows.append(row)
+
+    def savepoint(self) -> int:
+        return len(self.rows)
+
+    def rollback(self, savepoint: int = None):
+        if savepoint is not None:
+            del self.rows[savepoint:]
+            return
+        self.rows.clear()
+        self.rolled_back = True
+
+    def commit(self):
+        if self.rows:
+            _insertRows(self.rows)
+            self.rows = []
+
+
+def _insertRows(rows: list):
+    with span("history.write", rows=len(rows)):
+        conn = _conn()
+        with conn:
+            conn.executemany(_INSERT, rows)
+
+
+def sessionIds(tool_context) -> tuple:
+    """(app_name, user_id, session_id) of the session a tool runs in."""
+    session = tool_context._invocation_context.session
+    return session.app_name, session.user_id, session.id
+
+
+def appendInteraction(app_name: str,
+                      user_id: str,
+                      session_id: str,
+                      entry: dict) -> int:
+    """
+    Append one entry to the session's interaction history.
+
+    Only the new row is inserted, the rest of the history is never read.
+    Inside a HistoryBatch the row is buffered until the batch commits.
+
+    Returns:
+        int: sequence number of the new entry (None while buffered)
+    """
+    if "timestamp" not in entry:
+        entry["timestamp"] = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+
+    row = (app_name, user_id, session_id, entry.get("action", ""),
+           json.dumps(entry, ensure_ascii=False), entry["timestamp"])
+
+    batch = _current_batch.get()
+    if batch is not None:
+        batch.add(row)
+        return None
+
+    with span("history.write", rows=1):
+        conn = _conn()
+        with conn:
+            cursor = conn.execute(_INSERT, row)
+    return cursor.lastrowid
+
+
+def logInteraction(tool_context, entry: dict) -> int:
+    """appendInteraction for the session the tool is running in."""
+    return appendInteraction(*sessionIds(tool_context), entry)
+
+
+def readInteractions(app_name: str,
+                     user_id: str,
+                     session_id: str,
+                     limit: int = 20,
+                     before: int = None) -> dict:
+    """
+    Read one page of interaction history, newest page first.
+
+    Args:
+        limit: page size
+        before: the "next_before" cursor of the previous page
+
+    Returns:
+        dict: "entries" in chronological order and "next_before" cursor
+              (None when there is nothing older)
+    """
+    query = (f"SELECT seq, entry FROM {HISTORY_TABLE} "
+             "WHERE app_name = ? AND user_id = ? AND session_id = ?")
+    params = [app_name, user_id, session_id]
+    if before is not None:
+        query += " AND seq < ?"
+        params.append(before)
+    query += " ORDER BY seq DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = _conn().execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "entries": [json.loads(entry) for _, entry in reversed(rows)],
+        "next_before": rows[-1][0] if has_more else None,
+    }
+
+
+def countInteractions(app_name: str, user_id: str, session_id: str) -> int:
+    row = _conn().execute(
+        f"SELECT COUNT(*) FROM {HISTORY_TABLE} "
+        "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+        (app_name, user_id, session_id),
+    ).fetchone()
+    return row[0]
+
+
+def clearInteractions(app_name: str, user_id: str, session_id: str):
+    conn = _conn()
+    with conn:
+        conn.execute(
+            f"DELETE FROM {HISTORY_TABLE} "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            (app_name, user_id, session_id),
+        )
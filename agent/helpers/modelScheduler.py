@@ -0,0 +1,321 @@
+"""
+Process-wide scheduler for model calls.
+
+One turn can fan out to several gemini calls (orchestrator, then a
+sub-agent, then the sub-agent again after its tool), and every session of
+the process does this at once. All agents' models go through one
+ModelScheduler (see agent/scheduledModel.py), which
+
+- keeps requests and tokens per minute under the API quota with two token
+  buckets (bursts up to one minute's worth, then the refill rate),
+- caps the calls in flight,
+- serves the waiting calls by lane: "interactive" turns before "batch"
+  jobs, first come first served inside a lane,
+- after a 429 holds every call back for the backoff, so the whole process
+  slows down instead of each call retrying on its own.
+
+    with modelLane("batch"):
+        await run_turn(...)     # model calls queue behind customer turns
+
+Queue depth, waits, retries and rate limits are exported by
+schedulerMetricsText() (GET /metrics of server.py).
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from .tracing import span
+
+__all__ = [
+    "LANES", "ModelBusyError", "ModelScheduler", "getModelScheduler", "configureModelScheduler",
+    "modelLane", "currentLane", "isRetryable", "retryAfter", "schedulerStats", "schedulerMetricsText",
+]
+
+# Lane -> priority, lower is served first
+LANES = {"interactive": 0, "batch": 1}
+DEFAULT_LANE = "interactive"
+
+# Quota of the paid gemini-2.0-flash tier, with some headroom
+REQUESTS_PER_MINUTE = 1000
+TOKENS_PER_MINUTE = 1_000_000
+MAX_CONCURRENT = 16
+MAX_RETRIES = 4
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+
+# HTTP codes worth another try: rate limited, overloaded, unavailable
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+_lane = contextvars.ContextVar("model_lane", default=DEFAULT_LANE)
+
+
+class ModelBusyError(Exception):
+    """Raised when a model call is still rate limited or failing after every retry."""
+
+
+@contextmanager
+def modelLane(lane: str):
+    """Run the model calls made inside the block in `lane`."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane {lane!r}, expected one of {sorted(LANES)}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def currentLane() -> str:
+    return _lane.get()
+
+
+def isRetryable(error: Exception) -> bool:
+    """True for rate limits and transient server errors of the model API."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RETRYABLE_CODES:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retryAfter(error: Exception):
+    """Seconds from the Retry-After header of a failed call, if it sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float) -> float:
+        # A call bigger than the bucket waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "lane", "granted", "cancelled")
+
+    def __init__(self, future, tokens: int, lane: str):
+        self.future = future
+        self.tokens = tokens
+        self.lane = lane
+        self.granted = False
+        self.cancelled = False
+
+
+class ModelScheduler:
+    """
+    Admission control for model calls.
+
+    Args:
+        requests_per_minute: request quota (None or 0: unlimited)
+        tokens_per_minute: prompt + output token quota (None or 0: unlimited)
+        max_concurrent: calls in flight at once (None or 0: unlimited)
+        max_retries: retries of a rate limited or failed call
+        base_delay, max_delay: bounds (seconds) of the jittered exponential backoff
+    """
+
+    def __init__(self,
+                 requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE,
+                 max_concurrent: int = MAX_CONCURRENT,
+                 max_retries: int = MAX_RETRIES,
+                 base_delay: float = BASE_DELAY,
+                 max_delay: float = MAX_DELAY):
+        self.requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrent = max_concurrent or None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._timer = None
+        self.stats = {
+            "queued": {lane: 0 for lane in LANES},
+            "calls": {lane: 0 for lane in LANES},
+            "wait_seconds": {lane: 0.0 for lane in LANES},
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+        }
+
+    async def acquire(self, tokens: int = 0, lane: str = None) -> int:
+        """Wait for a slot for one call of about `tokens` tokens. Pair with release()."""
+        lane = lane or currentLane()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, lane)
+        started = time.monotonic()
+        with self._lock:
+            heapq.heappush(self._waiting, (LANES[lane], next(self._seq), waiter))
+            self.stats["queued"][lane] += 1
+        self._dispatch()
+
+        with span("model.queue", lane=lane):
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter.granted:
+                        self.in_flight -= 1
+                    else:
+                        waiter.cancelled = True
+                        self.stats["queued"][lane] -= 1
+                self._dispatch()
+                raise
+
+        with self._lock:
+            self.stats["calls"][lane] += 1
+            self.stats["wait_seconds"][lane] += time.monotonic() - started
+        return tokens
+
+    def release(self, tokens: int = 0, used_tokens: int = None):
+        """End a call; `used_tokens` (from the usage metadata) corrects the estimate."""
+        with self._lock:
+            self.in_flight -= 1
+            if self.tokens is not None and used_tokens is not None:
+                # Underestimates are paid back by the next calls
+                self.tokens.level = max(-self.tokens.capacity, self.tokens.level - (used_tokens - tokens))
+        self._dispatch()
+
+    def backoff(self, attempt: int, error: Exception = None) -> float:
+        """Jittered exponential delay before retry `attempt` (0-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        server_delay = retryAfter(error) if error is not None else None
+        return max(delay, server_delay or 0.0)
+
+    def throttle(self, seconds: float):
+        """Hold every waiting call back for `seconds` (after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.stats["rate_limited"] += 1
+
+    def queueDepth(self) -> dict:
+        with self._lock:
+            return dict(self.stats["queued"])
+
+    def _dispatch(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._waiting:
+                _, _, waiter = self._waiting[0]
+                if waiter.cancelled:
+                    heapq.heappop(self._waiting)
+                    continue
+                if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                    # release() dispatches again
+                    return
+
+                for bucket in (self.requests, self.tokens):
+                    if bucket is not None:
+                        bucket.refill(now)
+                delay = max(
+                    self._paused_until - now,
+                    self.requests.wait(1) if self.requests else 0.0,
+                    self.tokens.wait(waiter.tokens) if self.tokens else 0.0,
+                )
+                if delay > 0:
+                    self._arm(waiter.future.get_loop(), delay)
+                    return
+
+                heapq.heappop(self._waiting)
+                if self.requests:
+                    self.requests.level -= 1
+                if self.tokens:
+                    self.tokens.level -= waiter.tokens
+                self.in_flight += 1
+                self.stats["queued"][waiter.lane] -= 1
+                waiter.granted = True
+                if not waiter.future.done():
+                    waiter.future.set_result(None)
+
+    def _arm(self, loop, delay: float):
+        # One timer wakes the queue up when the head call may go
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, self._dispatch)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def getModelScheduler() -> ModelScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ModelScheduler()
+    return _scheduler
+
+
+def configureModelScheduler(**settings) -> ModelScheduler:
+    """Replace the shared scheduler, see ModelScheduler for the settings."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = ModelScheduler(**settings)
+    return _scheduler
+
+
+def schedulerStats() -> dict:
+    scheduler = getModelScheduler()
+    with scheduler._lock:
+        return {
+            "in_flight": scheduler.in_flight,
+            "queued": dict(scheduler.stats["queued"]),
+            "calls": dict(scheduler.stats["calls"]),
+            "wait_seconds": dict(scheduler.stats["wait_seconds"]),
+            "retries": scheduler.stats["retries"],
+            "rate_limited": scheduler.stats["rate_limited"],
+            "failures": scheduler.stats["failures"],
+            "requests_available": scheduler.requests.level if scheduler.requests else None,
+            "tokens_available": scheduler.tokens.level if scheduler.tokens else None,
+        }
+
+
+def schedulerMetricsText() -> str:
+    """Scheduler gauges and counters in the Prometheus text format."""
+    stats = schedulerStats()
+    lines = [
+        "# HELP model_queue_depth Model calls waiting for the scheduler, per lane.",
+        "# TYPE model_queue_depth gauge",
+        *(f'model_queue_depth{{lane="{lane}"}} {depth}' for lane, depth in stats["queued"].items()),
+        "# TYPE model_in_flight gauge",
+        f"model_in_flight {stats['in_flight']}",
+        "# HELP model_calls_total Model calls admitted by the scheduler, per lane.",
+        "# TYPE model_calls_total counter",
+        *(f'model_calls_total{{lane="{lane}"}} {count}' for lane, count in stats["calls"].items()),
+        "# TYPE model_queue_wait_seconds_total counter",
+        *(f'model_queue_wait_seconds_total{{lane="{lane}"}} {seconds:.6f}'
+          for lane, seconds in stats["wait_seconds"].items()),
+        "# TYPE model_retries_total counter",
+        f"model_retries_total {stats['retries']}",
+        "# TYPE model_rate_limited_total counter",
+        f"model_rate_limited_total {stats['rate_limited']}",
+        "# HELP model_failures_total Model calls that failed after every retry.",
+        "# TYPE model_failures_total counter",
+        f"model_failures_total {stats['failures']}",
+    ]
+    for name in ("requests_available", "tokens_available"):
+        if stats[name] is not None:
+            lines += [f"# TYPE model_{name} gauge", f"model_{name} {stats[name]:.1f}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,285 @@
+"""
+Normalized, indexed copy of every customer's orders.
+
+The orders themselves live in session state (`order:<order_id>` keys, see
+OrderStore), which can only be searched by decoding every session row.
+This module keeps `orders` / `order_items` tables in the same SQLite file
+in step with them: every persisted state delta touching an order key is
+applied here (indexOrders, called by the session-service wrapper in
+order_sync.py), so lookups by order id, delivery slot, phone or customer
+are index seeks.
+
+Cancelled orders stay in the table with status "cancelled". The tables
+are filled from the existing sessions the first time they are created, and
+can be rebuilt from them at any time:
+
+    python -m agent.helpers.orderIndex --rebuild
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+from . import database
+from .deliverySlots import SLOT_MINUTES, slotStart
+from .orderStore import LEGACY_ORDERS_KEY, ORDER_KEY_PREFIX
+from .tracing import span
+
+__all__ = [
+    "indexOrders", "dropSessionOrders", "rebuildOrderIndex",
+    "findOrder", "slotOrders", "findOrders",
+]
+
+TIME_FORMAT = "%d.%m.%Y %H:%M"
+# Sortable form of delivery times
+_KEY_FORMAT = "%Y-%m-%d %H:%M"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id VARCHAR(64) PRIMARY KEY,
+    app_name VARCHAR(128) NOT NULL,
+    user_id VARCHAR(128) NOT NULL,
+    session_id VARCHAR(128) NOT NULL,
+    customer_name TEXT,
+    phone VARCHAR(32),
+    address TEXT,
+    delivery_at VARCHAR(16),
+    delivery_time VARCHAR(32),
+    purchased_time VARCHAR(32),
+    subtotal REAL,
+    shipping_fee REAL,
+    total REAL,
+    status VARCHAR(16) NOT NULL,
+    updated_at VARCHAR(32) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id VARCHAR(64) NOT NULL,
+    line INTEGER NOT NULL,
+    sku VARCHAR(64),
+    name TEXT,
+    quantity INTEGER,
+    price REAL,
+    PRIMARY KEY (order_id, line)
+);
+CREATE INDEX IF NOT EXISTS ix_orders_delivery_at ON orders (delivery_at);
+CREATE INDEX IF NOT EXISTS ix_orders_phone ON orders (phone);
+CREATE INDEX IF NOT EXISTS ix_orders_customer_name ON orders (customer_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_orders_session ON orders (app_name, user_id, session_id);
+"""
+
+_UPSERT = (
+    "INSERT INTO orders (order_id, app_name, user_id, session_id, customer_name, phone, address, "
+    "delivery_at, delivery_time, purchased_time, subtotal, shipping_fee, total, status, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'placed', ?) "
+    "ON CONFLICT(order_id) DO UPDATE SET app_name = excluded.app_name, user_id = excluded.user_id, "
+    "session_id = excluded.session_id, customer_name = excluded.customer_name, phone = excluded.phone, "
+    "address = excluded.address, delivery_at = excluded.delivery_at, delivery_time = excluded.delivery_time, "
+    "purchased_time = excluded.purchased_time, subtotal = excluded.subtotal, "
+    "shipping_fee = excluded.shipping_fee, total = excluded.total, status = 'placed', "
+    "updated_at = excluded.updated_at"
+)
+_ITEM = "INSERT INTO order_items (order_id, line, sku, name, quantity, price) VALUES (?, ?, ?, ?, ?, ?)"
+
+_ready = set()
+
+
+def _conn():
+    conn = database.connect()
+    if database.DB_PATH not in _ready:
+        created = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'orders'").fetchone()
+        conn.executescript(_SCHEMA)
+        # Tables from before orders carried their shipping fee
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(orders)")}
+        for column in ("shipping_fee", "total"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE orders ADD COLUMN {column} REAL")
+        _ready.add(database.DB_PATH)
+        # First use on an existing database: backfill once
+        if created and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sessions'").fetchone():
+            rebuildOrderIndex()
+    return conn
+
+
+def _deliveryKey(delivery_time):
+    try:
+        return datetime.strptime(delivery_time, TIME_FORMAT).strftime(_KEY_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write(conn, app_name: str, user_id: str, session_id: str, order: dict, now: str):
+    order_id = order["order_id"]
+    conn.execute(_UPSERT, (
+        order_id, app_name, user_id, session_id,
+        order.get("customer_name"), str(order.get("phone") or "") or None, order.get("address"),
+        _deliveryKey(order.get("delivery_time")), order.get("delivery_time"), order.get("purchased_time"),
+        order.get("temp_total_not_include_shipping_fee"), order.get("shipping_fee"), order.get("total"), now,
+    ))
+    conn.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+    conn.executemany(_ITEM, [
+        (order_id, line, product.get("sku"), product.get("name"), product.get("quantity"), product.get("price"))
+        for line, product in enumerate(order.get("products") or [])
+    ])
+
+
+def _changes(state: dict) -> list:
+    # (order_id, order or None) for every order key of a state (delta)
+    changes = [
+        (key[len(ORDER_KEY_PREFIX):], value)
+        for key, value in state.items() if key.startswith(ORDER_KEY_PREFIX)
+    ]
+    # Orders of sessions from before OrderStore
+    for order in state.get(LEGACY_ORDERS_KEY) or []:
+        if isinstance(order, dict) and order.get("order_id"):
+            changes.append((order["order_id"], order))
+    return changes
+
+
+def indexOrders(app_name: str, user_id: str, session_id: str, state_delta: dict) -> int:
+    """
+    Apply the order keys of a persisted state delta to the tables.
+
+    Returns:
+        int: orders written or cancelled
+    """
+    changes = _changes(state_delta or {})
+    if not changes:
+        return 0
+
+    now = datetime.now().isoformat()
+    with span("orders.index", rows=len(changes)):
+        conn = _conn()
+        with conn:
+            for order_id, order in changes:
+                if isinstance(order, dict):
+                    _write(conn, app_name, user_id, session_id, order, now)
+                else:
+                    # OrderStore.cancel clears the key
+                    conn.execute(
+                        "UPDATE orders SET status = 'cancelled', updated_at = ? "
+                        "WHERE order_id = ? AND app_name = ? AND user_id = ? AND session_id = ?",
+                        (now, order_id, app_name, user_id, session_id),
+                    )
+    return len(changes)
+
+
+def dropSessionOrders(app_name: str, user_id: str, session_id: str):
+    """Remove the orders of a deleted session."""
+    conn = _conn()
+    with conn:
+        conn.execute(
+            "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders "
+            "WHERE app_name = ? AND user_id = ? AND session_id = ?)",
+            (app_name, user_id, session_id),
+        )
+        conn.execute(
+            "DELETE FROM orders WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            (app_name, user_id, session_id),
+        )
+
+
+def rebuildOrderIndex() -> dict:
+    """
+    Refill the tables from the state of every session (one full scan).
+
+    Session state only keeps live orders, so cancelled ones are not restored.
+    """
+    conn = _conn()
+    report = {"sessions": 0, "orders": 0}
+    now = datetime.now().isoformat()
+    with conn:
+        conn.execute("DELETE FROM order_items")
+        conn.execute("DELETE FROM orders")
+        for app_name, user_id, session_id, state in conn.execute(
+            "SELECT app_name, user_id, id, state FROM sessions"
+        ):
+            report["sessions"] += 1
+            for order_id, order in _changes(json.loads(state or "{}")):
+                if isinstance(order, dict):
+                    _write(conn, app_name, user_id, session_id, order, now)
+                    report["orders"] += 1
+    return report
+
+
+def _withItems(conn, rows) -> list:
+    columns = ("order_id", "app_name", "user_id", "session_id", "customer_name", "phone", "address",
+               "delivery_time", "purchased_time", "subtotal", "shipping_fee", "total", "status", "updated_at")
+    orders = [dict(zip(columns, row)) for row in rows]
+    if not orders:
+        return orders
+
+    by_id = {order["order_id"]: order for order in orders}
+    for order in orders:
+        order["products"] = []
+    placeholders = ",".join("?" * len(by_id))
+    for order_id, sku, name, quantity, price in conn.execute(
+        f"SELECT order_id, sku, name, quantity, price FROM order_items "
+        f"WHERE order_id IN ({placeholders}) ORDER BY order_id, line",
+        list(by_id),
+    ):
+        by_id[order_id]["products"].append({"sku": sku, "name": name, "quantity": quantity, "price": price})
+    return orders
+
+
+_SELECT = (
+    "SELECT order_id, app_name, user_id, session_id, customer_name, phone, address, "
+    "delivery_time, purchased_time, subtotal, shipping_fee, total, status, updated_at FROM orders "
+)
+
+
+def findOrder(order_id: str):
+    """One order (with its products) by id, across all customers, or None."""
+    conn = _conn()
+    orders = _withItems(conn, conn.execute(_SELECT + "WHERE order_id = ?", (order_id,)).fetchall())
+    return orders[0] if orders else None
+
+
+def slotOrders(when, include_cancelled: bool = False) -> list:
+    """Every delivery in the slot `when` ("dd.mm.YYYY HH:MM") falls in, by delivery time."""
+    start = slotStart(when)
+    end = start + timedelta(minutes=SLOT_MINUTES)
+    return findOrders(start=start, end=end, include_cancelled=include_cancelled, limit=None)
+
+
+def findOrders(phone: str = None,
+               customer: str = None,
+               start=None,
+               end=None,
+               include_cancelled: bool = False,
+               limit: int = 100) -> list:
+    """
+    Orders matching every given filter, by delivery time.
+
+    Args:
+        phone: exact phone number
+        customer: customer name, case-insensitive
+        start, end: delivery time range [start, end), datetimes or "dd.mm.YYYY HH:MM"
+    """
+    clauses, params = [], []
+    if phone:
+        clauses.append("phone = ?")
+        params.append(str(phone))
+    if customer:
+        clauses.append("customer_name = ? COLLATE NOCASE")
+        params.append(customer)
+    for value, operator in ((start, ">="), (end, "<")):
+        if value is not None:
+            value = datetime.strptime(value, TIME_FORMAT) if isinstance(value, str) else value
+            clauses.append(f"delivery_at {operator} ?")
+            params.append(value.strftime(_KEY_FORMAT))
+    if not include_cancelled:
+        clauses.append("status = 'placed'")
+
+    query = _SELECT + ("WHERE " + " AND ".join(clauses) + " " if clauses else "") + "ORDER BY delivery_at"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    conn = _conn()
+    return _withItems(conn, conn.execute(query, params).fetchall())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the orders tables from the session states.")
+    parser.add_argument("--db", default=database.DB_PATH)
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    args = parser.parse_args()
+
+    database.setDatabasePath(args.db)
+    print(rebuildOrderIndex())
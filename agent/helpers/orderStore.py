@@ -0,0 +1,101 @@
+ORDER_KEY_PREFIX = "order:"
+ORDER_INDEX_KEY = "order_ids"
+LEGACY_ORDERS_KEY = "orders"
+
+
+def orderKey(order_id: str) -> str:
+    return f"{ORDER_KEY_PREFIX}{order_id}"
+
+
+class OrderStore:
+    """
+    Order repository on top of the session state.
+
+    Every order lives under its own state key (`order:<order_id>`), and
+    `order_ids` keeps the id -> purchased_time index in placing order.
+    So one order can be read, changed or cancelled without scanning or
+    rewriting every other order.
+
+    Args:
+        state: tool_context.state or session.state
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self._index = dict(state.get(ORDER_INDEX_KEY) or {})
+
+        # Sessions created before the store kept all orders in one list
+        legacy_orders = state.get(LEGACY_ORDERS_KEY)
+        if legacy_orders:
+            for order in legacy_orders:
+                self._put(order)
+            self.state[LEGACY_ORDERS_KEY] = []
+            self._saveIndex()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, order_id) -> bool:
+        return order_id in self._index
+
+    def _put(self, order: dict):
+        self.state[orderKey(order["order_id"])] = order
+        self._index[order["order_id"]] = order.get("purchased_time")
+
+    def _saveIndex(self):
+        # Assign a fresh copy so the state delta picks up the change
+        self.state[ORDER_INDEX_KEY] = dict(self._index)
+
+    def get(self, order_id: str):
+        if order_id not in self._index:
+            return None
+        return self.state.get(orderKey(order_id))
+
+    def latest(self):
+        if not self._index:
+            return None
+        return self.get(next(reversed(self._index)))
+
+    def resolve(self, order_id=None):
+        """Return the given order, or the latest one if no id is provided."""
+        return self.get(order_id) if order_id else self.latest()
+
+    def all(self) -> list:
+        return [self.get(order_id) for order_id in self._index]
+
+    def recent(self, limit: int) -> list:
+        """The last `limit` orders, oldest first, without reading the others."""
+        return [self.get(order_id) for order_id in list(self._index)[-limit:]]
+
+    def add(self, order: dict) -> dict:
+        self._put(order)
+        self._saveIndex()
+        return order
+
+    def addMany(self, orders: list) -> list:
+        """Add several orders with a single index write."""
+        for order in orders:
+            self._put(order)
+        if orders:
+            self._saveIndex()
+        return orders
+
+    def update(self, order_id: str, **changes):
+        order = self.get(order_id)
+        if order is None:
+            return None
+
+        updated_order = {**order, **changes}
+        self.state[orderKey(order_id)] = updated_order
+        return updated_order
+
+    def cancel(self, order_id: str):
+        order = self.get(order_id)
+        if order is None:
+            return None
+
+        # State deltas can't delete keys, so clear the slot instead
+        self.state[orderKey(order_id)] = None
+        del self._index[order_id]
+        self._saveIndex()
+        return order
@@ -0,0 +1,194 @@
+"""
+Shipping fees by district and ward.
+
+The fee table (agent/shipping.json) gives each district a fee, and some
+wards their own (the free wards around the store). An address is placed
+in a district and ward with a few patterns over its normalized text,
+numbered ("Q.8", "District 8") or named ("Binh Thanh"), so a quote never
+needs the model.
+
+shippingFee is the agents' tool for it, shared by the Sale and Policy
+agents. purchaseProduct, reorder and bulk ingestion quote the fee of every
+order, so its total always includes shipping.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+__all__ = [
+    "SHIPPING_PATH", "setShippingPath", "getShippingTable", "ShippingTable",
+    "normalizeAddress", "quoteShipping", "unquotableMessage", "shippingFee",
+]
+
+# District/ward fee table shipped with the agents, edit it to change the fees
+SHIPPING_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "shipping.json")
+
+# "District 8", "Dist. 8", "Quận 8", "Q.8", "D8"
+_DISTRICT = re.compile(r"\b(?:district|dist|quan|q|d)\s*(\d{1,2})\b")
+# "Ward 9", "Phường 9", "P.9", "W 9"; not "P9" or "W10", which are
+# usually apartment or block numbers
+_WARD = re.compile(r"\b(?:(?:ward|phuong)\s*|(?:p|w)\s+)(\d{1,2})\b")
+
+_table = None
+_lock = threading.Lock()
+
+
+def normalizeAddress(address: str) -> str:
+    """Lowercase ASCII words of an address: "22H Đường 3/2, P.9, Q.8" -> "22h duong 3 2 p 9 q 8"."""
+    text = unicodedata.normalize("NFD", str(address or "").lower().replace("đ", "d"))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+class ShippingTable:
+    """
+    Shipping fee per district and ward, loaded once into memory.
+
+    A ward entry overrides its district's fee (the free wards around the
+    store). Addresses are normalized and matched against the table with a
+    few patterns, no model or network call, and each normalized address's
+    quote is cached.
+
+    Args:
+        districts: {district: {"fee", "wards": {ward: fee}}}, numbered
+                   districts by number ("8"), the others by name ("binh thanh")
+        aliases: other names of a district, e.g. {"2": "thu duc"}
+        currency: symbol used in messages
+        max_entries: quotes kept in the LRU cache
+    """
+
+    def __init__(self, districts: dict, aliases: dict = None, currency: str = "$", max_entries: int = 4096):
+        self.currency = currency
+        self.aliases = dict(aliases or {})
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+
+        self._fees = {}     # (district, ward or None) -> fee
+        for district, entry in districts.items():
+            self._fees[(district, None)] = entry["fee"]
+            for ward, fee in entry.get("wards", {}).items():
+                self._fees[(district, ward)] = fee
+
+        # Longest names first, so "binh tan" doesn't hide "binh thanh"
+        names = sorted({name for name in [*districts, *self.aliases] if not name.isdigit()}, key=len, reverse=True)
+        self._names = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b") if names else None
+
+        self._quotes = OrderedDict()    # normalized address -> quote
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "ShippingTable":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["districts"], data.get("aliases"), data.get("currency", "$"))
+
+    def locate(self, address: str):
+        """(district, ward) of an address, either None when it can't be read."""
+        text = normalizeAddress(address)
+        matches = [(match.start(), match.group(1)) for match in _DISTRICT.finditer(text)]
+        if self._names:
+            matches += [(match.start(), match.group(1)) for match in self._names.finditer(text)]
+        if not matches:
+            return None, None
+
+        # Vietnamese addresses end with the district, street names come first
+        position, district = max(matches)
+        district = str(int(district)) if district.isdigit() else district
+        district = self.aliases.get(district, district)
+
+        # The ward comes right before its district ("..., P.9, Q.8"), or
+        # right after it when the address is written the other way round
+        wards = list(_WARD.finditer(text))
+        before = [ward for ward in wards if ward.start() < position]
+        after = [ward for ward in wards if ward.start() > position]
+        ward = before[-1] if before else (after[0] if after else None)
+        return district, str(int(ward.group(1))) if ward else None
+
+    def quote(self, address: str) -> dict:
+        """
+        Shipping fee to an address.
+
+        Returns:
+            dict: "district", "ward" and "fee" (None when the district is
+                  unknown or we don't deliver there)
+        """
+        key = normalizeAddress(address)
+        with self._cache_lock:
+            quote = self._quotes.get(key)
+            if quote is not None:
+                self._quotes.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(quote)
+            self.stats["misses"] += 1
+
+        district, ward = self.locate(address)
+        fee = self._fees.get((district, ward), self._fees.get((district, None)))
+        quote = {"district": district, "ward": ward, "fee": fee}
+
+        with self._cache_lock:
+            self._quotes[key] = quote
+            if len(self._quotes) > self.max_entries:
+                self._quotes.popitem(last=False)
+        return dict(quote)
+
+    def describe(self, fee) -> str:
+        return "free" if fee == 0 else f"{self.currency}{fee:g}"
+
+
+def setShippingPath(path: str):
+    """Use another fee table, loaded on the next getShippingTable()."""
+    global SHIPPING_PATH, _table
+    with _lock:
+        SHIPPING_PATH = path
+        _table = None
+
+
+def getShippingTable() -> ShippingTable:
+    global _table
+    if _table is None:
+        with _lock:
+            if _table is None:
+                _table = ShippingTable.load(SHIPPING_PATH)
+    return _table
+
+
+def quoteShipping(address: str) -> dict:
+    """getShippingTable().quote(address)"""
+    return getShippingTable().quote(address)
+
+
+def unquotableMessage(quote: dict, address: str) -> str:
+    """What to tell the customer when an address got no fee."""
+    if quote["district"] is None:
+        return f"Sorry, I can't tell which district '{address}' is in. Could you add the district (and ward)?"
+    return f"Sorry, we don't deliver to {quote['district'].title()} yet."
+
+
+def shippingFee(tool_context,
+                address: str,
+                subtotal: Optional[float] = None) -> dict:
+    """
+    Quote the shipping fee to an address, from our district/ward fee table.
+
+    Args:
+        tool_context (ToolContext): tool context
+        address (str): delivery address, with the district and ward
+        subtotal (float, optional): price of the products, to quote the full total
+
+    Returns:
+        dict: the shipping fee (and the total when a subtotal is given)
+    """
+    table = getShippingTable()
+    quote = table.quote(address)
+    if quote["fee"] is None:
+        return {"status": "error", "message": unquotableMessage(quote, address)}
+
+    result = {"status": "success", "shipping_fee": quote["fee"], "district": quote["district"], "ward": quote["ward"],
+              "message": f"Shipping to {address} is {table.describe(quote['fee'])}."}
+    if subtotal is not None:
+        result["total"] = float(subtotal) + quote["fee"]
+    return result
@@ -0,0 +1,166 @@
+"""
+Structured logs, written as JSON lines by a background thread.
+
+    log = getLogger("utils.events")
+    logRecord(log, DEBUG, "event", event_id=event.id, author=event.author)
+
+    # Fields that cost something to build: check the level first
+    if log.isEnabledFor(DEBUG):
+        logRecord(log, DEBUG, "tool_response", output=summarize(part))
+
+Every logger lives under LOG_ROOT. configureLogging() gives that tree one
+QueueHandler, so the thread that logs only checks the level, draws the
+sample for its module and puts the raw record on a queue. Building the
+JSON line and writing it to stderr (or the log file) happens on the
+QueueListener's thread. A disabled level costs the isEnabledFor check.
+
+Sampling keeps a fraction of the records of a module (and its children),
+e.g. {"utils.events": 0.05}. Warnings and errors are always kept.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime
+from logging import DEBUG, INFO, WARNING, ERROR
+from logging.handlers import QueueHandler, QueueListener
+
+__all__ = [
+    "DEBUG", "INFO", "WARNING", "ERROR",
+    "getLogger", "logRecord", "configureLogging", "parseSampling", "flushLogs",
+]
+
+LOG_ROOT = "cookies"
+
+_state = {"listener": None, "handler": None, "stream": None}
+
+
+def getLogger(name: str) -> logging.Logger:
+    """The logger of a module, e.g. getLogger("utils.events")."""
+    return logging.getLogger(f"{LOG_ROOT}.{name}")
+
+
+def logRecord(logger: logging.Logger, level: int, message: str, **fields):
+    """
+    Log `message` with structured `fields`.
+
+    The fields are serialized later on the writer thread, so pass values
+    that won't be changed in place afterwards (copies of mutable state).
+    """
+    if not logger.isEnabledFor(level):
+        return
+    # makeRecord + handle skips Logger.log's stack walk for the caller
+    logger.handle(logger.makeRecord(
+        logger.name, level, "", 0, message, None, None, extra={"fields": fields},
+    ))
+
+
+class _SampleFilter(logging.Filter):
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {f"{LOG_ROOT}.{name}": rate for name, rate in rates.items()}
+        self._cache = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            # The most specific configured module wins
+            rate, matched = 1.0, ""
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > len(matched):
+                    rate, matched = prefix_rate, prefix
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record) -> bool:
+        if record.levelno >= WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _RawQueueHandler(QueueHandler):
+    # QueueHandler.prepare formats the message on the caller's thread;
+    # the listener's formatter does it instead
+    def prepare(self, record):
+        return record
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name[len(LOG_ROOT) + 1:] if record.name.startswith(LOG_ROOT + ".") else record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parseSampling(text: str) -> dict:
+    """"utils.events=0.05,utils.state=1" -> {"utils.events": 0.05, "utils.state": 1.0}"""
+    rates = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def configureLogging(level="WARNING", path: str = None, sampling=None):
+    """
+    Send the LOG_ROOT loggers to a background JSON writer.
+
+    Args:
+        level: lowest level logged, a name ("DEBUG") or a logging level
+        path: append the JSON lines to this file instead of stderr
+        sampling: {module: fraction kept}, or the "module=fraction,..." form
+    """
+    _stop()
+    if isinstance(sampling, str):
+        sampling = parseSampling(sampling)
+
+    stream = open(path, "a", encoding="utf-8") if path else sys.stderr
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(_JsonFormatter())
+
+    records = queue.SimpleQueue()
+    handler = _RawQueueHandler(records)
+    if sampling:
+        handler.addFilter(_SampleFilter(sampling))
+    listener = QueueListener(records, writer)
+    listener.start()
+
+    root = logging.getLogger(LOG_ROOT)
+    root.setLevel(logging.getLevelName(level.upper()) if isinstance(level, str) else level)
+    root.addHandler(handler)
+    root.propagate = False
+    _state.update(listener=listener, handler=handler, stream=stream if path else None)
+
+
+def flushLogs():
+    """Write out every queued record now."""
+    listener = _state["listener"]
+    if listener is not None:
+        # stop() drains the queue; the listener can be started again
+        listener.stop()
+        listener.start()
+
+
+def _stop():
+    listener, handler, stream = _state["listener"], _state["handler"], _state["stream"]
+    if handler is not None:
+        logging.getLogger(LOG_ROOT).removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+    if stream is not None:
+        stream.close()
+    _state.update(listener=None, handler=None, stream=None)
+
+
+atexit.register(_stop)
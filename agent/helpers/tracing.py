@@ -0,0 +1,235 @@
+"""
+Lightweight spans for finding where a slow turn spent its time.
+
+    with span("history.write", rows=3):
+        ...
+
+    s = startSpan("model", agent="Order", trace_id=invocation_id)
+    ...
+    s.end(prompt_tokens=120)
+
+Finished spans feed per-(span, agent) latency histograms, exposed in the
+Prometheus text format by metricsText() (GET /metrics of server.py), and
+are appended to a JSONL file when one is configured. Tracing is off by
+default; then span() hands back a shared no-op context manager and
+startSpan() returns None, so instrumented code pays one flag check.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from .structuredLog import ERROR, getLogger, logRecord
+
+__all__ = [
+    "setTracing", "tracingEnabled", "span", "startSpan", "Span",
+    "addTokens", "metricsText", "spanStats", "flushTraces", "resetMetrics",
+]
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent samples kept per series for the quantiles
+RESERVOIR_SIZE = 2048
+# Spans buffered before they are written to the JSONL file
+FLUSH_EVERY = 200
+
+_log = getLogger("tracing")
+
+_config = {"enabled": False, "jsonl_path": None}
+_NOOP = nullcontext()
+
+_lock = threading.Lock()
+_series = {}        # (span name, agent) -> _Series
+_tokens = {}        # (agent, kind) -> count
+_buffer = []
+
+
+class _Series:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds: float, error: bool):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.errors += error
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def setTracing(enabled: bool = True, jsonl_path: str = None):
+    """Turn spans on or off, and optionally append every span to `jsonl_path`."""
+    if not enabled:
+        flushTraces()
+    _config.update(enabled=enabled, jsonl_path=jsonl_path)
+
+
+def tracingEnabled() -> bool:
+    return _config["enabled"]
+
+
+class Span:
+    """One timed operation. Call end() once, extra attributes are merged in."""
+
+    __slots__ = ("name", "attrs", "started_at", "_start")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def end(self, error: Exception = None, **attrs):
+        duration = time.perf_counter() - self._start
+        self.attrs.update(attrs)
+        _record(self, duration, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc)
+        return False
+
+
+def startSpan(name: str, **attrs):
+    """Start a span, or return None when tracing is off."""
+    if not _config["enabled"]:
+        return None
+    return Span(name, attrs)
+
+
+def span(name: str, **attrs):
+    """Context manager timing its block (a no-op when tracing is off)."""
+    if not _config["enabled"]:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def addTokens(agent: str, prompt: int = 0, output: int = 0, saved: int = 0):
+    """Count model tokens per agent; `saved` is prompt tokens trimmed by the context budget."""
+    if not _config["enabled"]:
+        return
+    with _lock:
+        for kind, count in (("prompt", prompt), ("output", output), ("saved", saved)):
+            if count:
+                _tokens[(agent, kind)] = _tokens.get((agent, kind), 0) + count
+
+
+def _record(finished: Span, duration: float, error):
+    key = (finished.name, finished.attrs.get("agent") or "")
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.observe(duration, error is not None)
+
+        if _config["jsonl_path"]:
+            record = {"name": finished.name, "start": finished.started_at,
+                      "duration_ms": round(duration * 1e3, 3), **finished.attrs}
+            if error is not None:
+                record["error"] = repr(error)
+            _buffer.append(record)
+            if len(_buffer) < FLUSH_EVERY:
+                return
+            lines, _buffer[:] = list(_buffer), []
+        else:
+            return
+    _write(lines)
+
+
+def _write(records: list):
+    path = _config["jsonl_path"]
+    if not path or not records:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    except OSError as e:
+        logRecord(_log, ERROR, "Error writing traces", path=path, error=str(e))
+
+
+def flushTraces():
+    """Write the buffered spans to the JSONL file now."""
+    with _lock:
+        lines, _buffer[:] = list(_buffer), []
+    _write(lines)
+
+
+def resetMetrics():
+    with _lock:
+        _series.clear()
+        _tokens.clear()
+
+
+def spanStats() -> dict:
+    """{(span, agent): {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}}"""
+    with _lock:
+        return {
+            key: {
+                "count": series.count,
+                "errors": series.errors,
+                "mean_ms": series.sum / series.count * 1e3 if series.count else 0.0,
+                **{f"p{round(q * 100)}_ms": series.quantile(q) * 1e3 for q in QUANTILES},
+            }
+            for key, series in _series.items()
+        }
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{str(value).replace(chr(34), "")}"' for name, value in labels.items())
+
+
+def metricsText() -> str:
+    """All span metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP agent_span_duration_seconds Duration of model calls, tool calls and storage operations.",
+        "# TYPE agent_span_duration_seconds histogram",
+    ]
+    quantile_lines = [
+        "# HELP agent_span_duration_quantile_seconds Recent p50/p95/p99 of agent_span_duration_seconds.",
+        "# TYPE agent_span_duration_quantile_seconds gauge",
+    ]
+    error_lines = [
+        "# HELP agent_span_errors_total Spans that ended with an error.",
+        "# TYPE agent_span_errors_total counter",
+    ]
+
+    with _lock:
+        for (name, agent), series in sorted(_series.items()):
+            labels = _labels(span=name, agent=agent)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series.buckets):
+                cumulative += count
+                lines.append(f'agent_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'agent_span_duration_seconds_bucket{{{labels},le="+Inf"}} {series.count}')
+            lines.append(f"agent_span_duration_seconds_sum{{{labels}}} {series.sum:.6f}")
+            lines.append(f"agent_span_duration_seconds_count{{{labels}}} {series.count}")
+            for q in QUANTILES:
+                quantile_lines.append(
+                    f'agent_span_duration_quantile_seconds{{{labels},quantile="{q}"}} {series.quantile(q):.6f}'
+                )
+            error_lines.append(f"agent_span_errors_total{{{labels}}} {series.errors}")
+
+        token_lines = [
+            "# HELP agent_model_tokens_total Tokens reported by the model, per agent.",
+            "# TYPE agent_model_tokens_total counter",
+        ] + [
+            f"agent_model_tokens_total{{{_labels(agent=agent, kind=kind)}}} {count}"
+            for (agent, kind), count in sorted(_tokens.items())
+        ]
+
+    return "\n".join(lines + quantile_lines + error_lines + token_lines) + "\n"
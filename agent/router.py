@@ -0,0 +1,130 @@
+import re
+from typing import Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+# Keyword / regex rules per sub-agent: (pattern, weight)
+ROUTE_RULES = {
+    "Order": [
+        (r"\b(track|tracking|status|where is)\b", 2.0),
+        (r"\b(cancel|cancell?ation)\b.*\border\b|\border\b.*\bcancel", 3.0),
+        (r"\bcancel\b", 2.0),
+        (r"\bre-?order\b|\border (it )?again\b|\bsame (order|as last)\b", 3.0),
+        (r"\b(purchase|order) history\b|\bmy (last|latest|previous) orders?\b", 3.0),
+        (r"\border(_| )?id\b|\bid\s*[:#]?\s*[0-9a-f]{4,8}\b", 2.0),
+        (r"\brefund\b.*\bmy\b|\bmy\b.*\brefund\b", 1.5),
+        (r"\bmy orders?\b", 1.0),
+    ],
+    "Seller": [
+        (r"\bmenu\b", 3.0),
+        (r"\b(price|prices|how much|cost)\b", 2.0),
+        (r"\b(matcha|chocolate|choco|flavou?rs?)\b", 1.5),
+        (r"\bbuy\b|\bplace an? order\b|\bi (want|would like|'d like) to order\b", 3.0),
+        (r"\b\d+\s*jars?\b", 2.5),
+        (r"\bwhat (cookies|do you (have|sell))\b", 2.5),
+        (r"\bname\s*:.*\bphone\s*:", 3.0),
+    ],
+    "Policy": [
+        (r"\bpolic(y|ies)\b|\bterms\b", 3.0),
+        (r"\bshipping fee\b|\bfree ship(ping)?\b|\bdelivery fee\b", 3.0),
+        (r"\b(ship|deliver)\w* (for )?free\b|\bship(ping)? cost\b", 3.0),
+        (r"\bhow (early|far in advance|many hours)\b|\bin advance\b", 2.0),
+        (r"\b(opening|delivery|shipping) (hours|time window)\b|\bwhat time do you (deliver|ship)\b", 2.5),
+        (r"\brefund\b", 1.0),
+        (r"\bcan i (get|have) (a )?refund\b.*\bif\b", 2.0),
+    ],
+}
+
+# A route is taken only when the winner is clear enough, else the
+# orchestrator LLM decides as before
+MIN_SCORE = 2.0
+MIN_CONFIDENCE = 0.7
+
+_compiled_rules = {
+    agent_name: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in rules]
+    for agent_name, rules in ROUTE_RULES.items()
+}
+
+# Hit-rate metric of the fast path
+ROUTER_STATS = {
+    "turns": 0,
+    "fast_path": 0,
+    "by_agent": {agent_name: 0 for agent_name in ROUTE_RULES},
+}
+
+
+def classifyIntent(query: str) -> tuple:
+    """
+    Score the query against ROUTE_RULES.
+
+    Returns:
+        tuple: (agent_name, confidence). agent_name is None when the
+               query is not confidently matched.
+    """
+    scores = {
+        agent_name: sum(weight for pattern, weight in rules if pattern.search(query))
+        for agent_name, rules in _compiled_rules.items()
+    }
+    best_agent = max(scores, key=scores.get)
+    best_score = scores[best_agent]
+    total = sum(scores.values())
+
+    if best_score < MIN_SCORE:
+        return None, 0.0
+
+    confidence = best_score / total
+    if confidence < MIN_CONFIDENCE:
+        return None, confidence
+    return best_agent, confidence
+
+
+def routerHitRate() -> float:
+    if not ROUTER_STATS["turns"]:
+        return 0.0
+    return ROUTER_STATS["fast_path"] / ROUTER_STATS["turns"]
+
+
+def _userText(callback_context: CallbackContext) -> str:
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if getattr(part, "text", None))
+
+
+def preRouteCallback(callback_context: CallbackContext,
+                     llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """
+    before_model_callback of the orchestrator.
+
+    Obvious requests are transferred straight to the sub-agent without
+    calling the orchestrator model. Returning None lets the LLM route.
+    """
+    # Only the first model call of a turn is routed (not tool follow-ups)
+    last_content = llm_request.contents[-1] if llm_request.contents else None
+    if not last_content or last_content.role != "user" or any(
+        part.function_response for part in (last_content.parts or [])
+    ):
+        return None
+
+    query = _userText(callback_context)
+    if not query:
+        return None
+
+    ROUTER_STATS["turns"] += 1
+    agent_name, confidence = classifyIntent(query)
+    if agent_name is None:
+        return None
+
+    ROUTER_STATS["fast_path"] += 1
+    ROUTER_STATS["by_agent"][agent_name] += 1
+
+    return LlmResponse(
+        content=types.Content(
+            role="model",
+            parts=[types.Part(function_call=types.FunctionCall(
+                name="transfer_to_agent",
+                args={"agent_name": agent_name},
+            ))],
+        )
+    )
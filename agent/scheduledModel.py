@@ -0,0 +1,78 @@
+"""
+Model wrapper routing every call through the shared ModelScheduler.
+
+    agent = Agent(model=scheduledModel("gemini-2.0-flash"), ...)
+
+A call waits for its lane's turn and for quota (its prompt size is
+estimated for the token bucket and corrected from the usage metadata),
+then goes to the wrapped model. A rate limited or transiently failing call
+is retried with jittered exponential backoff as long as nothing was
+yielded yet; after the last retry ModelBusyError is raised.
+"""
+import asyncio
+from typing import Any, AsyncGenerator
+
+from google.adk.models import BaseLlm, Gemini, LlmRequest, LlmResponse
+
+from .helpers import ModelBusyError, currentLane, estimateTokens, getModelScheduler, isRetryable
+
+# Output tokens assumed for the quota when the request sets no limit
+EXPECTED_OUTPUT_TOKENS = 256
+
+
+def _estimate(llm_request: LlmRequest) -> int:
+    config = llm_request.config
+    instruction = str(config.system_instruction or "") if config else ""
+    output = (config.max_output_tokens if config else None) or EXPECTED_OUTPUT_TOKENS
+    return estimateTokens(instruction) + estimateTokens(llm_request.contents or []) + output
+
+
+class ScheduledModel(BaseLlm):
+    """
+    `inner` (gemini, or any BaseLlm) behind the process-wide model scheduler.
+
+    `model` is the name of the wrapped model.
+    """
+
+    inner: Any
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        scheduler = getModelScheduler()
+        lane = currentLane()
+        estimate = _estimate(llm_request)
+
+        for attempt in range(scheduler.max_retries + 1):
+            await scheduler.acquire(estimate, lane)
+            used = None
+            yielded = False
+            try:
+                async for response in self.inner.generate_content_async(llm_request, stream=stream):
+                    usage = response.usage_metadata
+                    if usage and usage.total_token_count:
+                        used = usage.total_token_count
+                    yielded = True
+                    yield response
+                return
+            except Exception as e:
+                # Half a streamed answer can't be taken back
+                if yielded or not isRetryable(e):
+                    raise
+                delay = scheduler.backoff(attempt, e)
+                if getattr(e, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(e):
+                    scheduler.throttle(delay)
+                if attempt == scheduler.max_retries:
+                    scheduler.stats["failures"] += 1
+                    raise ModelBusyError(f"{self.model} still failing after {attempt + 1} attempts: {e}") from e
+                scheduler.stats["retries"] += 1
+            finally:
+                scheduler.release(estimate, used)
+            await asyncio.sleep(delay)
+
+    def connect(self, llm_request: LlmRequest):
+        return self.inner.connect(llm_request)
+
+
+def scheduledModel(model: str) -> ScheduledModel:
+    """Gemini `model` behind the shared scheduler."""
+    return ScheduledModel(model=model, inner=Gemini(model=model))
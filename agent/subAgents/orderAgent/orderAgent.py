@@ -3,8 +3,10 @@ from google.adk.tools.tool_context import ToolContext
 from google.adk.tools import function_tool
 from datetime import datetime
 from typing import Optional
-import dateparser
-from ...helpers import timeConvert, checkRefund, timeParse
+import asyncio
+from ...helpers import timeConvert, checkRefund, checkOrderValid, timeParse, OrderStore, logInteraction, budgetContext, getCatalog
+from ...helpers import reserveSlot, releaseSlot, nextAvailableSlots, getShippingTable
+from ...scheduledModel import scheduledModel
 
 import uuid
 
@@ -14,7 +16,7 @@ gemini_model = "gemini-2.0-flash"
 def trackingOrder(tool_context: ToolContext,
                   order_id: Optional[str] = None) -> dict:
     
-    orders = tool_context.state.get("orders", [])
+    orders = OrderStore(tool_context.state)
     
     # Check if the customers placed orders
     if not orders:
@@ -24,12 +26,10 @@ def trackingOrder(tool_context: ToolContext,
         }
     
     
-    # If order id is provided
-    if order_id: 
-        latest_order = next((o for o in orders if o["order_id"] == order_id), None)
-            
-    else:
-        latest_order = orders[-1]
+    # If order id is provided, otherwise take the latest one
+    latest_order = orders.resolve(order_id)
+    if not latest_order:
+        return {"status": "error", "message": "Sorry, we couldn’t find that order."}
     
     return {
         "status": "successful",
@@ -39,27 +39,27 @@ def trackingOrder(tool_context: ToolContext,
     
 
     
-def cancelOrder(tool_context: ToolContext, 
-                order_id: Optional[str] = None) -> dict:
+async def cancelOrder(tool_context: ToolContext, 
+                      order_id: Optional[str] = None) -> dict:
     
-    orders = tool_context.state.get("orders", [])
+    orders = OrderStore(tool_context.state)
     if not orders:
         return {"status": "error", "message": "No orders found."}
 
-    order = orders[-1] if not order_id else next((o for o in orders if o["order_id"] == order_id), None)
+    order = orders.resolve(order_id)
     if not order:
         return {"status": "error", "message": "Sorry, we couldn’t find that order."}
 
-    # remove order
-    tool_context.state["orders"] = [o for o in orders if o["order_id"] != order["order_id"]]
+    # remove order and free its delivery slot
+    orders.cancel(order["order_id"])
+    # In a thread: the session service may hold the SQLite write lock on the event loop
+    await asyncio.to_thread(releaseSlot, order["order_id"])
 
-    history = tool_context.state.get("interaction_history", [])
-    history.append({
+    logInteraction(tool_context, {
         "action": "cancel_order",
         "order_id": order["order_id"],
         "timestamp": datetime.now().strftime("%d.%m.%Y %H:%M")
     })
-    tool_context.state["interaction_history"] = history
 
     return {
         "status": "success", 
@@ -71,11 +71,11 @@ def refund(tool_context: ToolContext,
            order_id: Optional[str] = None) -> dict:
     
     # Check if the customer placed orders
-    orders = tool_context.state.get("orders", [])
+    orders = OrderStore(tool_context.state)
     if not orders:
         return {"status": "error", "message": "No orders found."}
 
-    order = orders[-1] if not order_id else next((o for o in orders if o["order_id"] == order_id), None)
+    order = orders.resolve(order_id)
     if not order:
         return {"status": "error", "message": "Sorry, we couldn’t find that order."}
     
@@ -85,7 +85,7 @@ def refund(tool_context: ToolContext,
         return {"status": "error", 
                 "message": "Delivery time format invalid."}
         
-    checkResult = checkRefund(deli_time)
+    checkResult = checkRefund(order["purchased_time"], order["delivery_time"])
     if not checkResult["status"]: 
         return {
             "status": "error",
@@ -108,58 +108,101 @@ def refund(tool_context: ToolContext,
     #         "message": f"Refund denied for order {order['order_id']}: cancellation too late."
     #     }
     
-def reorder(tool_context: ToolContext, delivery_time: str) -> dict:
+async def reorder(tool_context: ToolContext, delivery_time: str, address: Optional[str] = None) -> dict:
     """
     Assist customers reordering similar orders to their previous one
 
     Args:
         tool_context (ToolContext): purchase_history 
         delivery_time (str): the updated delivery time
+        address (str, optional): a new delivery address, the previous one by default
 
     Returns:
         The confimation message
     """
     # Check if the customers placed orders
-    order = tool_context.state.get("orders", [])
-    if not order:
+    orders = OrderStore(tool_context.state)
+    if not orders:
         return "You haven't placed any order yet. You could check our menu to choose what you would love to first 🤩."
         
-    latest_order = order[-1]
+    latest_order = orders.latest()
     
     # Generate the similar order
     new_order = latest_order.copy()
     new_order["order_id"] = str(uuid.uuid4())[:8]
     new_order["purchased_time"] = datetime.now().strftime("%d.%m.%Y %H:%M")
+
+    # Charge today's catalog prices, never the ones stored with the old order
+    priced = getCatalog().price(latest_order.get("products", []))
+    if priced["unknown"] or priced["invalid"] or not priced["products"]:
+        missing = [*priced["unknown"], *priced["invalid"]]
+        return {
+            "status": "error",
+            "message": f"Sorry, I can't reorder {', '.join(map(str, missing)) or 'your last order'} as it was. "
+                       "Here is our menu, what would you like this time?\n" + getCatalog().menu(),
+        }
+    new_order["products"] = priced["products"]
+    new_order["temp_total_not_include_shipping_fee"] = priced["total"]
     
     if delivery_time:
         # dt = dateparser.parse(delivery_time)
-        dt = timeConvert(delivery_time)
+        try:
+            dt = timeConvert(delivery_time)
+        except ValueError:
+            return {
+                "status": "error",
+                "message": f"Sorry, I can't read the delivery time '{delivery_time}'. Could you send it like 20.10.2026 15:00?",
+            }
         if dt:
             new_order["delivery_time"] = dt
+
+    # Same rules as a new order: opening hours and enough notice, checked
+    # before a delivery slot is booked
+    check_result = checkOrderValid(new_order["purchased_time"], new_order["delivery_time"])
+    if not check_result["valid"]:
+        return {"status": "error", "message": check_result["message"]}
+
+    # Today's shipping fee to the (new) address
+    if address:
+        new_order["address"] = address
+    shipping = getShippingTable().quote(new_order.get("address"))
+    if shipping["fee"] is None:
+        return {
+            "status": "error",
+            "message": f"Sorry, I can't work out the shipping fee to '{new_order.get('address')}'. "
+                       "Could you send the delivery address with its district and ward?",
+        }
+    new_order["shipping_fee"] = shipping["fee"]
+    new_order["total"] = new_order.get("temp_total_not_include_shipping_fee", 0) + shipping["fee"]
                                                           
-    order.append(new_order)             
-    
-    # Keep other orders
-    tool_context.state["orders"] = order
+    if not await asyncio.to_thread(reserveSlot, new_order["order_id"], new_order["delivery_time"]):
+        slots = await asyncio.to_thread(nextAvailableSlots, 3, after=new_order["delivery_time"])
+        return {
+            "status": "error",
+            "message": f"Sorry, we are fully booked at {new_order['delivery_time']}. The next free delivery times are: "
+                       + ", ".join(slot["slot"] for slot in slots),
+        }
+
+    # Only the new order is written, other orders stay untouched
+    orders.add(new_order)
     
-    history = tool_context.state.get("interaction_history", [])
-    history.append({
+    logInteraction(tool_context, {
         "action": "reorder",
         "order_id": new_order["order_id"],
         "timestamp": new_order["purchased_time"]
     })
-    tool_context.state["interaction_history"] = history
     
     return {
         "status": "successful",
-        "message": f"We have successfully reordered your new order similar to {latest_order['order_id']} with the new order {new_order['order_id']}."
+        "message": f"We have successfully reordered your new order similar to {latest_order['order_id']} with the new order {new_order['order_id']}. "
+                   f"Shipping is {getShippingTable().describe(new_order['shipping_fee'])}, the total is {getCatalog().currency}{new_order['total']:g}."
     }
 
 
 # Define Agent
 orderAgent = Agent(
     name = "Order",
-    model = gemini_model,
+    model = scheduledModel(gemini_model),
     description = "Tracking purchase history to answer any questions related to or assist customers to reorder.",
     instruction = """
     You are a manager of innhi cookies's purchase history, who can answer any questions related to.
@@ -186,6 +229,7 @@ orderAgent = Agent(
     - Purchased at: 11.09.2025
     Your order is successfully placed. Please wait for us to custom and send these butter cookies to you sooner 🍪🌠."
     """,
-    tools = [trackingOrder, reorder, cancelOrder, refund]
+    tools = [trackingOrder, reorder, cancelOrder, refund],
+    before_model_callback = budgetContext,
 )
 
@@ -1,10 +1,92 @@
+from collections import OrderedDict
+from typing import Optional
 from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+from ...helpers import AnswerCache, instructionVersion, budgetContext, getShippingTable, shippingFee, OrderStore
+from ...scheduledModel import scheduledModel
 
 gemini_model = "gemini-2.0-flash"
 
+# Policy answers only depend on the instruction below, so repeated
+# questions are answered from this cache instead of the model
+policyCache = AnswerCache(ttl = 24 * 3600, max_entries = 512, threshold = 0.8)
+
+# invocation_id -> question that missed the cache, waiting for the answer.
+# LRU, so a turn that never got its answer only ages out
+_pendingQuestions = OrderedDict()
+MAX_PENDING_QUESTIONS = 1000
+
+
+def _text(content) -> str:
+    return " ".join(part.text for part in content.parts or [] if getattr(part, "text", None))
+
+
+def _hasCustomerContext(callback_context: CallbackContext, llm_request: LlmRequest) -> bool:
+    # Orders or an address earlier in the conversation: "is shipping free
+    # for me?" then depends on this customer, not only on the policies
+    if len(OrderStore(callback_context.state)):
+        return True
+    table = getShippingTable()
+    return any(
+        content.role == "user" and content.parts and table.locate(_text(content))[0] is not None
+        for content in llm_request.contents[:-1]
+    )
+
+
+def cachedPolicyAnswer(callback_context: CallbackContext,
+                       llm_request: LlmRequest) -> Optional[LlmResponse]:
+    # Only the direct answer to the customer's message is cached
+    last_content = llm_request.contents[-1] if llm_request.contents else None
+    content = callback_context.user_content
+    if not last_content or last_content.role != "user" or not content or not content.parts:
+        return None
+
+    question = _text(content)
+    if not question:
+        return None
+    # Fee quotes depend on the address in the question, not only on the policies
+    if getShippingTable().locate(question)[0] is not None:
+        return None
+    if _hasCustomerContext(callback_context, llm_request):
+        return None
+
+    answer = policyCache.get(question, instructionVersion(policyAgent.instruction))
+    if answer is None:
+        _pendingQuestions[callback_context.invocation_id] = question
+        _pendingQuestions.move_to_end(callback_context.invocation_id)
+        if len(_pendingQuestions) > MAX_PENDING_QUESTIONS:
+            _pendingQuestions.popitem(last = False)
+        return None
+
+    return LlmResponse(
+        content = types.Content(role = "model", parts = [types.Part(text = answer)])
+    )
+
+
+def savePolicyAnswer(callback_context: CallbackContext,
+                     llm_response: LlmResponse) -> Optional[LlmResponse]:
+    if llm_response.partial:
+        return None
+
+    question = _pendingQuestions.pop(callback_context.invocation_id, None)
+    if not question or not llm_response.content or not llm_response.content.parts:
+        return None
+
+    # Answers that call a tool or transfer are not plain FAQ answers
+    parts = llm_response.content.parts
+    if any(part.function_call for part in parts):
+        return None
+
+    answer = "".join(part.text for part in parts if part.text).strip()
+    policyCache.put(question, answer, instructionVersion(policyAgent.instruction))
+    return None
+
+
 policyAgent = Agent(
     name = "Policy",
-    model = gemini_model,
+    model = scheduledModel(gemini_model),
     description = "Policy agent assists users to understand the store's policies and terms.",
     instruction = """
     You are a helpful assistant who can answer users everything about policies of innhi cookie.
@@ -16,7 +98,7 @@ policyAgent = Agent(
     
     2. Shipping fee:
     - Free shipping if the customer lives in District 8, Ward 8–10.
-    - Other locations: fee depends on system calculation and distance.
+    - Other locations: fee depends on the district (and ward). When customers ask the fee to an address -> Use the shippingFee tool, and ask for the district if it is missing.
     - Delivery time: shipping is available from 10 AM until 9 PM daily.
     
     3. Refund policy:
@@ -28,5 +110,8 @@ policyAgent = Agent(
     - Remember the policies accurately and answer them concisely, problem-oriented.
     - ONLY answer the question regarding to policies.
     """,
+    tools = [shippingFee],
+    before_model_callback = [cachedPolicyAnswer, budgetContext],
+    after_model_callback = savePolicyAnswer,
     
-)
\ No newline at end of file
+)
@@ -1,17 +1,59 @@
 from google.adk.agents import Agent, SequentialAgent
 from google.adk.tools import ToolContext, function_tool
 from datetime import datetime
+from typing import Optional
+import asyncio
 import uuid
-import dateparser
-from ...helpers import checkOrderValid, timeConvert
+from ...helpers import checkOrderValid, timeConvert, OrderStore, logInteraction, budgetContext, getCatalog
+from ...helpers import getShippingTable, shippingFee, unquotableMessage
+from ...helpers import reserveSlot, nextAvailableSlots, parseBulkOrders, ingestOrders, sessionIds
+from ...scheduledModel import scheduledModel
 
 gemini_model = "gemini-2.0-flash"
 
+
+def getMenu(tool_context: ToolContext,
+            query: Optional[str] = None) -> dict:
+    """
+    Show the menu with prices.
+
+    Args:
+        tool_context (ToolContext): tool context
+        query (str, optional): product name or category to narrow the menu down
+
+    Returns:
+        dict: the menu text
+    """
+    menu = getCatalog().menu(query)
+    if not menu:
+        return {"status": "error", "message": "Sorry, we don't have that product.", "menu": getCatalog().menu()}
+    return {"status": "success", "menu": menu}
+
+
+async def availableSlots(tool_context: ToolContext,
+                   after: Optional[str] = None,
+                   count: int = 3) -> dict:
+    """
+    Find the next delivery times that still have room.
+
+    Args:
+        tool_context (ToolContext): tool context
+        after (str, optional): earliest delivery time the customer wants
+        count (int): how many delivery times to suggest
+
+    Returns:
+        dict: the available delivery slots
+    """
+    slots = await asyncio.to_thread(nextAvailableSlots, count, after=timeConvert(after) if after else None)
+    if not slots:
+        return {"status": "error", "message": "Sorry, we are fully booked for the next two weeks."}
+    return {"status": "success", "slots": slots}
+
     
 # Save the valid order information 
-def purchaseProduct(tool_context: ToolContext,
+async def purchaseProduct(tool_context: ToolContext,
                     customer: str,
-                    products: list[dict],   # [{ "name": str, "quantity": int, "price": int }]
+                    products: list[dict],   # [{ "name": str, "quantity": int }]
                     delivery_time: str,
                     phone: str,
                     address: str) -> dict:
@@ -21,7 +63,7 @@ def purchaseProduct(tool_context: ToolContext,
     Args:
         tool_context (ToolContext): maintains state across calls
         customer (str): customer name
-        products (list): list of product dictionaries with name, quantity, price
+        products (list): list of product dictionaries with name and quantity
         delivery_time (str): expected delivery time
         phone (str): customer phone number
         address (str): delivery address
@@ -39,7 +81,38 @@ def purchaseProduct(tool_context: ToolContext,
         return check_result
 
 
-    total = sum(item["price"] * item["quantity"] for item in products)
+    # Prices come from the catalog, never from the model
+    priced = getCatalog().price(products)
+    if priced["invalid"]:
+        return {
+            "status": "error",
+            "message": f"How many {', '.join(map(str, priced['invalid']))} would you like? "
+                       "The quantity has to be a whole number of at least 1.",
+        }
+    if priced["unknown"] or not priced["products"]:
+        return {
+            "status": "error",
+            "message": f"Sorry, we don't have {', '.join(map(str, priced['unknown'])) or 'that'} on our menu. "
+                       "Which of these did you mean?\n"
+                       + getCatalog().menu(),
+        }
+    products = priced["products"]
+    total = priced["total"]
+
+    # Shipping comes from the fee table, so the order carries its full total
+    shipping = getShippingTable().quote(address)
+    if shipping["fee"] is None:
+        return {"status": "error", "message": unquotableMessage(shipping, address)}
+
+    # Hold kitchen and courier capacity in the delivery slot. In a thread:
+    # the session service may hold the SQLite write lock on the event loop
+    if not await asyncio.to_thread(reserveSlot, order_id, deli_time):
+        slots = await asyncio.to_thread(nextAvailableSlots, 3, after=deli_time)
+        return {
+            "status": "error",
+            "message": f"Sorry, we are fully booked at {deli_time}. The next free delivery times are: "
+                       + ", ".join(slot["slot"] for slot in slots),
+        }
 
     ordered_info = {
         "order_id": order_id,
@@ -49,49 +122,70 @@ def purchaseProduct(tool_context: ToolContext,
         "address": address,
         "phone": phone,
         "temp_total_not_include_shipping_fee": total,
+        "shipping_fee": shipping["fee"],
+        "total": total + shipping["fee"],
         "purchased_time": ordered_time
     } 
     
-    orders = tool_context.state.get("orders", [])
-    orders.append(ordered_info)
+    OrderStore(tool_context.state).add(ordered_info)
     
-    tool_context.state["orders"] = orders
     
-    
-    # Get current history
-    current_interaction_history = tool_context.state.get("interaction_history", [])
-     # Create new interaction history with purchase added
-    new_interaction_history = current_interaction_history.copy()
-    new_interaction_history.append(
+    # Append the purchase to the interaction history log
+    logInteraction(
+        tool_context,
         {"action": "purchase_product", "order_id": order_id, "timestamp": ordered_time}
     )
 
-    # Update interaction history in state via assignment
-    tool_context.state["interaction_history"] = new_interaction_history
-
     return {
         "status": "success",
-        "message": "Successfully sent the information to our system.",
+        "message": f"Successfully sent the information to our system. "
+                   f"Shipping is {getShippingTable().describe(shipping['fee'])}, the total is {getCatalog().currency}{total + shipping['fee']:g}.",
         "information": ordered_info
     }
 
 
+# Many orders at once (companies, events), checked and saved in one go
+async def bulkPurchase(tool_context: ToolContext,
+                       orders: Optional[list[dict]] = None,
+                       csv_text: Optional[str] = None) -> dict:
+    """
+    Save a batch of orders, e.g. a company ordering for every office.
+
+    Args:
+        tool_context (ToolContext): maintains state across calls
+        orders (list, optional): orders in the purchaseProduct format
+            ({"customer", "products", "delivery_time", "phone", "address"})
+        csv_text (str, optional): the orders as CSV text with the columns
+            order_ref, customer, product, quantity, delivery_time, phone, address
+
+    Returns:
+        dict: how many orders were saved, and the result of every order
+    """
+    try:
+        parsed = parseBulkOrders(orders if orders is not None else csv_text or "")
+    except (ValueError, AttributeError) as e:
+        return {"status": "error", "message": f"Sorry, I couldn't read the order list: {e}"}
+    if not parsed:
+        return {"status": "error", "message": "The order list is empty."}
+
+    return await ingestOrders(tool_context.state, parsed, *sessionIds(tool_context), source="tool")
+
+
 
 saleAgent = Agent(
     name="Seller",
-    model=gemini_model,
+    model=scheduledModel(gemini_model),
     description="You are a seller of innhi cookies, introduce the menu and save their orders.",
     instruction="""
     You are a professional seller, who introduces the menu for customers and create their orders from their message.
     
-    Menu:
-    - Cookies Matcha: $5 per jar (15 cookies)
-    - Cookies Chocolate: $5 per jar (15 cookies)
-    
     Your task:
-    1. Introduce the menu and prices when they ask.
+    1. Introduce the menu and prices when they ask -> Use the getMenu tool (pass a product name or category to show only part of it).
+    - If they ask how much shipping costs to their address -> Use the shippingFee tool. The address needs the district (and ward).
     2. Guide customers to send the neccessary information: name, the products they want to buy and how many of them, delivery time, address and phone.
-    3. If checkOrderValid returns True, then call the purchaseProduct
+    3. If checkOrderValid returns True, then call the purchaseProduct, and tell them the shipping fee and the total it returns.
+    4. If a delivery time is fully booked, or the customer asks when we can deliver -> Use the availableSlots tool.
+    5. If the customer sends many orders at once (a list or CSV, e.g. for a company) -> Use the bulkPurchase tool and tell them which orders failed and why.
     Example user text:
     "Name: Yen Nhi, I want 2 jars of chocolate cookies and 1 jar of matcha cookies. 
     Address: 22H D8 W9, Phone: 0908353308, Delivery: 3pm tomorrow"
@@ -99,8 +193,8 @@ saleAgent = Agent(
        {
          "customer": "customer name",
          "products": [
-            {"name": "Cookies Chocolate", "quantity": 2, "price": 5},
-            {"name": "Cookies Matcha", "quantity": 1, "price": 5}
+            {"name": "Cookies Chocolate", "quantity": 2},
+            {"name": "Cookies Matcha", "quantity": 1}
          ],
          "delivery_time": "3pm tomorrow",
          "address": "22H D8 W9",
@@ -111,5 +205,6 @@ saleAgent = Agent(
     IMPORTANT:
     If they don't provide any information (i.e., name, phone, adress) or delivery time, you MUST ask them to provide politely.
     """,
-    tools=[purchaseProduct],
+    tools=[getMenu, availableSlots, shippingFee, purchaseProduct, bulkPurchase],
+    before_model_callback=budgetContext,
 )
@@ -0,0 +1,264 @@
+"""
+Offline end-to-end benchmark of the agents on ScriptedModel.
+
+Runs the benchmark conversation (benchmarks/stub_model.py) through run_turn /
+call_agent_async for 1, 10 and 100 concurrent sessions on a fresh SQLite
+database, and reports turn latency, tool latency, time spent in the session
+database and throughput as JSON. No network access is needed. The
+benchmark's model calls run in the scheduler's "batch" lane, so it never
+goes before customer turns of a process it shares the scheduler with.
+
+    python -m benchmarks.bench_agents --levels 1 10 100 --out bench_agents.json
+
+With --check it exits with status 1 when any turn failed, e.g. a tool
+hitting "database is locked" while concurrent sessions write:
+
+    python -m benchmarks.bench_agents --levels 10 --check
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+
+from google.adk.sessions import BaseSessionService
+
+from agent.helpers import setDatabasePath, dbPathFromUrl, deliverySlots, configureModelScheduler, schedulerStats, modelLane
+from benchmarks.stub_model import CONVERSATION, useStubModels
+
+APP_NAME = "Customer_Service_Agent"
+
+
+def summarize(samples: list) -> dict:
+    """count, mean and p50/p95/p99 of a list of seconds, in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1e3
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1e3,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1e3,
+    }
+
+
+class TimedSessionService(BaseSessionService):
+    """Forwards to another session service and records how long each call took."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.samples = {}
+
+    async def _timed(self, name, call):
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - started)
+
+    async def create_session(self, **kwargs):
+        return await self._timed("create_session", self.inner.create_session(**kwargs))
+
+    async def get_session(self, **kwargs):
+        return await self._timed("get_session", self.inner.get_session(**kwargs))
+
+    async def list_sessions(self, **kwargs):
+        return await self._timed("list_sessions", self.inner.list_sessions(**kwargs))
+
+    async def delete_session(self, **kwargs):
+        return await self._timed("delete_session", self.inner.delete_session(**kwargs))
+
+    async def append_event(self, session, event):
+        return await self._timed("append_event", self.inner.append_event(session, event))
+
+    async def close(self):
+        close = getattr(self.inner, "close", None)
+        if close:
+            await close()
+
+
+class ToolTimer:
+    """before/after_tool_callback pair recording each tool call's latency."""
+
+    def __init__(self):
+        self.samples = {}
+        self._started = {}
+
+    def before(self, tool, args, tool_context):
+        self._started[tool_context.function_call_id] = time.perf_counter()
+        return None
+
+    def after(self, tool, args, tool_context, tool_response):
+        started = self._started.pop(tool_context.function_call_id, None)
+        if started is not None:
+            self.samples.setdefault(tool.name, []).append(time.perf_counter() - started)
+        return None
+
+
+async def runLevel(runner, sessions: int, turns: int, timed: TimedSessionService, tools: ToolTimer) -> dict:
+    """Run `sessions` conversations at the same time, `turns` messages each."""
+    from main import get_or_create_session
+    from utils import run_turn
+
+    timed.samples.clear()
+    tools.samples.clear()
+    conversation = CONVERSATION[:turns]
+
+    users = [f"bench-{sessions}-{i}" for i in range(sessions)]
+    session_ids = [
+        (await get_or_create_session(runner.session_service, APP_NAME, user_id))[0]
+        for user_id in users
+    ]
+
+    latencies = []
+    first_tokens = []
+    tokens_saved = []
+    failures = 0
+
+    async def converse(user_id, session_id):
+        nonlocal failures
+        with modelLane("batch"):
+            for query in conversation:
+                timings = {}
+                response = await run_turn(runner, user_id, session_id, query, timings=timings)
+                if response is None:
+                    failures += 1
+                latencies.append(timings["total"])
+                if timings.get("first_token") is not None:
+                    first_tokens.append(timings["first_token"])
+                tokens_saved.append(timings.get("prompt_tokens_saved", 0))
+
+    # The agents print every event, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        await asyncio.gather(*(converse(u, s) for u, s in zip(users, session_ids)))
+        # Events the session cache holds back are part of the work
+        flush = getattr(runner.session_service, "flush", None)
+        if flush:
+            await flush()
+        elapsed = time.perf_counter() - started
+
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "failed_turns": failures,
+        "wall_s": elapsed,
+        "turns_per_s": len(latencies) / elapsed,
+        "turn_latency": summarize(latencies),
+        "first_token": summarize(first_tokens),
+        "prompt_tokens_saved": sum(tokens_saved),
+        "tools": {name: summarize(samples) for name, samples in sorted(tools.samples.items())},
+        "session_db": {name: summarize(samples) for name, samples in sorted(timed.samples.items())},
+        "session_db_total_s": sum(sum(samples) for samples in timed.samples.values()),
+    }
+
+
+async def runBenchmark(db_url: str, levels: list, turns: int, latency: float,
+                       model_rpm: int = 0, model_concurrency: int = 0) -> dict:
+    from google.adk import __version__ as adk_version
+    from agent import root_agent
+    from agent.router import ROUTER_STATS
+    from main import build_runner, make_session_service
+
+    setDatabasePath(dbPathFromUrl(db_url))
+    models = useStubModels(latency)
+    # Every benchmark customer orders for the same delivery time
+    deliverySlots.SLOT_CAPACITY = 10 ** 6
+    # No quota by default, the stub model has none
+    configureModelScheduler(requests_per_minute=model_rpm, tokens_per_minute=None,
+                            max_concurrent=model_concurrency)
+
+    tools = ToolTimer()
+    for llm_agent in root_agent.sub_agents:
+        llm_agent.before_tool_callback = tools.before
+        llm_agent.after_tool_callback = tools.after
+
+    # Time the database itself, under the session cache when there is one
+    session_service = make_session_service(db_url)
+    if hasattr(session_service, "inner"):
+        timed = session_service.inner = TimedSessionService(session_service.inner)
+    else:
+        timed = session_service = TimedSessionService(session_service)
+    runner = build_runner(APP_NAME, session_service)
+
+    results = {
+        "meta": {
+            "adk_version": adk_version,
+            "python": platform.python_version(),
+            "db_url": db_url,
+            "session_cache": hasattr(session_service, "inner"),
+            "model_latency_s": latency,
+            "turns_per_session": turns,
+            "model_rpm": model_rpm or None,
+            "model_concurrency": model_concurrency or None,
+        },
+        "levels": {},
+    }
+    try:
+        # Builds the agents and warms imports and caches, not reported
+        await runLevel(runner, 1, turns, timed, tools)
+        for sessions in levels:
+            results["levels"][str(sessions)] = await runLevel(runner, sessions, turns, timed, tools)
+    finally:
+        await session_service.close()
+
+    results["model_calls"] = {name: model.calls for name, model in models.items()}
+    results["model_scheduler"] = schedulerStats()
+    results["router"] = dict(ROUTER_STATS, by_agent=dict(ROUTER_STATS["by_agent"]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 100],
+                        help="numbers of concurrent sessions")
+    parser.add_argument("--turns", type=int, default=len(CONVERSATION),
+                        help="messages per session (max %(default)s)")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0,
+                        help="simulated latency of every model call")
+    parser.add_argument("--model-rpm", type=int, default=0,
+                        help="model requests per minute allowed by the scheduler (0: unlimited)")
+    parser.add_argument("--model-concurrency", type=int, default=0,
+                        help="model calls in flight at once (0: unlimited)")
+    parser.add_argument("--db-url", default=None,
+                        help="session database (default: a new SQLite file in a temp dir)")
+    parser.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if any turn failed")
+    args = parser.parse_args()
+
+    workdir = None
+    db_url = args.db_url
+    if db_url is None:
+        workdir = tempfile.mkdtemp(prefix="bench_agents_")
+        db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    results = asyncio.run(runBenchmark(db_url, args.levels, args.turns, args.model_latency_ms / 1e3,
+                                      args.model_rpm, args.model_concurrency))
+
+    report = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+        for sessions, level in results["levels"].items():
+            print(f"{sessions:>4} sessions: {level['turns_per_s']:8.1f} turns/s, "
+                  f"p50 {level['turn_latency']['p50_ms']:.1f} ms, p99 {level['turn_latency']['p99_ms']:.1f} ms")
+    else:
+        print(report)
+
+    failed = sum(level["failed_turns"] for level in results["levels"].values())
+    if args.check and failed:
+        raise SystemExit(f"{failed} turns failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Orders table benchmark: indexed lookups vs scanning the session states.
+
+Builds a synthetic database of `--orders` orders (1M by default) spread
+over sessions, kept both in session state (as OrderStore writes them) and
+in the orders tables (through indexOrders, as the session service does),
+then times the admin queries on the tables and the same lookups done by
+decoding every session row.
+
+    python -m benchmarks.bench_orders --orders 1000000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from agent.helpers import database, deliverySlots, orderKey, indexOrders, findOrder, slotOrders, findOrders
+from benchmarks.bench_agents import summarize
+from benchmarks.bench_storage import APP_NAME, _SCHEMA
+
+_NAMES = ["Yen Nhi", "Bao Tran", "Minh Anh", "Thu Ha", "Gia Huy", "Khanh Linh", "Quoc Bao", "Ngoc Mai"]
+_PRODUCTS = [("CK-CHOCO", "Cookies Chocolate"), ("CK-MATCHA", "Cookies Matcha")]
+
+
+def _order(rng, order_id: str, start: datetime) -> dict:
+    delivery = start + timedelta(days=rng.randrange(365), hours=rng.randrange(10, 21),
+                                 minutes=rng.choice([0, 15, 30, 45]))
+    products = [
+        {"sku": sku, "name": name, "quantity": rng.randint(1, 4), "price": 5}
+        for sku, name in rng.sample(_PRODUCTS, rng.randint(1, 2))
+    ]
+    return {
+        "order_id": order_id,
+        "customer_name": f"{rng.choice(_NAMES)} {rng.randrange(100000)}",
+        "products": products,
+        "delivery_time": delivery.strftime("%d.%m.%Y %H:%M"),
+        "address": f"{rng.randrange(1, 300)} D{rng.randrange(1, 13)}",
+        "phone": f"09{rng.randrange(10**8):08d}",
+        "temp_total_not_include_shipping_fee": sum(p["quantity"] * p["price"] for p in products),
+        "purchased_time": (delivery - timedelta(hours=6)).strftime("%d.%m.%Y %H:%M"),
+    }
+
+
+def build(path: str, n_orders: int, per_session: int, seed: int = 11) -> list:
+    """Write the sessions and the orders tables; returns the orders."""
+    rng = random.Random(seed)
+    database.setDatabasePath(path)
+    conn = database.connect()
+    conn.executescript(_SCHEMA)
+
+    start = datetime(2026, 1, 1)
+    orders = []
+    now = datetime.now().isoformat()
+    for first in range(0, n_orders, per_session):
+        session_id = f"s{first // per_session}"
+        session_orders = [_order(rng, f"{i:08x}", start) for i in range(first, min(first + per_session, n_orders))]
+        state = {orderKey(order["order_id"]): order for order in session_orders}
+        state["order_ids"] = {order["order_id"]: order["purchased_time"] for order in session_orders}
+        with conn:
+            conn.execute(
+                "INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?)",
+                (APP_NAME, f"user{first // per_session}", session_id, json.dumps(state), now, now),
+            )
+        # Same path as a persisted state delta
+        indexOrders(APP_NAME, f"user{first // per_session}", session_id, state)
+        orders.extend(session_orders)
+    return orders
+
+
+def _scan(conn, match) -> list:
+    # What the lookup costs without the tables: decode every session
+    found = []
+    for (state,) in conn.execute("SELECT state FROM sessions"):
+        for key, value in json.loads(state).items():
+            if key.startswith("order:") and value and match(value):
+                found.append(value)
+    return found
+
+
+def _time(fn, args_list) -> dict:
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--per-session", type=int, default=5, help="orders per session")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=3, help="lookups timed by scanning session states")
+    parser.add_argument("--dir", default=None, help="where to put the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_orders_")
+    path = os.path.join(workdir, "orders.db")
+    try:
+        started = time.perf_counter()
+        orders = build(path, args.orders, args.per_session)
+        build_s = time.perf_counter() - started
+
+        rng = random.Random(3)
+        sample = [rng.choice(orders) for _ in range(args.queries)]
+        slots = [deliverySlots.slotStart(order["delivery_time"]).strftime("%d.%m.%Y %H:%M") for order in sample]
+        conn = database.connect()
+
+        results = {
+            "orders": args.orders,
+            "sessions": -(-args.orders // args.per_session),
+            "build_s": build_s,
+            "orders_per_s": args.orders / build_s,
+            "indexed": {
+                "find_order": _time(findOrder, [(order["order_id"],) for order in sample]),
+                "slot_orders": _time(slotOrders, [(slot,) for slot in slots]),
+                "by_phone": _time(lambda phone: findOrders(phone=phone), [(order["phone"],) for order in sample]),
+                "by_customer": _time(lambda name: findOrders(customer=name),
+                                     [(order["customer_name"].upper(),) for order in sample]),
+            },
+            "session_scan": {
+                "find_order": _time(lambda order_id: _scan(conn, lambda o: o["order_id"] == order_id),
+                                    [(order["order_id"],) for order in sample[:args.scans]]),
+            },
+        }
+        results["speedup_find_order"] = (results["session_scan"]["find_order"]["mean_ms"]
+                                         / results["indexed"]["find_order"]["mean_ms"])
+        print(json.dumps(results, indent=2))
+    finally:
+        if not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
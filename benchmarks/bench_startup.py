@@ -0,0 +1,54 @@
+"""
+Startup benchmark based on `python -X importtime`.
+
+Imports a module (main by default) in a fresh interpreter, reports the
+slowest imports and fails when the total import time is over budget.
+
+    python -m benchmarks.bench_startup --budget-ms 300
+"""
+import argparse
+import subprocess
+import sys
+
+
+def importTimes(module: str) -> list:
+    """Return [(cumulative_us, self_us, name)] for every module imported."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=300.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # Keep the best run, the first one also pays for cold disk caches
+    best = min((importTimes(args.module) for _ in range(args.runs)),
+               key=lambda times: sum(t[1] for t in times))
+    total_ms = sum(t[1] for t in best) / 1000
+
+    print(f"Slowest imports of {args.module} (cumulative ms):")
+    for cumulative_us, _, name in sorted(best, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+    print(f"Total import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if total_ms > args.budget_ms:
+        print("Startup budget exceeded.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Storage benchmark: default SQLite settings vs the tuned storage profile.
+
+Builds a synthetic database with the session service's schema (100k events
+by default), copies it, applies SQLITE_PRAGMAS and the index migrations to
+the copy, and times the session service's access patterns on both.
+
+    python -m benchmarks.bench_storage --events 100000 --sessions 1000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from agent.helpers import database
+
+APP_NAME = "Customer_Service_Agent"
+
+# Tables as created by DatabaseSessionService
+_SCHEMA = """
+CREATE TABLE sessions (
+    app_name VARCHAR(128) NOT NULL,
+    user_id VARCHAR(128) NOT NULL,
+    id VARCHAR(128) NOT NULL,
+    state TEXT NOT NULL,
+    create_time DATETIME NOT NULL,
+    update_time DATETIME NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE events (
+    id VARCHAR(128) NOT NULL,
+    app_name VARCHAR(128) NOT NULL,
+    user_id VARCHAR(128) NOT NULL,
+    session_id VARCHAR(128) NOT NULL,
+    invocation_id VARCHAR(256) NOT NULL,
+    author VARCHAR(256) NOT NULL,
+    branch VARCHAR(256),
+    timestamp DATETIME NOT NULL,
+    content TEXT,
+    actions BLOB NOT NULL,
+    PRIMARY KEY (id, app_name, user_id, session_id),
+    FOREIGN KEY(app_name, user_id, session_id) REFERENCES sessions (app_name, user_id, id) ON DELETE CASCADE
+);
+"""
+
+_LOAD_EVENTS = ("SELECT * FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? "
+                "ORDER BY timestamp")
+_LATEST_SESSION = ("SELECT id FROM sessions WHERE app_name = ? AND user_id = ? "
+                   "ORDER BY update_time DESC LIMIT 1")
+_IDLE_SESSIONS = "SELECT COUNT(*) FROM sessions WHERE update_time <= ?"
+_APPEND_EVENT = ("INSERT INTO events (id, app_name, user_id, session_id, invocation_id, author, "
+                 "timestamp, content, actions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+_TOUCH_SESSION = "UPDATE sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?"
+
+
+def _content(text):
+    return json.dumps({"role": "user", "parts": [{"text": text}]})
+
+
+def build(path: str, n_events: int, n_sessions: int, users_per_session: float = 0.5, seed: int = 7):
+    """Write a synthetic database; events are interleaved across sessions like real traffic."""
+    rng = random.Random(seed)
+    n_users = max(1, int(n_sessions * users_per_session))
+    start = datetime(2025, 1, 1)
+
+    sessions = []
+    for i in range(n_sessions):
+        user_id = f"user{i % n_users}"
+        sessions.append((APP_NAME, user_id, uuid.UUID(int=rng.getrandbits(128)).hex))
+
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    last_seen = {}
+    events = []
+    for i in range(n_events):
+        key = rng.choice(sessions)
+        ts = start + timedelta(seconds=i * 3)
+        last_seen[key] = ts
+        events.append((
+            uuid.UUID(int=rng.getrandbits(128)).hex, *key, f"inv{i // 4}",
+            "user" if i % 2 == 0 else "Order", ts.isoformat(" "),
+            _content("three jars of matcha cookies for tomorrow 3pm please " * 2), b"\x80\x04}\x94.",
+        ))
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+            [(*key, "{}", start.isoformat(" "), last_seen.get(key, start).isoformat(" ")) for key in sessions],
+        )
+        conn.executemany(_APPEND_EVENT, events)
+    conn.close()
+    return sessions
+
+
+def _timeReads(path, pragmas, sessions, queries, rng):
+    conn = sqlite3.connect(path, timeout=30)
+    database.applyPragmas(conn, pragmas)
+    picks = [rng.choice(sessions) for _ in range(queries)]
+    cutoff = datetime(2025, 1, 2).isoformat(" ")
+
+    results = {}
+    started = time.perf_counter()
+    for key in picks:
+        conn.execute(_LOAD_EVENTS, key).fetchall()
+    results["load_session_events_ms"] = (time.perf_counter() - started) / queries * 1e3
+
+    started = time.perf_counter()
+    for _, user_id, _ in picks:
+        conn.execute(_LATEST_SESSION, (APP_NAME, user_id)).fetchone()
+    results["latest_session_ms"] = (time.perf_counter() - started) / queries * 1e3
+
+    started = time.perf_counter()
+    for _ in range(max(1, queries // 20)):
+        conn.execute(_IDLE_SESSIONS, (cutoff,)).fetchone()
+    results["idle_sessions_scan_ms"] = (time.perf_counter() - started) / max(1, queries // 20) * 1e3
+    conn.close()
+    return results
+
+
+def _appendTurns(path, pragmas, sessions, turns, rng):
+    conn = sqlite3.connect(path, timeout=30)
+    database.applyPragmas(conn, pragmas)
+    for _ in range(turns):
+        key = rng.choice(sessions)
+        now = datetime.now().isoformat(" ")
+        with conn:
+            conn.execute(_APPEND_EVENT, (uuid.uuid4().hex, *key, "bench", "user", now, _content("hi"), b""))
+            conn.execute(_TOUCH_SESSION, (now, *key))
+    conn.close()
+
+
+def _timeWrites(path, pragmas, sessions, turns, rng):
+    started = time.perf_counter()
+    _appendTurns(path, pragmas, sessions, turns, rng)
+    return {"append_turns_per_s": turns / (time.perf_counter() - started)}
+
+
+def _timeMixed(path, pragmas, sessions, threads, turns, rng):
+    """One writer thread appends while reader threads load sessions."""
+    reads = [0] * threads
+    stop = threading.Event()
+
+    def reader(slot):
+        conn = sqlite3.connect(path, timeout=30)
+        database.applyPragmas(conn, pragmas)
+        local_rng = random.Random(slot)
+        while not stop.is_set():
+            conn.execute(_LOAD_EVENTS, local_rng.choice(sessions)).fetchall()
+            reads[slot] += 1
+        conn.close()
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    started = time.perf_counter()
+    _appendTurns(path, pragmas, sessions, turns, rng)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return {"mixed_append_turns_per_s": turns / elapsed, "mixed_reads_per_s": sum(reads) / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--dir", default=None, help="where to put the databases (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_storage_")
+    baseline_path = os.path.join(workdir, "baseline.db")
+    tuned_path = os.path.join(workdir, "tuned.db")
+    for path in (baseline_path, tuned_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"Building {args.events} events over {args.sessions} sessions in {workdir} ...")
+    sessions = build(baseline_path, args.events, args.sessions)
+    shutil.copy(baseline_path, tuned_path)
+    database.migrate(tuned_path)
+
+    # SQLite's defaults: rollback journal, synchronous=FULL, 2 MB cache
+    profiles = {
+        "default": (baseline_path, {"journal_mode": "DELETE", "synchronous": "FULL"}),
+        "tuned": (tuned_path, database.SQLITE_PRAGMAS),
+    }
+
+    report = {}
+    for name, (path, pragmas) in profiles.items():
+        rng = random.Random(11)
+        result = _timeReads(path, pragmas, sessions, args.queries, rng)
+        result.update(_timeWrites(path, pragmas, sessions, args.turns, rng))
+        result.update(_timeMixed(path, pragmas, sessions, args.threads, args.turns, rng))
+        report[name] = result
+
+    print(f"{'metric':<28} {'default':>12} {'tuned':>12} {'speedup':>9}")
+    for metric in report["default"]:
+        before, after = report["default"][metric], report["tuned"][metric]
+        # Latencies improve downwards, rates upwards
+        speedup = before / after if metric.endswith("_ms") else after / before
+        print(f"{metric:<28} {before:>12.3f} {after:>12.3f} {speedup:>8.1f}x")
+
+    if not args.dir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
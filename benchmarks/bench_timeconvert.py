@@ -0,0 +1,48 @@
+"""
+Micro-benchmark of delivery time parsing.
+
+Compares the compiled fast path of timeConvert (cold and memoized) with
+plain dateparser.parse on the phrases customers usually send.
+
+    python -m benchmarks.bench_timeconvert
+"""
+import timeit
+from datetime import datetime
+
+import dateparser
+from agent.helpers import helpers
+
+PHRASES = [
+    "3pm tomorrow",
+    "tomorrow at 15:30",
+    "10:00 25.12",
+    "25.12 10:00",
+    "15h30 tomorrow",
+    "in 5 hours",
+    "25.12.2025 10:00",
+]
+
+
+def _perCall(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main(number: int = 200):
+    now = datetime.now()
+    print(f"{'phrase':<20} {'dateparser':>12} {'fast cold':>12} {'fast cached':>12}   (us per call)")
+
+    for phrase in PHRASES:
+        slow = _perCall(lambda: dateparser.parse(phrase), number)
+
+        def cold():
+            helpers._fastPlan.cache_clear()
+            helpers._slowParse.cache_clear()
+            helpers.timeConvert(phrase, now=now)
+
+        fast_cold = _perCall(cold, number)
+        fast_cached = _perCall(lambda: helpers.timeConvert(phrase, now=now), number)
+        print(f"{phrase:<20} {slow:>12.1f} {fast_cold:>12.1f} {fast_cached:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Replay recorded customer traffic against the agents, offline.
+
+Pulls the user turns out of the `events` table of a recorded database
+(cookies_customer_service_data.db by default, opened read-only), groups
+them into conversations, and plays them through run_turn /
+call_agent_async on ScriptedModel stubs, against a fresh database.
+
+    python -m benchmarks.replay --mode closed --concurrency 20
+    python -m benchmarks.replay --mode open --rate 5 --duration 60
+
+closed: `--concurrency` conversations at once, the next one starting as
+        soon as one ends (throughput under a fixed number of customers).
+open:   new conversations arrive as a Poisson process at `--rate` per
+        second for `--duration` seconds, however slow the system gets
+        (latency under a fixed load; turn latency includes queueing).
+
+Inside a conversation the turns follow each other, after the recorded
+pause times `--think-scale` (0, the default, plays them back to back).
+Reports throughput, turn latency percentiles, and database contention:
+session-store and history-write latencies, and turns that failed. The
+replayed turns' model calls run in the scheduler's "batch" lane.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+from agent.helpers import (setDatabasePath, dbPathFromUrl, deliverySlots, configureModelScheduler,
+                           schedulerStats, setTracing, spanStats, resetMetrics, modelLane)
+from benchmarks.bench_agents import APP_NAME, TimedSessionService, ToolTimer, summarize
+from benchmarks.stub_model import useStubModels
+
+DEFAULT_SOURCE = "./cookies_customer_service_data.db"
+# Console commands of main.py, not messages for the agents
+_COMMANDS = {"exit", "quit", "clear", "delete session"}
+# Spans that show the database under contention
+_STORAGE_SPANS = ("history.write", "orders.index", "compaction")
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def loadConversations(path: str = DEFAULT_SOURCE, min_turns: int = 1) -> list:
+    """
+    The recorded user turns, one conversation per session.
+
+    Returns:
+        list: [{"session_id", "turns": [(text, seconds since the previous turn)]}]
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT session_id, content, timestamp FROM events "
+            "WHERE author = 'user' AND content IS NOT NULL "
+            "ORDER BY app_name, user_id, session_id, timestamp"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    conversations = []
+    for session_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+        turns = []
+        previous = None
+        for _, content, timestamp in group:
+            try:
+                parts = json.loads(content).get("parts") or []
+            except ValueError:
+                continue
+            text = " ".join(part.get("text") or "" for part in parts).strip()
+            if not text or text.lower() in _COMMANDS:
+                continue
+            at = _timestamp(timestamp)
+            turns.append((text, 0.0 if previous is None else max(0.0, at - previous)))
+            previous = at
+        if len(turns) >= min_turns:
+            conversations.append({"session_id": session_id, "turns": turns})
+    return conversations
+
+
+class Replay:
+    def __init__(self, runner, conversations: list, think_scale: float = 0.0, max_think: float = 10.0,
+                 seed: int = 5):
+        self.runner = runner
+        self.conversations = conversations
+        self.think_scale = think_scale
+        # Recorded pauses can be hours, the customer came back later
+        self.max_think = max_think
+        self.rng = random.Random(seed)
+
+        self.latencies = []
+        self.failures = 0
+        self.errors = Counter()
+        self.conversations_done = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Separate counters, so every recording gets its turn in order
+        self._picks = itertools.count()
+        self._users = itertools.count()
+
+    def _pick(self) -> dict:
+        return self.conversations[next(self._picks) % len(self.conversations)]
+
+    async def conversation(self, recorded: dict, arrived: float = None):
+        """Play one recorded conversation as a new customer."""
+        from main import get_or_create_session
+        from utils import MODEL_BUSY_MESSAGE, run_turn
+
+        user_id = f"replay-{next(self._users)}"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            session_id, _ = await get_or_create_session(self.runner.session_service, APP_NAME, user_id)
+            for i, (text, think) in enumerate(recorded["turns"]):
+                if i and self.think_scale:
+                    await asyncio.sleep(min(self.max_think, think * self.think_scale))
+                # Open loop: the first turn also waited for the conversation to get going
+                started = arrived if (i == 0 and arrived is not None) else time.perf_counter()
+                try:
+                    with modelLane("batch"):
+                        response = await run_turn(self.runner, user_id, session_id, text)
+                except Exception as e:
+                    # e.g. "database is locked" from the session store
+                    response = None
+                    self.errors[type(e).__name__ + (": locked" if "locked" in str(e) else "")] += 1
+                self.latencies.append(time.perf_counter() - started)
+                # call_agent_async answers None when the agents failed
+                if response is None or response == MODEL_BUSY_MESSAGE:
+                    self.failures += 1
+        finally:
+            self.in_flight -= 1
+            self.conversations_done += 1
+
+    async def closed(self, concurrency: int, total: int):
+        """`concurrency` customers, `total` conversations in all."""
+        remaining = iter(range(total))
+
+        async def customer():
+            for _ in remaining:
+                await self.conversation(self._pick())
+
+        await asyncio.gather(*(customer() for _ in range(concurrency)))
+
+    async def open(self, rate: float, duration: float):
+        """Poisson arrivals of conversations for `duration` seconds."""
+        tasks = []
+        deadline = time.perf_counter() + duration
+        next_arrival = time.perf_counter()
+        while True:
+            next_arrival += self.rng.expovariate(rate)
+            if next_arrival >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(self.conversation(self._pick(), arrived=next_arrival)))
+        await asyncio.gather(*tasks)
+
+
+async def runReplay(args) -> dict:
+    from main import build_runner, make_session_service
+
+    conversations = loadConversations(args.source, args.min_turns)
+    if not conversations:
+        raise SystemExit(f"No user turns found in {args.source}")
+
+    setDatabasePath(dbPathFromUrl(args.db_url))
+    # Storage spans measure the database under contention
+    setTracing(True)
+    resetMetrics()
+    useStubModels(args.model_latency_ms / 1e3)
+    deliverySlots.SLOT_CAPACITY = 10 ** 6
+    configureModelScheduler(requests_per_minute=args.model_rpm, tokens_per_minute=None,
+                            max_concurrent=args.model_concurrency)
+
+    from agent import root_agent
+    tools = ToolTimer()
+    for llm_agent in root_agent.sub_agents:
+        llm_agent.before_tool_callback = tools.before
+        llm_agent.after_tool_callback = tools.after
+
+    session_service = make_session_service(args.db_url)
+    if hasattr(session_service, "inner"):
+        timed = session_service.inner = TimedSessionService(session_service.inner)
+    else:
+        timed = session_service = TimedSessionService(session_service)
+    runner = build_runner(APP_NAME, session_service)
+    replay = Replay(runner, conversations, args.think_scale, args.max_think)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            if args.mode == "closed":
+                await replay.closed(args.concurrency, args.conversations or args.concurrency * len(conversations))
+            else:
+                await replay.open(args.rate, args.duration)
+            # Events the session cache holds back are part of the work
+            flush = getattr(session_service, "flush", None)
+            if flush:
+                await flush()
+            elapsed = time.perf_counter() - started
+    finally:
+        await session_service.close()
+
+    spans = spanStats()
+    return {
+        "meta": {
+            "source": args.source,
+            "recorded_conversations": len(conversations),
+            "recorded_turns": sum(len(c["turns"]) for c in conversations),
+            "mode": args.mode,
+            "concurrency": args.concurrency if args.mode == "closed" else None,
+            "rate_per_s": args.rate if args.mode == "open" else None,
+            "think_scale": args.think_scale,
+            "max_think_s": args.max_think,
+            "model_latency_s": args.model_latency_ms / 1e3,
+            "python": platform.python_version(),
+        },
+        "conversations": replay.conversations_done,
+        "turns": len(replay.latencies),
+        "failed_turns": replay.failures,
+        "turn_errors": dict(replay.errors),
+        "wall_s": elapsed,
+        "turns_per_s": len(replay.latencies) / elapsed,
+        "max_conversations_in_flight": replay.max_in_flight,
+        "turn_latency": summarize(replay.latencies),
+        "tools": {name: summarize(samples) for name, samples in sorted(tools.samples.items())},
+        "contention": {
+            "session_db": {name: summarize(samples) for name, samples in sorted(timed.samples.items())},
+            "session_db_total_s": sum(sum(samples) for samples in timed.samples.values()),
+            "storage_spans": {
+                name: stats for (name, _), stats in spans.items() if name in _STORAGE_SPANS
+            },
+            "storage_errors": sum(stats["errors"] for (name, _), stats in spans.items() if name in _STORAGE_SPANS),
+        },
+        "model_scheduler": schedulerStats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="recorded database to read user turns from")
+    parser.add_argument("--min-turns", type=int, default=1, help="skip shorter recorded conversations")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed loop: customers at once")
+    parser.add_argument("--conversations", type=int, default=None,
+                        help="closed loop: conversations in all (default: each recording once per customer)")
+    parser.add_argument("--rate", type=float, default=2.0, help="open loop: new conversations per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="open loop: seconds of arrivals")
+    parser.add_argument("--think-scale", type=float, default=0.0,
+                        help="multiply the recorded pauses between turns (0: back to back)")
+    parser.add_argument("--max-think", type=float, default=10.0, help="longest pause between turns, in seconds")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0,
+                        help="simulated latency of every model call")
+    parser.add_argument("--model-rpm", type=int, default=0, help="model scheduler quota (0: unlimited)")
+    parser.add_argument("--model-concurrency", type=int, default=0, help="model calls in flight (0: unlimited)")
+    parser.add_argument("--db-url", default=None,
+                        help="database to replay into (default: a new SQLite file in a temp dir)")
+    parser.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.db_url is None:
+        workdir = tempfile.mkdtemp(prefix="replay_")
+        args.db_url = f"sqlite:///{os.path.join(workdir, 'replay.db')}"
+
+    results = asyncio.run(runReplay(args))
+
+    report = json.dumps(results, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+        latency = results["turn_latency"]
+        print(f"{results['turns']} turns in {results['wall_s']:.1f} s: {results['turns_per_s']:.1f} turns/s, "
+              f"p50 {latency.get('p50_ms', 0):.1f} ms, p99 {latency.get('p99_ms', 0):.1f} ms, "
+              f"{results['failed_turns']} failed")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Deterministic stand-in for gemini so the agents can run offline.
+
+ScriptedModel answers from canned rules instead of calling an API: the
+orchestrator transfers to a sub-agent, the sub-agents call their tools with
+fixed arguments, and once a tool has answered the model replies with text.
+
+    from benchmarks.stub_model import useStubModels
+    useStubModels(latency=0.05)     # every agent now runs on ScriptedModel
+"""
+import asyncio
+import re
+from typing import AsyncGenerator
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+CUSTOMER = "Bench Customer"
+
+# What the customer sends in a benchmark conversation, in order
+CONVERSATION = [
+    "What cookies do you have on the menu?",
+    f"Name: {CUSTOMER}, I want 2 jars of chocolate cookies and 1 jar of matcha cookies. "
+    "Address: 22H D8 W9, Phone: 0908353308, Delivery: 3pm tomorrow",
+    "Where is my order? Please track it.",
+    "Please reorder the same as last time for 3pm tomorrow.",
+    "Can I get a refund for my order?",
+    "Cancel my order please.",
+    "What is your shipping fee policy?",
+]
+
+# Routing rules of the orchestrator (when the pre-router leaves the turn to
+# the model) and of sub-agents handed a message that belongs to another one
+_ROUTES = [
+    (r"\b(track|reorder|re-order|cancel|refund|order id)\b", "Order"),
+    (r"\b(menu|buy|jars?|price)\b", "Seller"),
+    (r"\b(policy|policies|shipping|delivery fee)\b", "Policy"),
+]
+
+# Sub-agent rules: (pattern, tool name, tool arguments)
+_TOOL_CALLS = {
+    "Seller": [
+        (r"\bmenu\b", "getMenu", {}),
+        (r"\bname\s*:.*\bphone\s*:", "purchaseProduct", {
+            "customer": CUSTOMER,
+            "products": [
+                {"name": "chocolate cookies", "quantity": 2},
+                {"name": "matcha", "quantity": 1},
+            ],
+            "delivery_time": "3pm tomorrow",
+            "phone": "0908353308",
+            "address": "22H D8 W9",
+        }),
+    ],
+    "Order": [
+        (r"\bre-?order\b", "reorder", {"delivery_time": "3pm tomorrow"}),
+        (r"\brefund\b", "refund", {}),
+        (r"\bcancel\b", "cancelOrder", {}),
+        (r"\b(track|where|status)\b", "trackingOrder", {}),
+    ],
+}
+
+_TEXT_ANSWERS = {
+    "Seller": "We have Cookies Matcha and Cookies Chocolate, $5 per jar of 15 cookies.",
+    "Policy": "Shipping is free for orders over $20, otherwise the fee depends on the district.",
+}
+
+
+def _text(content) -> str:
+    return " ".join(part.text for part in (content.parts or []) if getattr(part, "text", None))
+
+
+def _customerMessage(llm_request: LlmRequest) -> str:
+    # Other agents' calls show up as "For context:" user messages, skip them
+    for content in reversed(llm_request.contents):
+        if content.role != "user":
+            continue
+        text = _text(content)
+        if text and not text.startswith("For context"):
+            return text
+    return ""
+
+
+def _functionResponse(llm_request: LlmRequest):
+    last = llm_request.contents[-1] if llm_request.contents else None
+    for part in (last.parts or []) if last else []:
+        if part.function_response:
+            return part.function_response
+    return None
+
+
+def _route(message: str):
+    for pattern, agent_name in _ROUTES:
+        if re.search(pattern, message, re.IGNORECASE):
+            return agent_name
+    return None
+
+
+def _reply(part: types.Part, llm_request: LlmRequest) -> LlmResponse:
+    # Rough token counts (4 characters per token) so usage metrics have data
+    prompt_chars = sum(len(_text(content)) for content in llm_request.contents)
+    prompt_chars += len(str(llm_request.config.system_instruction or "")) if llm_request.config else 0
+    output_chars = len(part.text or "") + len(str(part.function_call.args if part.function_call else ""))
+    return LlmResponse(
+        content=types.Content(role="model", parts=[part]),
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // 4,
+            candidates_token_count=output_chars // 4,
+            total_token_count=(prompt_chars + output_chars) // 4,
+        ),
+    )
+
+
+def _transfer(agent_name: str, llm_request: LlmRequest) -> LlmResponse:
+    return _reply(types.Part(function_call=types.FunctionCall(
+        name="transfer_to_agent", args={"agent_name": agent_name},
+    )), llm_request)
+
+
+class ScriptedModel(BaseLlm):
+    """
+    Canned model for one agent (`model` is the agent's name).
+
+    Args:
+        latency: seconds every call sleeps, to stand in for network time
+    """
+
+    latency: float = 0.0
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # A tool answered: report its result
+        response = _functionResponse(llm_request)
+        if response is not None:
+            result = response.response or {}
+            message = (result.get("message") or result.get("menu") or result.get("result")
+                       or result.get("status") or "Done.")
+            yield _reply(types.Part(text=str(message)), llm_request)
+            return
+
+        message = _customerMessage(llm_request)
+        target = _route(message)
+
+        if self.model in _TOOL_CALLS or self.model in _TEXT_ANSWERS:
+            # A sub-agent hands messages for another agent over, as gemini does
+            if target and target != self.model:
+                yield _transfer(target, llm_request)
+                return
+            for pattern, tool, args in _TOOL_CALLS.get(self.model, []):
+                if re.search(pattern, message, re.IGNORECASE):
+                    yield _reply(types.Part(function_call=types.FunctionCall(name=tool, args=dict(args))), llm_request)
+                    return
+            yield _reply(types.Part(text=_TEXT_ANSWERS.get(self.model, "How can I help you with your order?")), llm_request)
+            return
+
+        # Orchestrator
+        if target:
+            yield _transfer(target, llm_request)
+            return
+        yield _reply(types.Part(text="Welcome to innhi cookies! How can I help you today?"), llm_request)
+
+
+def useStubModels(latency: float = 0.0) -> dict:
+    """Put a ScriptedModel on root_agent and every sub-agent.
+
+    The stubs stay behind the shared model scheduler, like gemini.
+
+    Returns:
+        dict: agent name -> its ScriptedModel (for call counts)
+    """
+    from agent import root_agent
+    from agent.scheduledModel import ScheduledModel
+
+    models = {}
+    for llm_agent in [root_agent, *root_agent.sub_agents]:
+        model = ScriptedModel(model=llm_agent.name, latency=latency)
+        llm_agent.model = ScheduledModel(model=llm_agent.name, inner=model)
+        models[llm_agent.name] = model
+    return models
@@ -0,0 +1,127 @@
+"""
+ADK hooks feeding agent.helpers.tracing.
+
+    runner = Runner(..., plugins=[TracingPlugin()])
+    session_service = TracedSessionService(DatabaseSessionService(...))
+
+TracingPlugin opens a span per invocation, model call and tool call
+(carrying invocation_id, agent name and token counts), TracedSessionService
+one per session-service operation. main.py installs both when TRACING is on.
+"""
+from google.adk.plugins import BasePlugin
+from google.adk.sessions import BaseSessionService
+
+from agent.helpers.tracing import addTokens, span, startSpan
+
+
+class TracingPlugin(BasePlugin):
+    def __init__(self):
+        super().__init__(name="tracing")
+        self._runs = {}
+        self._models = {}
+        self._tools = {}
+
+    async def before_run_callback(self, *, invocation_context):
+        started = startSpan(
+            "invocation",
+            trace_id=invocation_context.invocation_id,
+            session_id=invocation_context.session.id,
+        )
+        if started:
+            self._runs[invocation_context.invocation_id] = started
+        return None
+
+    async def after_run_callback(self, *, invocation_context):
+        invocation_id = invocation_context.invocation_id
+        started = self._runs.pop(invocation_id, None)
+        if started:
+            started.end()
+        # Model calls answered by an agent callback (router, answer cache)
+        # never reach after_model_callback, drop them
+        for key in [key for key in self._models if key[0] == invocation_id]:
+            del self._models[key]
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        started = startSpan(
+            "model",
+            trace_id=callback_context.invocation_id,
+            agent=callback_context.agent_name,
+            model=llm_request.model,
+        )
+        if started:
+            self._models[(callback_context.invocation_id, callback_context.agent_name)] = started
+        return None
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        if llm_response.partial:
+            return None
+        started = self._models.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if started:
+            usage = llm_response.usage_metadata
+            prompt = (usage.prompt_token_count or 0) if usage else 0
+            output = (usage.candidates_token_count or 0) if usage else 0
+            started.end(prompt_tokens=prompt, output_tokens=output)
+            addTokens(callback_context.agent_name, prompt, output)
+        return None
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        started = self._models.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if started:
+            started.end(error=error)
+        return None
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        started = startSpan(
+            f"tool.{tool.name}",
+            trace_id=tool_context.invocation_id,
+            agent=tool_context.agent_name,
+        )
+        if started:
+            self._tools[tool_context.function_call_id] = started
+        return None
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        started = self._tools.pop(tool_context.function_call_id, None)
+        if started:
+            status = result.get("status") if isinstance(result, dict) else None
+            started.end(status=status)
+        return None
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        started = self._tools.pop(tool_context.function_call_id, None)
+        if started:
+            started.end(error=error)
+        return None
+
+
+class TracedSessionService(BaseSessionService):
+    """Forwards to another session service inside a "session.<operation>" span."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def create_session(self, **kwargs):
+        with span("session.create_session", user_id=kwargs.get("user_id")):
+            return await self.inner.create_session(**kwargs)
+
+    async def get_session(self, **kwargs):
+        with span("session.get_session", session_id=kwargs.get("session_id")):
+            return await self.inner.get_session(**kwargs)
+
+    async def list_sessions(self, **kwargs):
+        with span("session.list_sessions", user_id=kwargs.get("user_id")):
+            return await self.inner.list_sessions(**kwargs)
+
+    async def delete_session(self, **kwargs):
+        with span("session.delete_session", session_id=kwargs.get("session_id")):
+            return await self.inner.delete_session(**kwargs)
+
+    async def append_event(self, session, event):
+        with span("session.append_event", trace_id=event.invocation_id, agent=event.author,
+                  session_id=session.id):
+            return await self.inner.append_event(session, event)
+
+    async def close(self):
+        close = getattr(self.inner, "close", None)
+        if close:
+            await close()
@@ -1,73 +1,212 @@
 import asyncio
 from dotenv import load_dotenv
 import os
-from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService
-from agent.agent import root_agent
-from utils import call_agent_async, add_agent_response_to_history, add_user_query_to_history
+from agent.helpers import ORDER_INDEX_KEY, setDatabasePath, dbPathFromUrl, clearInteractions, setOnlineCompaction
+from agent.helpers import engineOptions, useStorageProfile, migrate, setTracing, tracingEnabled, flushTraces
+from agent.helpers import configureModelScheduler, configureLogging, flushLogs
+from utils import run_turn, set_show_state
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Stream the answer as it is generated instead of waiting for all of it
+STREAM = os.getenv("STREAM", "0").lower() in ["1", "true", "yes"]
+
+# Structured JSON logs, written by a background thread to LOG_FILE (or
+# stderr). LOG_SAMPLE keeps a fraction of a module's records, e.g.
+# "utils.events=0.05"; warnings and errors are always kept
+configureLogging(
+    level = os.getenv("LOG_LEVEL", "WARNING"),
+    path = os.getenv("LOG_FILE") or None,
+    sampling = os.getenv("LOG_SAMPLE") or None,
+)
+
+# Log the session state around every turn (debugging only)
+set_show_state(os.getenv("SHOW_STATE", "0").lower() in ["1", "true", "yes"])
+
 # Initialize Persistent Session Service 
 # Using SQLite database for persistent storage
 db_url = "sqlite:///./cookies_customer_service_data.db"
-session_service = DatabaseSessionService(db_url=db_url)
+# Interaction history is an append-only table in the same database
+setDatabasePath(dbPathFromUrl(db_url))
+
+# Keep long sessions small: old events are folded into a checkpoint
+# summary in state once a session has too many of them
+setOnlineCompaction(os.getenv("COMPACT_SESSIONS", "1").lower() in ["1", "true", "yes"])
+
+# Spans around model calls, tools and storage (GET /metrics of server.py),
+# also appended to TRACE_FILE when it is set
+setTracing(os.getenv("TRACING", "0").lower() in ["1", "true", "yes"], os.getenv("TRACE_FILE") or None)
+
+# Every agent's model calls share one scheduler: requests/tokens per minute
+# under the API quota, customer turns before batch jobs, backoff on 429
+configureModelScheduler(
+    requests_per_minute = int(os.getenv("MODEL_RPM", "1000")),
+    tokens_per_minute = int(os.getenv("MODEL_TPM", "1000000")),
+    max_concurrent = int(os.getenv("MODEL_MAX_CONCURRENT", "16")),
+    max_retries = int(os.getenv("MODEL_MAX_RETRIES", "4")),
+)
+
+# google.adk is heavy to import, so the session service and the agents are
+# only built when they are first needed
+_session_service = None
+
+
+def make_session_service(db_url = db_url):
+    """DatabaseSessionService with the storage profile, behind the session cache."""
+    from google.adk.sessions import DatabaseSessionService
+    # WAL + tuned pragmas on a pool sized for concurrent turns
+    session_service = DatabaseSessionService(
+        db_url=db_url,
+        **engineOptions(int(os.getenv("DB_POOL_SIZE", "16"))),
+    )
+    useStorageProfile(session_service.db_engine)
+    # Indexes for loading events and finding the latest session, once the
+    # session service's tables exist
+    _migrateAfterTables(session_service, dbPathFromUrl(db_url))
+
+    # Order changes are mirrored into the indexed orders tables
+    from order_sync import OrderIndexSessionService
+    session_service = OrderIndexSessionService(session_service)
+
+    if tracingEnabled():
+        from instrumentation import TracedSessionService
+        session_service = TracedSessionService(session_service)
+
+    # Hot sessions stay in memory and are written back in the background
+    if os.getenv("SESSION_CACHE", "1").lower() in ["1", "true", "yes"]:
+        from session_cache import CachingSessionService
+        session_service = CachingSessionService(
+            session_service,
+            max_sessions = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "1000")),
+            flush_interval = float(os.getenv("SESSION_FLUSH_INTERVAL", "1.0")),
+        )
+    return session_service
+
+
+def _migrateAfterTables(session_service, path):
+    prepare_tables = getattr(session_service, "prepare_tables", None)
+    if prepare_tables is None:
+        # ADK 1.x creates the tables in the constructor
+        migrate(path)
+        return
+
+    # Later versions create them on the first query
+    migrated = False
+
+    async def prepare_tables_and_migrate():
+        nonlocal migrated
+        await prepare_tables()
+        if not migrated:
+            migrated = True
+            await asyncio.to_thread(migrate, path)
+
+    session_service.prepare_tables = prepare_tables_and_migrate
+
+
+def get_session_service():
+    global _session_service
+    if _session_service is None:
+        _session_service = make_session_service()
+    return _session_service
+
+
+def build_runner(app_name, session_service):
+    """Create the Runner, which builds the agents on first use."""
+    from google.adk.runners import Runner
+    from agent import root_agent
+
+    plugins = []
+    if tracingEnabled():
+        from instrumentation import TracingPlugin
+        plugins.append(TracingPlugin())
+
+    return Runner(
+            app_name = app_name,
+            agent = root_agent,
+            session_service = session_service, 
+            plugins = plugins,
+    )
 
 # Define Initial State
 # This will only be used when creating a new session
 initial_state = {
     "user_name": "Be Nhi",
-    "orders": [],
-    "interaction_history": [],
+    ORDER_INDEX_KEY: {},
 }
 
-async def main_async():
-    # Set up constant
-    APP_NAME = "Customer_Service_Agent"
-    USER_ID = "BeNhiLiuGrace"
-    
-    # Session Management
+APP_NAME = "Customer_Service_Agent"
+
+
+async def get_or_create_session(session_service, app_name, user_id):
+    """Return (session_id, continued): the user's latest session or a new one."""
     # Check for existing sessions
     existing_session = await session_service.list_sessions(
-        app_name= APP_NAME,
-        user_id = USER_ID,
+        app_name= app_name,
+        user_id = user_id,
     )
     
     # If there's an existing session, use it, otherwise create a new one
     if existing_session and len(existing_session.sessions) > 0:
         # Use the most recent session
-        SESSION_ID = existing_session.sessions[0].id
+        latest = max(existing_session.sessions, key=lambda session: session.last_update_time)
+        return latest.id, True
+
+    # Create a new sessiom with initial state
+    new_session = await session_service.create_session(
+            app_name = app_name,
+            user_id = user_id,
+            state = initial_state,
+            )
+    return new_session.id, False
+
+
+def print_delta(text):
+    """Streaming output: write each text delta to the console."""
+    print(text, end="", flush=True)
+
+
+def print_response(text):
+    """Show a final response on the console (after its deltas when streaming)."""
+    if STREAM:
+        print()
+        return
+    print(f"\n╔══ AGENT RESPONSE ═════════════════════════════════════════")
+    print(text)
+    print(f"╚═════════════════════════════════════════════════════════════\n")
+
+
+async def main_async():
+    # Set up constant
+    USER_ID = "BeNhiLiuGrace"
+    session_service = get_session_service()
+    
+    # Session Management
+    SESSION_ID, continued = await get_or_create_session(session_service, APP_NAME, USER_ID)
+    if continued:
         print(f"Continuing existing session: {SESSION_ID}")
     else:
-        # Create a new sessiom with initial state
-        new_session = await session_service.create_session(
-                app_name = APP_NAME,
-                user_id = USER_ID,
-                state = initial_state,
-                )
-    
-        SESSION_ID = new_session.id
         print(f"Created new session: {SESSION_ID}")
         
-    # Create runner
-    runner = Runner(
-            app_name = APP_NAME,
-            agent = root_agent,
-            session_service = session_service, 
-    )
+    # The runner (and the agents) are created on the first query
+    runner = None
         
     print("Warm welcome to our beloved customers, what cookies you would like to bring home today?")
     print("º∙👩🏻₊˚🍪 ˚ෆ")
         
     while True:
-        # Customer 
-        user_input = input("You: ")
+        # Customer (read in a thread so the event loop is not blocked)
+        user_input = await asyncio.to_thread(input, "You: ")
         
         # Check if user wants to exit
         if user_input.lower() in ["exit", "quit"]:
             print("Thank you for choosing us today! We are looking forward to our next cookies 🤎.")
+            # Write back anything the session cache still holds
+            if hasattr(session_service, "close"):
+                await session_service.close()
+            flushTraces()
+            flushLogs()
             break
         
         # Clear session
@@ -78,6 +217,7 @@ async def main_async():
                 session_id = SESSION_ID,
             )
             
+            clearInteractions(APP_NAME, USER_ID, SESSION_ID)
             print("Session deleted.")
 
             # Generate new session with initial state
@@ -91,13 +231,12 @@ async def main_async():
             continue
         
             
-        # Update interaction history with the user's query
-        await add_user_query_to_history(
-            session_service, APP_NAME, USER_ID, SESSION_ID, user_input
-        )
+        if runner is None:
+            runner = build_runner(APP_NAME, session_service)
 
         # Process the user query through the agent
-        await call_agent_async(runner, USER_ID, SESSION_ID, user_input)
+        await run_turn(runner, USER_ID, SESSION_ID, user_input, stream=STREAM,
+                       on_delta=print_delta, on_response=print_response)
             
 if __name__ == "__main__":
     asyncio.run(main_async())
\ No newline at end of file
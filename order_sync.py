@@ -0,0 +1,58 @@
+"""
+Keeps the orders tables (agent/helpers/orderIndex.py) in step with the
+session store.
+
+    session_service = OrderIndexSessionService(DatabaseSessionService(...))
+
+Every event the wrapped service persists has its order state changes
+applied to `orders` / `order_items`, whichever tool, admin command or bulk
+import made them. main.py puts it right above the database, so under the
+session cache the tables follow what has been written back.
+"""
+import asyncio
+
+from google.adk.sessions import BaseSessionService
+
+from agent.helpers import dropSessionOrders, indexOrders, getLogger, logRecord, ERROR
+
+_log = getLogger("order_sync")
+
+
+class OrderIndexSessionService(BaseSessionService):
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def create_session(self, **kwargs):
+        session = await self.inner.create_session(**kwargs)
+        if session.state:
+            await asyncio.to_thread(indexOrders, session.app_name, session.user_id, session.id, session.state)
+        return session
+
+    async def get_session(self, **kwargs):
+        return await self.inner.get_session(**kwargs)
+
+    async def list_sessions(self, **kwargs):
+        return await self.inner.list_sessions(**kwargs)
+
+    async def delete_session(self, **kwargs):
+        await self.inner.delete_session(**kwargs)
+        await asyncio.to_thread(
+            dropSessionOrders, kwargs["app_name"], kwargs["user_id"], kwargs["session_id"]
+        )
+
+    async def append_event(self, session, event):
+        event = await self.inner.append_event(session, event)
+        delta = event.actions.state_delta if event.actions else None
+        if delta and not event.partial:
+            # In a thread: the session service's own connection may still
+            # hold the write lock on the event loop
+            try:
+                await asyncio.to_thread(indexOrders, session.app_name, session.user_id, session.id, delta)
+            except Exception as e:
+                logRecord(_log, ERROR, "Error indexing orders", session_id=session.id, error=str(e))
+        return event
+
+    async def close(self):
+        close = getattr(self.inner, "close", None)
+        if close:
+            await close()
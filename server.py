@@ -0,0 +1,285 @@
+"""
+Async HTTP / WebSocket front end, so one process serves many customers.
+
+All requests share one Runner and one session service. Turns go through a
+bounded queue served by a fixed number of worker tasks, and two turns of
+the same session never run at the same time.
+
+    python server.py            (or: uvicorn server:app --port 8000)
+
+    GET  /metrics    (Prometheus text, see agent/helpers/tracing.py)
+    POST /sessions   {"user_id": "..."}
+    POST /chat       {"user_id": "...", "session_id": "...", "message": "..."}
+    POST /sessions/release {"user_id": "...", "session_id": "..."}
+                     (supervisor.py, when a session moves to another worker)
+    POST /orders/import {"user_id": "...", "session_id": "...", "orders": "<CSV or JSON>"}
+                     (admin.py import-orders --server)
+    WS   /ws/{user_id}?session_id=...   (one text message per turn, the
+                                         answer is streamed as "delta"
+                                         messages then one "response")
+"""
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from agent.helpers import flushTraces, metricsText, schedulerMetricsText, flushLogs, getLogger, logRecord, WARNING
+from admin import place_orders
+from main import APP_NAME, build_runner, get_or_create_session, get_session_service
+from utils import run_turn
+
+_log = getLogger("server")
+
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "16"))
+MAX_PENDING_TURNS = int(os.getenv("MAX_PENDING_TURNS", "256"))
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30"))
+
+
+class QueueFullError(Exception):
+    """Raised when the turn queue is full or the server is shutting down."""
+
+
+class TurnScheduler:
+    """
+    Bounded queue of turns served by `concurrency` worker tasks.
+
+    A turn holds its session's lock from the moment it is queued until it
+    is answered, so turns of one session run strictly one after another
+    while different sessions run in parallel. A turn counts as pending
+    (against max_pending) from the moment it is submitted, including the
+    time it waits for its session's lock.
+    """
+
+    def __init__(self, runner, concurrency: int = MAX_CONCURRENT_TURNS, max_pending: int = MAX_PENDING_TURNS):
+        self.runner = runner
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.pending = 0
+        self.in_flight = 0
+        self.closing = False
+
+        self._workers = []
+        # Locks disappear on their own once no turn of the session is waiting
+        self._locks = weakref.WeakValueDictionary()
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    async def submit(self, user_id: str, session_id: str, query: str, **turn_kwargs):
+        """Queue one turn and wait for the agent's final response.
+
+        turn_kwargs (stream, on_delta, on_response, timings) are passed to run_turn.
+        """
+        if self.closing or self.pending >= self.max_pending:
+            raise QueueFullError("Too many pending requests, please retry shortly.")
+
+        self.pending += 1
+        try:
+            async with self._lock(session_id):
+                # Shutdown may have drained the queue while this turn waited
+                if self.closing:
+                    raise QueueFullError("Server is shutting down.")
+                future = asyncio.get_running_loop().create_future()
+                self.queue.put_nowait((user_id, session_id, query, turn_kwargs, future))
+                return await future
+        finally:
+            self.pending -= 1
+
+    async def _worker(self):
+        while True:
+            user_id, session_id, query, turn_kwargs, future = await self.queue.get()
+            self.in_flight += 1
+            try:
+                if not future.done():
+                    response = await run_turn(self.runner, user_id, session_id, query, **turn_kwargs)
+                    if not future.done():
+                        future.set_result(response)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            except BaseException:
+                # Cancelled mid-turn (shutdown): answer instead of leaving the client waiting
+                if not future.done():
+                    future.set_exception(QueueFullError("Server is shutting down."))
+                raise
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    async def shutdown(self, grace: float = SHUTDOWN_GRACE_SECONDS):
+        """Stop taking turns, let queued ones finish, then stop the workers."""
+        self.closing = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=grace)
+        except asyncio.TimeoutError:
+            logRecord(_log, WARNING, "Shutdown: dropping pending turns", pending=self.queue.qsize())
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        while not self.queue.empty():
+            *_, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(QueueFullError("Server is shutting down."))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    session_service = get_session_service()
+    app.state.session_service = session_service
+    app.state.scheduler = TurnScheduler(build_runner(APP_NAME, session_service))
+    app.state.scheduler.start()
+    yield
+    await app.state.scheduler.shutdown()
+    if hasattr(session_service, "close"):
+        await session_service.close()
+    flushTraces()
+    flushLogs()
+
+
+app = FastAPI(title="innhi cookies customer service", lifespan=lifespan)
+
+
+class SessionRequest(BaseModel):
+    user_id: str
+
+
+class ChatRequest(BaseModel):
+    user_id: str
+    message: str
+    session_id: Optional[str] = None
+
+
+async def _resolveSession(user_id: str, session_id: Optional[str]) -> str:
+    if session_id:
+        return session_id
+    session_id, _ = await get_or_create_session(app.state.session_service, APP_NAME, user_id)
+    return session_id
+
+
+@app.get("/health")
+async def health():
+    scheduler = app.state.scheduler
+    return {
+        "status": "closing" if scheduler.closing else "ok",
+        "pending": scheduler.pending,
+        "in_flight": scheduler.in_flight,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Span latency histograms (p50/p95/p99), token counts and queue gauges, Prometheus text format."""
+    scheduler = app.state.scheduler
+    return metricsText() + schedulerMetricsText() + (
+        "# TYPE turn_queue_pending gauge\n"
+        f"turn_queue_pending {scheduler.queue.qsize()}\n"
+        "# TYPE turn_pending gauge\n"
+        f"turn_pending {scheduler.pending}\n"
+        "# TYPE turn_in_flight gauge\n"
+        f"turn_in_flight {scheduler.in_flight}\n"
+    )
+
+
+class ReleaseRequest(BaseModel):
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+@app.post("/sessions/release")
+async def release_session(request: ReleaseRequest):
+    """Flush and forget a cached session (or all of them) now served by another worker."""
+    session_service = app.state.session_service
+    if request.session_id is not None and not request.user_id:
+        raise HTTPException(status_code=422, detail="user_id is required to release a session.")
+    if request.session_id is None:
+        if hasattr(session_service, "invalidate_all"):
+            await session_service.invalidate_all()
+        return {"released": "all"}
+
+    # Waits for the session's queued turns to finish first
+    async with app.state.scheduler._lock(request.session_id):
+        if hasattr(session_service, "invalidate"):
+            await session_service.invalidate(APP_NAME, request.user_id, request.session_id)
+    return {"released": request.session_id}
+
+
+class ImportRequest(BaseModel):
+    user_id: str
+    orders: str
+    session_id: Optional[str] = None
+
+
+@app.post("/orders/import")
+async def import_orders(request: ImportRequest):
+    """Place a batch of orders through this worker's session cache, between the session's turns."""
+    session_id = await _resolveSession(request.user_id, request.session_id)
+    async with app.state.scheduler._lock(session_id):
+        try:
+            return await place_orders(app.state.session_service, request.user_id, session_id, request.orders)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/sessions")
+async def open_session(request: SessionRequest):
+    session_id, continued = await get_or_create_session(
+        app.state.session_service, APP_NAME, request.user_id
+    )
+    return {"session_id": session_id, "continued": continued}
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    session_id = await _resolveSession(request.user_id, request.session_id)
+    try:
+        response = await app.state.scheduler.submit(request.user_id, session_id, request.message)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return {"session_id": session_id, "response": response}
+
+
+@app.websocket("/ws/{user_id}")
+async def chat_socket(websocket: WebSocket, user_id: str, session_id: Optional[str] = None):
+    await websocket.accept()
+    session_id = await _resolveSession(user_id, session_id)
+    await websocket.send_json({"type": "session", "session_id": session_id})
+
+    async def send_delta(text):
+        await websocket.send_json({"type": "delta", "text": text})
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            timings = {}
+            try:
+                response = await app.state.scheduler.submit(
+                    user_id, session_id, message,
+                    stream=True, on_delta=send_delta, timings=timings,
+                )
+            except QueueFullError as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
+            await websocket.send_json({"type": "response", "response": response, **timings})
+    except WebSocketDisconnect:
+        pass
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "8000")))
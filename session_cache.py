@@ -0,0 +1,281 @@
+"""
+Write-back in-memory session cache over another session service.
+
+    session_service = CachingSessionService(DatabaseSessionService(db_url=db_url))
+
+Hot sessions are kept in memory (LRU, bounded by session count and total
+cached events), so get_session after the first load never touches SQLite
+and a process always reads its own writes. append_event updates the cached
+session right away and the event is written to the wrapped service in the
+background, at most `flush_interval` seconds later (0 = write-through).
+
+A write the wrapped service rejects (e.g. StaleSessionError after another
+process wrote the session) is retried on a freshly loaded copy. After
+MAX_FLUSH_ATTEMPTS failures in a row the session's unsaved events are
+dropped and the session is reloaded from storage on its next read.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+from google.adk.sessions import BaseSessionService
+
+from agent.helpers import getLogger, logRecord, ERROR
+
+_log = getLogger("session_cache")
+
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class _Entry:
+    def __init__(self, session, backing):
+        # What callers get, always up to date
+        self.session = session
+        # The wrapped service's own copy, used to persist pending events
+        self.backing = backing
+        self.pending = []
+        self.failures = 0
+        self.lock = asyncio.Lock()
+
+
+class CachingSessionService(BaseSessionService):
+    """
+    Same interface as the wrapped session service, plus flush(),
+    flush_session(), invalidate(), invalidate_all(), peek() and close().
+
+    Sessions returned by get_session are the cached objects themselves
+    (no copy), which is what makes reads cheap. Turns of one session must
+    therefore not run concurrently, as the server's per-session locks
+    already guarantee.
+
+    Args:
+        inner: the persistent session service (e.g. DatabaseSessionService)
+        max_sessions: LRU capacity in sessions
+        max_events: LRU capacity in cached events over all sessions
+        flush_interval: durability window in seconds
+    """
+
+    def __init__(self, inner, max_sessions: int = 1000, max_events: int = 100_000, flush_interval: float = 1.0):
+        self.inner = inner
+        self.max_sessions = max_sessions
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self.stats = {"hits": 0, "misses": 0, "flushed_events": 0, "flush_errors": 0, "lost_events": 0}
+
+        self._entries = OrderedDict()
+        self._cached_events = 0
+        self._flush_task = None
+
+    @staticmethod
+    def _key(app_name, user_id, session_id):
+        return (app_name, user_id, session_id)
+
+    def _store(self, backing):
+        key = self._key(backing.app_name, backing.user_id, backing.id)
+        entry = _Entry(backing.model_copy(deep=True), backing)
+        # The backing copy only needs its state, not the event history
+        backing.events = []
+        old = self._entries.pop(key, None)
+        if old:
+            self._cached_events -= len(old.session.events)
+        self._entries[key] = entry
+        self._cached_events += len(entry.session.events)
+        return entry
+
+    async def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_sessions or self._cached_events > self.max_events
+        ):
+            key, entry = next(iter(self._entries.items()))
+            # Nothing is dropped before it is persisted
+            if entry.pending:
+                await self._flushEntry(entry)
+                if entry.pending:
+                    break
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                self._cached_events -= len(entry.session.events)
+
+    async def create_session(self, *, app_name: str, user_id: str, state=None, session_id=None):
+        backing = await self.inner.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        entry = self._store(backing)
+        await self._evict()
+        return entry.session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None):
+        key = self._key(app_name, user_id, session_id)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.stats["misses"] += 1
+            backing = await self.inner.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+            if backing is None:
+                return None
+            entry = self._store(backing)
+            await self._evict()
+        else:
+            self.stats["hits"] += 1
+            self._entries.move_to_end(key)
+
+        session = entry.session
+        if config is None:
+            return session
+
+        # Filtered views are copies, the cached session keeps every event
+        events = session.events
+        if getattr(config, "after_timestamp", None):
+            events = [event for event in events if event.timestamp >= config.after_timestamp]
+        if getattr(config, "num_recent_events", None):
+            events = events[-config.num_recent_events:]
+        return session.model_copy(update={"events": list(events)})
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None):
+        response = await self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+        # Show cached state of sessions whose writes are not flushed yet
+        for i, session in enumerate(response.sessions):
+            entry = self._entries.get(self._key(session.app_name, session.user_id, session.id))
+            if entry and entry.pending:
+                response.sessions[i] = entry.session.model_copy(update={"events": []})
+        return response
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str):
+        entry = self._entries.pop(self._key(app_name, user_id, session_id), None)
+        if entry:
+            self._cached_events -= len(entry.session.events)
+            entry.pending.clear()
+        await self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def append_event(self, session, event):
+        if event.partial:
+            return event
+
+        key = self._key(session.app_name, session.user_id, session.id)
+        entry = self._entries.get(key)
+        if entry is None:
+            # Evicted mid-turn: the caller's copy is older than what was
+            # flushed since, so continue on a freshly loaded one
+            backing = await self.inner.get_session(
+                app_name=session.app_name, user_id=session.user_id, session_id=session.id
+            )
+            if backing is None:
+                return await self.inner.append_event(session, event)
+            entry = self._store(backing)
+
+        event = await super().append_event(session, event)
+        if session is not entry.session:
+            await super().append_event(entry.session, event)
+        entry.session.last_update_time = event.timestamp
+        self._cached_events += 1
+        self._entries.move_to_end(key)
+
+        entry.pending.append(event)
+        if self.flush_interval <= 0:
+            error = await self._flushEntry(entry)
+            if error is not None:
+                raise error
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flushLater())
+
+        await self._evict()
+        return event
+
+    async def _flushEntry(self, entry):
+        # Returns the error that made the entry drop its unsaved events
+        async with entry.lock:
+            while entry.pending:
+                event = entry.pending[0]
+                try:
+                    await self.inner.append_event(entry.backing, event)
+                except Exception as e:
+                    self.stats["flush_errors"] += 1
+                    entry.failures += 1
+                    logRecord(_log, ERROR, "Error flushing session", session_id=entry.backing.id,
+                              attempt=entry.failures, error=str(e))
+                    if entry.failures >= MAX_FLUSH_ATTEMPTS:
+                        self._drop(entry)
+                        return e
+                    # Someone else may have written the session: apply the
+                    # pending events on top of its current version
+                    try:
+                        backing = await self.inner.get_session(
+                            app_name=entry.backing.app_name,
+                            user_id=entry.backing.user_id,
+                            session_id=entry.backing.id,
+                        )
+                    except Exception:
+                        return None
+                    if backing is None:
+                        self._drop(entry)
+                        return e
+                    backing.events = []
+                    entry.backing = backing
+                    continue
+                entry.pending.pop(0)
+                entry.failures = 0
+                self.stats["flushed_events"] += 1
+            entry.backing.events = []
+        return None
+
+    def _drop(self, entry):
+        # Give up on the unsaved events, the next read reloads the session
+        key = self._key(entry.backing.app_name, entry.backing.user_id, entry.backing.id)
+        logRecord(_log, ERROR, "Dropped unsaved session events", session_id=entry.backing.id,
+                  events=len(entry.pending))
+        self.stats["lost_events"] += len(entry.pending)
+        entry.pending.clear()
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+            self._cached_events -= len(entry.session.events)
+
+    async def _flushLater(self):
+        await asyncio.sleep(self.flush_interval)
+        # Shielded so close() can't cancel a write halfway through
+        await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Persist every pending event now."""
+        for entry in list(self._entries.values()):
+            if entry.pending:
+                await self._flushEntry(entry)
+
+    async def flush_session(self, app_name: str, user_id: str, session_id: str):
+        entry = self._entries.get(self._key(app_name, user_id, session_id))
+        if entry and entry.pending:
+            await self._flushEntry(entry)
+
+    async def invalidate(self, app_name: str, user_id: str, session_id: str):
+        """Flush the session and drop it, so the next read reloads it from storage."""
+        key = self._key(app_name, user_id, session_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        await self._flushEntry(entry)
+        if not entry.pending and self._entries.get(key) is entry:
+            del self._entries[key]
+            self._cached_events -= len(entry.session.events)
+
+    async def invalidate_all(self):
+        """Flush every session and empty the cache."""
+        await self.flush()
+        for key, entry in list(self._entries.items()):
+            if not entry.pending and self._entries.get(key) is entry:
+                del self._entries[key]
+                self._cached_events -= len(entry.session.events)
+
+    def peek(self, app_name: str, user_id: str, session_id: str):
+        """The cached session, or None, without loading anything."""
+        entry = self._entries.get(self._key(app_name, user_id, session_id))
+        return entry.session if entry else None
+
+    async def close(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        close = getattr(self.inner, "close", None)
+        if close:
+            await close()
@@ -0,0 +1,496 @@
+"""
+Multi-process front end: N server.py workers behind one router.
+
+    python supervisor.py --workers 4 --port 8000
+
+Each worker is a uvicorn process serving server:app on
+127.0.0.1:WORKER_BASE_PORT + i, with its own Runner, session cache and
+model scheduler, all over the same session database. The supervisor serves
+the same API as server.py and sends every turn to the worker owning its
+session on a consistent hash ring of (app_name, user_id, session_id), so a
+session's turns always reach the same worker and its warm caches.
+
+- Health: every HEALTH_INTERVAL seconds each worker's /health is checked. A
+  worker failing HEALTH_FAILURES checks in a row leaves the ring, and one
+  whose process died is restarted. A worker that comes back empties its
+  session cache before it rejoins.
+- Rebalancing: when workers join or leave (POST /workers {"count": n}),
+  only the sessions hashed to the changed ring segments move. Before a
+  moved session's next turn, its previous worker finishes the queued turns
+  of the session, flushes it and drops it from its cache
+  (POST /sessions/release), so the new worker reads it fresh.
+
+    GET  /health     workers and their state
+    POST /orders/import   sent to the worker owning the session, like a turn
+    GET  /metrics    routing counters (the workers serve their own /metrics)
+    POST /workers    {"count": n} scale out or in
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+import websockets
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from agent.helpers import configureLogging, getLogger, logRecord, WARNING, ERROR
+
+APP_NAME = "Customer_Service_Agent"
+
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 2)))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+# Points per worker on the hash ring, more points spread sessions more evenly
+VIRTUAL_NODES = 128
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "2"))
+HEALTH_FAILURES = 3
+STARTUP_TIMEOUT = float(os.getenv("WORKER_STARTUP_TIMEOUT", "60"))
+TURN_TIMEOUT = float(os.getenv("TURN_TIMEOUT", "300"))
+# Sessions whose last worker is remembered. Larger than what all workers'
+# session caches hold together, so a session still cached on a worker is
+# always released before it moves
+OWNER_TABLE_SIZE = 100_000
+
+_log = getLogger("supervisor")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing: adding or removing a node only moves the keys of its segments."""
+
+    def __init__(self, replicas: int = VIRTUAL_NODES):
+        self.replicas = replicas
+        self.nodes = set()
+        self._points = []
+        self._owners = {}
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def lookup(self, key: str):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def sessionKey(user_id: str, session_id: str = "") -> str:
+    return f"{APP_NAME}\0{user_id}\0{session_id}"
+
+
+class Worker:
+    def __init__(self, worker_id: int, port: int):
+        self.id = worker_id
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = None
+        self.healthy = False
+        self.failures = 0
+        self.restarts = 0
+        self.routed = 0
+        # Set while the worker drains on scale-in
+        self.stopping = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        env = dict(os.environ, WORKER_ID=str(self.id))
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning",
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+
+    async def stop(self, grace: float = 35.0):
+        """SIGTERM (the worker drains its queue and flushes its cache), then SIGKILL."""
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=grace)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+class Supervisor:
+    def __init__(self, count: int = WORKERS, base_port: int = WORKER_BASE_PORT):
+        self.count = count
+        self.base_port = base_port
+        self.workers = {}
+        self.ring = HashRing()
+        self.client = None
+        self.stats = {"routed": 0, "rebalanced": 0, "restarts": 0, "unavailable": 0}
+
+        self._owners = OrderedDict()
+        # Sessions being released by their previous worker
+        self._moving = {}
+        self._next_id = 0
+        self._health_task = None
+        self._scale_lock = asyncio.Lock()
+
+    async def start(self):
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(TURN_TIMEOUT, connect=5.0))
+        await self.scale(self.count)
+        self._health_task = asyncio.create_task(self._healthLoop())
+
+    async def shutdown(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for worker in list(self.workers.values()):
+            self.ring.remove(worker.id)
+        await asyncio.gather(*(worker.stop() for worker in self.workers.values()))
+        await self.client.aclose()
+
+    async def scale(self, count: int):
+        """Run `count` workers: new ones join the ring once healthy, removed ones drain first."""
+        async with self._scale_lock:
+            new = []
+            while len(self.workers) < count:
+                worker = Worker(self._next_id, self.base_port + self._next_id)
+                self._next_id += 1
+                self.workers[worker.id] = worker
+                new.append(worker)
+            await asyncio.gather(*(self._launch(worker) for worker in new))
+
+            removed = [self.workers[worker_id] for worker_id in
+                       sorted(self.workers, reverse=True)[:max(0, len(self.workers) - count)]]
+            for worker in removed:
+                self.ring.remove(worker.id)
+                worker.healthy = False
+                worker.stopping = asyncio.create_task(worker.stop())
+            await asyncio.gather(*(worker.stopping for worker in removed))
+            for worker in removed:
+                del self.workers[worker.id]
+            self.count = count
+
+    async def _launch(self, worker: Worker):
+        await worker.start()
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if not worker.alive:
+                break
+            if await self._check(worker):
+                worker.healthy = True
+                worker.failures = 0
+                self.ring.add(worker.id)
+                return
+            await asyncio.sleep(0.2)
+        logRecord(_log, ERROR, "Worker did not start", worker=worker.id, port=worker.port)
+
+    async def _check(self, worker: Worker) -> bool:
+        try:
+            response = await self.client.get(f"{worker.url}/health", timeout=2.0)
+            return response.status_code == 200 and response.json().get("status") == "ok"
+        except (httpx.HTTPError, ValueError):
+            return False
+
+    async def _healthLoop(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            for worker in list(self.workers.values()):
+                try:
+                    await self._checkWorker(worker)
+                except Exception as e:
+                    logRecord(_log, ERROR, "Health check failed", worker=worker.id, error=str(e))
+
+    async def _checkWorker(self, worker: Worker):
+        if worker.stopping is not None:
+            return
+        if not worker.alive:
+            # Crashed: its sessions go to the other workers until it is back
+            logRecord(_log, WARNING, "Worker exited, restarting", worker=worker.id,
+                      returncode=worker.process.returncode)
+            self.ring.remove(worker.id)
+            worker.healthy = False
+            worker.restarts += 1
+            self.stats["restarts"] += 1
+            await self._launch(worker)
+            return
+
+        if await self._check(worker):
+            worker.failures = 0
+            if not worker.healthy:
+                # Sessions it cached may have moved and changed meanwhile
+                await self.client.post(f"{worker.url}/sessions/release", json={})
+                worker.healthy = True
+                self.ring.add(worker.id)
+            return
+
+        worker.failures += 1
+        if worker.healthy and worker.failures >= HEALTH_FAILURES:
+            logRecord(_log, WARNING, "Worker failed its health checks, taking it out", worker=worker.id,
+                      failures=worker.failures)
+            worker.healthy = False
+            self.ring.remove(worker.id)
+
+    async def route(self, user_id: str, session_id: str = "") -> Worker:
+        """The worker for a session, releasing it from the worker it had before."""
+        key = sessionKey(user_id, session_id)
+        worker_id = self.ring.lookup(key)
+        if worker_id is None:
+            self.stats["unavailable"] += 1
+            raise HTTPException(status_code=503, detail="No worker available.", headers={"Retry-After": "1"})
+
+        if session_id:
+            self._claim(worker_id, user_id, session_id)
+            # Other turns of a moving session wait for the release too
+            moving = self._moving.get(key)
+            if moving is not None:
+                try:
+                    await asyncio.shield(moving)
+                finally:
+                    if moving.done() and self._moving.get(key) is moving:
+                        del self._moving[key]
+
+        worker = self.workers[worker_id]
+        worker.routed += 1
+        self.stats["routed"] += 1
+        return worker
+
+    def _claim(self, worker_id: int, user_id: str, session_id: str):
+        # Record the worker that now caches the session, releasing the previous one
+        key = sessionKey(user_id, session_id)
+        previous = self._owners.pop(key, None)
+        self._owners[key] = worker_id
+        if len(self._owners) > OWNER_TABLE_SIZE:
+            self._owners.popitem(last=False)
+        if previous is not None and previous != worker_id:
+            self._moving[key] = asyncio.create_task(self._release(previous, user_id, session_id))
+
+    async def openSession(self, user_id: str) -> dict:
+        """
+        Open (or continue) a user's session on some worker.
+
+        The session id isn't known before, so the worker is picked by the
+        user alone. It caches the session from then on, so it is recorded as
+        the owner: the first turn, routed by the session's own key, releases
+        it there if the ring puts the session on another worker.
+        """
+        worker = await self.route(user_id)
+        result = await self.post(worker, "/sessions", {"user_id": user_id})
+        self._claim(worker.id, user_id, result["session_id"])
+        return result
+
+    async def _release(self, worker_id: int, user_id: str, session_id: str):
+        worker = self.workers.get(worker_id)
+        # A stopped worker flushed its cache on the way out
+        if worker is None or not worker.alive:
+            return
+        if worker.stopping is not None:
+            await asyncio.shield(worker.stopping)
+            return
+        try:
+            await self.client.post(f"{worker.url}/sessions/release",
+                                   json={"user_id": user_id, "session_id": session_id})
+            self.stats["rebalanced"] += 1
+        except httpx.HTTPError as e:
+            logRecord(_log, WARNING, "Could not release session", worker=worker_id, session_id=session_id,
+                      error=str(e))
+
+    async def post(self, worker: Worker, path: str, payload: dict) -> dict:
+        try:
+            response = await self.client.post(f"{worker.url}{path}", json=payload)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=503, detail=f"Worker {worker.id} unavailable: {e}",
+                                headers={"Retry-After": "1"})
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"),
+                                headers={"Retry-After": response.headers.get("retry-after", "1")})
+        return response.json()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.supervisor = Supervisor(app.state.workers if hasattr(app.state, "workers") else WORKERS)
+    await app.state.supervisor.start()
+    yield
+    await app.state.supervisor.shutdown()
+
+
+app = FastAPI(title="innhi cookies customer service (workers)", lifespan=lifespan)
+
+
+class SessionRequest(BaseModel):
+    user_id: str
+
+
+class ChatRequest(BaseModel):
+    user_id: str
+    message: str
+    session_id: Optional[str] = None
+
+
+class ScaleRequest(BaseModel):
+    count: int
+
+
+class ImportRequest(BaseModel):
+    user_id: str
+    orders: str
+    session_id: Optional[str] = None
+
+
+async def _resolveSession(user_id: str, session_id: Optional[str]) -> str:
+    if session_id:
+        return session_id
+    return (await app.state.supervisor.openSession(user_id))["session_id"]
+
+
+@app.get("/health")
+async def health():
+    supervisor = app.state.supervisor
+    return {
+        "status": "ok" if supervisor.ring.nodes else "unavailable",
+        "workers": [
+            {"id": worker.id, "port": worker.port, "healthy": worker.healthy, "alive": worker.alive,
+             "restarts": worker.restarts, "routed": worker.routed}
+            for worker in supervisor.workers.values()
+        ],
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    supervisor = app.state.supervisor
+    lines = ["# TYPE supervisor_worker_up gauge"]
+    lines += [f'supervisor_worker_up{{worker="{worker.id}"}} {int(worker.healthy)}'
+              for worker in supervisor.workers.values()]
+    lines.append("# TYPE supervisor_routed_total counter")
+    lines += [f'supervisor_routed_total{{worker="{worker.id}"}} {worker.routed}'
+              for worker in supervisor.workers.values()]
+    for name in ("rebalanced", "restarts", "unavailable"):
+        lines += [f"# TYPE supervisor_{name}_total counter", f"supervisor_{name}_total {supervisor.stats[name]}"]
+    return "\n".join(lines) + "\n"
+
+
+@app.post("/workers")
+async def scale_workers(request: ScaleRequest):
+    if request.count < 1:
+        raise HTTPException(status_code=400, detail="At least one worker is needed.")
+    await app.state.supervisor.scale(request.count)
+    return await health()
+
+
+@app.post("/sessions")
+async def open_session(request: SessionRequest):
+    return await app.state.supervisor.openSession(request.user_id)
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    session_id = await _resolveSession(request.user_id, request.session_id)
+    supervisor = app.state.supervisor
+    worker = await supervisor.route(request.user_id, session_id)
+    return await supervisor.post(worker, "/chat", {
+        "user_id": request.user_id, "session_id": session_id, "message": request.message,
+    })
+
+
+@app.post("/orders/import")
+async def import_orders(request: ImportRequest):
+    session_id = await _resolveSession(request.user_id, request.session_id)
+    supervisor = app.state.supervisor
+    worker = await supervisor.route(request.user_id, session_id)
+    return await supervisor.post(worker, "/orders/import", {
+        "user_id": request.user_id, "session_id": session_id, "orders": request.orders,
+    })
+
+
+@app.websocket("/ws/{user_id}")
+async def chat_socket(websocket: WebSocket, user_id: str, session_id: Optional[str] = None):
+    await websocket.accept()
+    supervisor = app.state.supervisor
+    try:
+        session_id = await _resolveSession(user_id, session_id)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "message": e.detail})
+        await websocket.close()
+        return
+    await websocket.send_json({"type": "session", "session_id": session_id})
+
+    # Every turn is routed again, so the socket follows its session to a new worker
+    upstream, upstream_worker = None, None
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                worker = await supervisor.route(user_id, session_id)
+                if worker is not upstream_worker:
+                    if upstream is not None:
+                        await upstream.close()
+                    upstream = await websockets.connect(
+                        f"ws://127.0.0.1:{worker.port}/ws/{user_id}?session_id={session_id}"
+                    )
+                    upstream_worker = worker
+                    await upstream.recv()   # the worker's "session" message
+                await upstream.send(message)
+                # Relay the deltas until the turn's response or error
+                while True:
+                    reply = await upstream.recv()
+                    await websocket.send_text(reply)
+                    if json.loads(reply).get("type") in ("response", "error"):
+                        break
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "message": e.detail})
+            except (OSError, websockets.WebSocketException) as e:
+                upstream, upstream_worker = None, None
+                await websocket.send_json({"type": "error", "message": f"Worker unavailable: {e}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if upstream is not None:
+            await upstream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run server.py workers behind a session-sticky router")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    configureLogging(
+        level=os.getenv("LOG_LEVEL", "WARNING"),
+        path=os.getenv("LOG_FILE") or None,
+        sampling=os.getenv("LOG_SAMPLE") or None,
+    )
+
+    import uvicorn
+
+    app.state.workers = args.workers
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
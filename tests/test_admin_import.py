@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import admin
+from agent.helpers import database, getCatalog, readInteractions, reservedSlot
+
+USER, SESSION = "ACME", "session"
+
+
+class FailingSessionService:
+    """Hands out one session, but every append_event fails."""
+
+    def __init__(self):
+        self.session = SimpleNamespace(state={})
+
+    async def get_session(self, app_name, user_id, session_id):
+        return self.session
+
+    async def append_event(self, session, event):
+        raise RuntimeError("database is locked")
+
+
+@pytest.fixture(autouse=True)
+def admin_db(tmp_path):
+    previous = database.DB_PATH
+    database.setDatabasePath(str(tmp_path / "admin.db"))
+    yield
+    database.setDatabasePath(previous)
+
+
+def test_failed_append_releases_the_reservations(monkeypatch):
+    product = next(iter(getCatalog().products.values()))["name"]
+    delivery = (datetime.now() + timedelta(days=2)).replace(hour=15, minute=0).strftime("%d.%m.%Y %H:%M")
+    text = ("customer,product,quantity,delivery_time,phone,address\n"
+            f"Yen Nhi,{product},2,{delivery},0908353308,\"12 Nguyen Trai, Ward 9, District 8\"\n")
+
+    placed = []
+    ingest = admin.ingestOrders
+
+    async def recordingIngest(*args, **kwargs):
+        result = await ingest(*args, **kwargs)
+        placed.extend(order["order_id"] for order in result["results"] if order["status"] == "success")
+        return result
+
+    monkeypatch.setattr(admin, "ingestOrders", recordingIngest)
+    with pytest.raises(RuntimeError):
+        asyncio.run(admin.place_orders(FailingSessionService(), USER, SESSION, text))
+
+    assert placed
+    assert all(reservedSlot(order_id) is None for order_id in placed)
+    assert readInteractions(admin.APP_NAME, USER, SESSION)["entries"] == []
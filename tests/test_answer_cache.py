@@ -0,0 +1,15 @@
+from agent.helpers.answerCache import AnswerCache
+
+
+def test_paraphrase_hits():
+    cache = AnswerCache()
+    cache.put("How long before delivery do I need to order?", "At least 3-4 hours.")
+    assert cache.get("how long before delivery do i need to order") == "At least 3-4 hours."
+
+
+def test_different_numbers_miss():
+    cache = AnswerCache()
+    cache.put("Can I get a refund if I cancel 5 hours before delivery?", "Yes, 100% refund.")
+    assert cache.get("Can I get a refund if I cancel 2 hours before delivery?") is None
+    assert cache.get("Can I get a refund if I cancel two hours before delivery?") is None
+    assert cache.get("Can I get a refund if I cancel five hours before delivery?") == "Yes, 100% refund."
@@ -0,0 +1,32 @@
+import pytest
+
+from agent.helpers.catalog import Catalog
+
+PRODUCTS = [
+    {"sku": "CHOC", "name": "Cookies Chocolate", "price": 2.5, "aliases": ["choco"]},
+    {"sku": "MATCHA", "name": "Cookies Matcha", "price": 3},
+]
+
+
+def test_prices_from_catalog():
+    priced = Catalog(PRODUCTS).price([
+        {"name": "choco", "quantity": 2, "price": 0},
+        {"name": "matcha cookies", "quantity": "3"},
+    ])
+    assert [line["sku"] for line in priced["products"]] == ["CHOC", "MATCHA"]
+    assert priced["total"] == 14
+    assert priced["unknown"] == [] and priced["invalid"] == []
+
+
+@pytest.mark.parametrize("quantity", [None, 0, -1, 1.5, "two", "", True])
+def test_invalid_quantity_rejected(quantity):
+    priced = Catalog(PRODUCTS).price([{"name": "choco", "quantity": quantity}])
+    assert priced["products"] == []
+    assert priced["invalid"] == ["choco"]
+
+
+@pytest.mark.parametrize("name", ["white chocolate", "strawberry chocolate", "cookies"])
+def test_unknown_names_are_not_guessed(name):
+    priced = Catalog(PRODUCTS).price([{"name": name, "quantity": 1}])
+    assert priced["products"] == []
+    assert priced["unknown"] == [name]
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from agent.helpers import CHECKPOINT_KEY, KEEP_TURNS, OrderStore, budgetContext
+
+ORDER = {"order_id": "1a2b3c4d", "products": [{"name": "Matcha cookie", "quantity": 2}],
+         "delivery_time": "19.10.2026 15:00", "address": "District 8", "purchased_time": "18.10.2026 10:00",
+         "temp_total_not_include_shipping_fee": 100000}
+
+
+def budget(turns: int, state: dict = None) -> LlmRequest:
+    if state is None:
+        state = {}
+        OrderStore(state).add(dict(ORDER))
+    contents = []
+    for turn in range(turns):
+        contents.append(types.Content(role="user", parts=[types.Part(text=f"question {turn}")]))
+        contents.append(types.Content(role="model", parts=[types.Part(text=f"answer {turn}")]))
+    contents.append(types.Content(role="user", parts=[types.Part(text="Where is my order?")]))
+
+    request = LlmRequest(contents=contents, config=types.GenerateContentConfig())
+    budgetContext(SimpleNamespace(agent_name="Order", state=state, invocation_id="turn"), request)
+    return request
+
+
+def instruction(request: LlmRequest) -> str:
+    return str(request.config.system_instruction or "")
+
+
+def test_no_digest_while_the_whole_history_is_sent():
+    assert "1a2b3c4d" not in instruction(budget(2))
+
+
+def test_digest_once_turns_are_left_out():
+    request = budget(KEEP_TURNS + 3)
+    assert "latest orders" in instruction(request)
+    assert "1a2b3c4d" in instruction(request)
+
+
+def test_digest_after_compaction():
+    state = {CHECKPOINT_KEY: {"summary": "user: ordered cookies"}}
+    OrderStore(state).add(dict(ORDER))
+    assert "1a2b3c4d" in instruction(budget(2, state))
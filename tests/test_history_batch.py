@@ -0,0 +1,40 @@
+import pytest
+
+from agent.helpers import database
+from agent.helpers.historyLog import HistoryBatch, appendInteraction, readInteractions
+
+KEY = ("app", "user", "session")
+
+
+@pytest.fixture(autouse=True)
+def history_db(tmp_path):
+    previous = database.DB_PATH
+    database.setDatabasePath(str(tmp_path / "history.db"))
+    yield
+    database.setDatabasePath(previous)
+
+
+def actions() -> list:
+    return [entry["action"] for entry in readInteractions(*KEY)["entries"]]
+
+
+def test_rollback_to_savepoint_keeps_earlier_rows():
+    with HistoryBatch():
+        appendInteraction(*KEY, {"action": "user_query"})
+        with HistoryBatch() as turn:
+            mark = turn.savepoint()
+            appendInteraction(*KEY, {"action": "purchase"})
+            turn.rollback(mark)
+            appendInteraction(*KEY, {"action": "agent_response"})
+
+    assert actions() == ["user_query", "agent_response"]
+
+
+def test_rollback_drops_the_batch():
+    with HistoryBatch():
+        appendInteraction(*KEY, {"action": "user_query"})
+        with HistoryBatch() as turn:
+            turn.rollback()
+            appendInteraction(*KEY, {"action": "agent_response"})
+
+    assert actions() == []
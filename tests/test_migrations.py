@@ -0,0 +1,67 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from agent.helpers import database
+
+EVENTS = "CREATE TABLE events (app_name, user_id, session_id, id, timestamp)"
+SESSIONS = "CREATE TABLE sessions (app_name, user_id, id, update_time)"
+ADK_INDEX = ("CREATE INDEX idx_events_app_user_session_ts_id "
+             "ON events (app_name, user_id, session_id, timestamp DESC, id DESC)")
+
+
+def indexes(path) -> set:
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def build(path, *statements):
+    with sqlite3.connect(path) as conn:
+        for sql in statements:
+            conn.execute(sql)
+
+
+def test_waits_for_the_tables(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    assert database.migrate(path) == []
+
+    build(path, EVENTS, SESSIONS)
+    assert len(database.migrate(path)) == len(database.MIGRATIONS)
+    assert "ix_events_session_timestamp" in indexes(path)
+
+
+def test_skips_the_index_the_session_service_creates(tmp_path):
+    path = str(tmp_path / "adk.db")
+    build(path, EVENTS, SESSIONS, ADK_INDEX)
+
+    database.migrate(path)
+    assert "ix_events_session_timestamp" not in indexes(path)
+    assert "ix_sessions_update_time" in indexes(path)
+
+
+def test_drops_the_index_an_earlier_run_created(tmp_path):
+    path = str(tmp_path / "upgraded.db")
+    build(path, EVENTS, SESSIONS)
+    database.migrate(path)
+
+    build(path, ADK_INDEX)
+    database.migrate(path)
+    assert "ix_events_session_timestamp" not in indexes(path)
+
+
+def test_session_service_migrates_a_new_database(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from main import make_session_service
+
+    path = tmp_path / "sessions.db"
+
+    async def scenario():
+        service = make_session_service(f"sqlite+aiosqlite:///{path}")
+        try:
+            await service.create_session(app_name="app", user_id="user")
+        finally:
+            await service.close()
+
+    asyncio.run(scenario())
+    assert {"ix_sessions_user_update_time", "ix_sessions_update_time"} <= indexes(path)
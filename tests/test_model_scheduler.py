@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from agent.helpers import modelScheduler
+from agent.helpers.modelScheduler import ModelBusyError, ModelScheduler, modelLane
+from agent.scheduledModel import ScheduledModel
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class FlakyLlm(BaseLlm):
+    """Fails with `error` `failures` times, then answers."""
+
+    failures: int = 0
+    error: type = RateLimited
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("quota exceeded")
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text="ok")]))
+
+
+def test_interactive_calls_go_before_batch_calls():
+    async def scenario():
+        scheduler = ModelScheduler(requests_per_minute=None, tokens_per_minute=None, max_concurrent=1)
+        await scheduler.acquire()
+        order = []
+
+        async def call(lane, name):
+            await scheduler.acquire(lane=lane)
+            order.append(name)
+            scheduler.release()
+
+        calls = [asyncio.create_task(call("batch", "batch")), asyncio.create_task(call("interactive", "customer"))]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*calls)
+        return order
+
+    assert asyncio.run(scenario()) == ["customer", "batch"]
+
+
+def test_token_quota_and_throttle_hold_calls_back():
+    async def scenario():
+        scheduler = ModelScheduler(requests_per_minute=None, tokens_per_minute=600, max_concurrent=None)
+        await scheduler.acquire(600)
+        scheduler.release(600)
+        started = time.monotonic()
+        # 10 tokens per second refill: 3 tokens take 0.3 s
+        await scheduler.acquire(3)
+        scheduler.release(3)
+        quota_wait = time.monotonic() - started
+
+        scheduler.throttle(0.2)
+        started = time.monotonic()
+        await scheduler.acquire()
+        scheduler.release()
+        return quota_wait, time.monotonic() - started
+
+    quota_wait, throttle_wait = asyncio.run(scenario())
+    assert 0.25 <= quota_wait < 1
+    assert 0.15 <= throttle_wait < 1
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = ModelScheduler(max_retries=2, base_delay=0.001, max_delay=0.01)
+    monkeypatch.setattr(modelScheduler, "_scheduler", scheduler)
+    return scheduler
+
+
+def generate(llm: FlakyLlm) -> list:
+    async def scenario():
+        model = ScheduledModel(model="flaky", inner=llm)
+        return [response async for response in model.generate_content_async(LlmRequest())]
+    return asyncio.run(scenario())
+
+
+def test_rate_limited_call_is_retried(scheduler):
+    responses = generate(FlakyLlm(model="flaky", failures=2))
+    assert len(responses) == 1
+    assert scheduler.stats["retries"] == 2
+    assert scheduler.stats["rate_limited"] == 2
+    assert scheduler.in_flight == 0
+
+
+def test_model_busy_after_the_last_retry(scheduler):
+    with pytest.raises(ModelBusyError):
+        generate(FlakyLlm(model="flaky", failures=3))
+    assert scheduler.stats["failures"] == 1
+    assert scheduler.in_flight == 0
+
+
+def test_other_errors_are_not_retried(scheduler):
+    llm = FlakyLlm(model="flaky", failures=1, error=ValueError)
+    with pytest.raises(ValueError):
+        generate(llm)
+    assert llm.calls == 1
+
+
+def test_lane_follows_the_context(scheduler):
+    with modelLane("batch"):
+        generate(FlakyLlm(model="flaky"))
+    assert scheduler.stats["calls"] == {"interactive": 0, "batch": 1}
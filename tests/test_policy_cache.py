@@ -0,0 +1,44 @@
+import importlib
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from agent.helpers import AnswerCache, OrderStore, instructionVersion
+# The package re-exports the agent under the module's name
+policy = importlib.import_module("agent.subAgents.policyAgent.policyAgent")
+
+QUESTION = "Is shipping free for me?"
+
+
+def userContent(text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def ask(*earlier: str, state: dict = None):
+    contents = [userContent(text) for text in earlier] + [userContent(QUESTION)]
+    context = SimpleNamespace(state=state if state is not None else {}, user_content=contents[-1],
+                              invocation_id="turn")
+    return policy.cachedPolicyAnswer(context, LlmRequest(contents=contents))
+
+
+@pytest.fixture(autouse=True)
+def cached_answer(monkeypatch):
+    cache = AnswerCache()
+    cache.put(QUESTION, "Yes, in District 8 Wards 8-10.", instructionVersion(policy.policyAgent.instruction))
+    monkeypatch.setattr(policy, "policyCache", cache)
+
+
+def test_fresh_question_hits_the_cache():
+    assert ask() is not None
+
+
+def test_address_earlier_in_the_conversation_skips_the_cache():
+    assert ask("I live at 12 Nguyen Trai, Ward 9, District 5") is None
+
+
+def test_customer_with_orders_skips_the_cache():
+    state = {}
+    OrderStore(state).add({"order_id": "abc", "address": "12 Nguyen Trai, District 5"})
+    assert ask(state=state) is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import DatabaseSessionService
+
+from session_cache import CachingSessionService
+
+APP = "app"
+
+
+def stateEvent(**delta) -> Event:
+    return Event(author="user", invocation_id="turn", actions=EventActions(state_delta=delta))
+
+
+@pytest.fixture
+def inner(tmp_path):
+    return DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{tmp_path / 'sessions.db'}")
+
+
+@pytest.mark.parametrize("flush_interval", [0, 60])
+def test_eviction_during_a_turn(inner, flush_interval):
+    async def scenario():
+        cache = CachingSessionService(inner, max_sessions=1, flush_interval=flush_interval)
+        created = await cache.create_session(app_name=APP, user_id="a")
+        session = await cache.get_session(app_name=APP, user_id="a", session_id=created.id)
+        await cache.append_event(session, stateEvent(step=1))
+
+        # Another customer's session pushes this one out halfway through the turn
+        await cache.create_session(app_name=APP, user_id="b")
+        await cache.append_event(session, stateEvent(step=2))
+        await cache.flush()
+
+        stored = await inner.get_session(app_name=APP, user_id="a", session_id=created.id)
+        assert stored.state["step"] == 2
+        assert len(stored.events) == 2
+        assert cache.stats["flush_errors"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_stale_flush_reapplies_on_fresh_copy(inner):
+    async def scenario():
+        cache = CachingSessionService(inner, flush_interval=60)
+        created = await cache.create_session(app_name=APP, user_id="a")
+        session = await cache.get_session(app_name=APP, user_id="a", session_id=created.id)
+
+        # Another process writes the session behind the cache's back
+        other = await inner.get_session(app_name=APP, user_id="a", session_id=created.id)
+        await inner.append_event(other, stateEvent(admin=1))
+
+        await cache.append_event(session, stateEvent(step=1))
+        await cache.flush()
+
+        stored = await inner.get_session(app_name=APP, user_id="a", session_id=created.id)
+        assert stored.state == {"admin": 1, "step": 1}
+        assert cache.stats["flush_errors"] == 1
+        assert cache.stats["lost_events"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_flush_is_not_retried_forever(inner):
+    async def scenario():
+        cache = CachingSessionService(inner, max_sessions=1, flush_interval=60)
+        created = await cache.create_session(app_name=APP, user_id="a")
+        session = await cache.get_session(app_name=APP, user_id="a", session_id=created.id)
+        await cache.append_event(session, stateEvent(step=1))
+
+        await inner.delete_session(app_name=APP, user_id="a", session_id=created.id)
+        await cache.flush()
+
+        assert cache.stats["lost_events"] == 1
+        assert cache.peek(APP, "a", created.id) is None
+        # Nothing is left to block the eviction of other sessions
+        await cache.create_session(app_name=APP, user_id="b")
+        await cache.create_session(app_name=APP, user_id="c")
+        assert len(cache._entries) == 1
+
+    asyncio.run(scenario())
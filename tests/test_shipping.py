@@ -0,0 +1,30 @@
+import pytest
+
+from agent.helpers.shipping import SHIPPING_PATH, ShippingTable
+
+
+@pytest.fixture
+def table():
+    return ShippingTable.load(SHIPPING_PATH)
+
+
+@pytest.mark.parametrize("address, district, ward", [
+    ("22H Đường 3/2, P.9, Q.8", "8", "9"),
+    ("12 Nguyen Trai, Ward 9, District 5", "5", "9"),
+    ("District 8, Ward 9", "8", "9"),
+    ("45 Vo Van Ngan, Thu Duc", "thu duc", None),
+    ("Block P9, 10 Pham The Hien, Phuong 11, Quan 8", "8", "11"),
+    ("Phòng W10, 5 Au Duong Lan, Phường 1, Quận 8", "8", "1"),
+])
+def test_locate(table, address, district, ward):
+    assert table.locate(address) == (district, ward)
+
+
+def test_apartment_codes_are_not_free_wards(table):
+    assert table.quote("Block P9, 10 Pham The Hien, Phuong 11, Quan 8")["fee"] == 1.5
+    assert table.quote("Phòng W10, 5 Au Duong Lan, Phường 1, Quận 8")["fee"] == 1.5
+    assert table.quote("22H Đường 3/2, P.9, Q.8")["fee"] == 0
+
+
+def test_unknown_district(table):
+    assert table.quote("somewhere far away")["fee"] is None
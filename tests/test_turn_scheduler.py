@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import server
+from server import QueueFullError, TurnScheduler
+
+
+@pytest.fixture
+def blocked_turns(monkeypatch):
+    # run_turn stand-in that answers once `release` is set
+    release = asyncio.Event()
+
+    async def run_turn(runner, user_id, session_id, query, **kwargs):
+        await release.wait()
+        return f"answer to {query}"
+
+    monkeypatch.setattr(server, "run_turn", run_turn)
+    return release
+
+
+def test_turns_waiting_for_their_session_count_as_pending(blocked_turns):
+    async def scenario():
+        scheduler = TurnScheduler(runner=None, concurrency=1, max_pending=2)
+        scheduler.start()
+        first = asyncio.create_task(scheduler.submit("u", "s", "one"))
+        second = asyncio.create_task(scheduler.submit("u", "s", "two"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(QueueFullError):
+            await asyncio.wait_for(scheduler.submit("u", "s", "three"), timeout=1)
+
+        blocked_turns.set()
+        assert await first == "answer to one"
+        assert await second == "answer to two"
+        await scheduler.shutdown(grace=1)
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_answers_every_waiting_turn(blocked_turns):
+    async def scenario():
+        scheduler = TurnScheduler(runner=None, concurrency=1)
+        scheduler.start()
+        running = asyncio.create_task(scheduler.submit("u", "s", "one"))
+        waiting = asyncio.create_task(scheduler.submit("u", "s", "two"))
+        await asyncio.sleep(0.01)
+
+        # The running turn is cancelled, the waiting one must not be queued after it
+        await scheduler.shutdown(grace=0.01)
+        for turn in (running, waiting):
+            with pytest.raises(QueueFullError):
+                await asyncio.wait_for(turn, timeout=1)
+
+    asyncio.run(scenario())
@@ -1,12 +1,22 @@
-from datetime import datetime
-from google.genai import types
+import asyncio
+import inspect
+import logging
+import time
+from agent.helpers import OrderStore, HistoryBatch, appendInteraction, readInteractions, maybeCompact, onlineCompactionEnabled, onlineCompactionThreshold
+from agent.helpers import popTokensSaved, ModelBusyError
+from agent.helpers import getLogger, logRecord, DEBUG, INFO, ERROR
+
+_log = getLogger("utils")
+# One record per runner event, the busiest logger: sample it with LOG_SAMPLE
+_events_log = getLogger("utils.events")
+_state_log = getLogger("utils.state")
 
 
 async def update_interaction_history(session_service, app_name, user_id, session_id, entry):
-    """Add an entry to the interaction history in state.
+    """Add an entry to the session's append-only interaction history log.
 
     Args:
-        session_service: The session service instance
+        session_service: The session service instance (history no longer lives in state)
         app_name: The application name
         user_id: The user ID
         session_id: The session ID
@@ -16,38 +26,11 @@ async def update_interaction_history(session_service, app_name, user_id, session
     """
     
     try: 
-        # Get current session
-        session = await session_service.get_session(
-                app_name = app_name,
-                user_id = user_id,
-                session_id = session_id
-            )
-            
-        # Get current history
-        interaction_history = session.state.get("interaction_history", [])
-            
-        # Add timestamp if not in the entry
-        if "timestamp" not in entry:
-            entry["timestamp"] = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-                
-        # Add entry into the interaction_history
-        interaction_history.append(entry)
-            
-        
-        # Create updated state
-        updated_state = session.state.copy()
-        updated_state["interaction_history"] = interaction_history
-
-        # Create a new session with updated state
-        session_service.create_session(
-            app_name=app_name,
-            user_id=user_id,
-            session_id=session_id,
-            state=updated_state,
-        )
+        # Only the new row is appended, the session state is not reloaded
+        appendInteraction(app_name, user_id, session_id, entry)
         
     except Exception as e:
-        print(f"Error updating interaction history: {e}")
+        logRecord(_log, ERROR, "Error updating interaction history", session_id = session_id, error = str(e))
         
         
         
@@ -90,6 +73,43 @@ async def add_agent_response_to_history(session_service,
     )
 
 
+async def get_interaction_history(app_name,
+                                  user_id,
+                                  session_id,
+                                  limit = 20,
+                                  before = None):
+    """Read one page of the interaction history, see readInteractions."""
+    return readInteractions(app_name, user_id, session_id, limit, before)
+
+
+# Debug output of the session state around every turn. Off by default so
+# the hot path does no extra work, see set_show_state
+SHOW_STATE = False
+
+# In-memory copy of each session's state, kept up to date from the events
+# the runner yields, so the debug display never reloads the session
+_state_views = {}
+
+
+def set_show_state(enabled):
+    """Turn the BEFORE/AFTER state records of call_agent_async on or off."""
+    global SHOW_STATE
+    SHOW_STATE = bool(enabled)
+    # Asking for the state display is asking for its records, whatever LOG_LEVEL says
+    _state_log.setLevel(INFO if SHOW_STATE else logging.NOTSET)
+    if not SHOW_STATE:
+        _state_views.clear()
+
+
+def print_state(state, label = "Current state"):
+    """Log the user name and receipts of a session state as one record."""
+    if not _state_log.isEnabledFor(INFO):
+        return
+    # Copies: the writer thread serializes them after the state moves on
+    orders = [dict(order) for order in OrderStore(state).all()]
+    logRecord(_state_log, INFO, label, user_name = state.get("user_name", "Unknown"), orders = orders)
+
+
 async def display_state(session_service, 
                         app_name,
                         user_id,
@@ -102,72 +122,44 @@ async def display_state(session_service,
             session_id = session_id
         )
         
-        print(f"\n{'-' * 10} {label} {'-' * 10}")
-        
-        # Handle the user name
-        user_name = session.state.get("user_name", "Unknown")
-        
-        print(f"👤 User: {user_name}")
-        
-        # Handle orders info
-        orders = session.state.get("orders", [])
-        if orders or any(orders):
-            print("Recepit:")
-            for i, order in enumerate(orders, 1):
-                print(f"\n=== Order {i} ===")
-                print(f"Order ID: {order.get('order_id')}")
-                print(f"Customer: {order.get('customer_name')}")
-                print(f"Address: {order.get('address')}")
-                print(f"Phone: {order.get('phone')}")
-                print(f"Delivery Time: {order.get('delivery_time')}")
-                print(f"Purchased Time: {order.get('purchased_time')}")
-
-                # Loop products
-                print("\nProducts:")
-                products = order.get("products", [])
-                for j, product in enumerate(products, 1):
-                    print(f"  {j}. {product.get('name', 'N/A')} "
-                        f"x{product.get('quantity', 1)} "
-                        f"- {product.get('price', 0)}")
-
-                # Show total
-                print(f"\nSubtotal (no shipping): {order.get('temp_total_not_include_shipping_fee', 0)}")
-                print("=" * 30)
-
-        else:
-            print("There is none.")
+        print_state(session.state, label)
             
     except Exception as e:
-        print(f"Error display state: {e}")
+        logRecord(_log, ERROR, "Error display state", session_id = session_id, error = str(e))
+
+
+async def _state_view(runner, user_id, session_id):
+    # Only the first turn of a session loads it, later turns reuse the view
+    key = (runner.app_name, user_id, session_id)
+    if key not in _state_views:
+        session = await runner.session_service.get_session(
+            app_name = runner.app_name,
+            user_id = user_id,
+            session_id = session_id
+        )
+        _state_views[key] = dict(session.state) if session else {}
+    return _state_views[key]
         
         
 async def process_agent_response(event):
-    # Log basic event info
-    print(f"Event ID: {event.id}, Author: {event.author}")
-
-    # Check for specif ic parts first
-    has_specific_part = False
-    if event.content and event.content.parts:
-        for part in event.content.parts:
-            if hasattr(part, "executable_code") and part.executable_code:
-                # Access the actual code string via .code
-                print(
-                    f"  Debug: Agent generated code:\n```python\n{part.executable_code.code}\n```"
-                )
-                has_specific_part = True
-            elif hasattr(part, "code_execution_result") and part.code_execution_result:
-                # Access outcome and output correctly
-                print(
-                    f"  Debug: Code Execution Result: {part.code_execution_result.outcome} - Output:\n{part.code_execution_result.output}"
-                )
-                has_specific_part = True
-            elif hasattr(part, "tool_response") and part.tool_response:
-                # Print tool response information
-                print(f"  Tool Response: {part.tool_response.output}")
-                has_specific_part = True
-            # Also print any text parts found in any event for debugging
-            elif hasattr(part, "text") and part.text and not part.text.isspace():
-                print(f"  Text: '{part.text.strip()}'")
+    # One structured record per event, nothing at all when the level is off
+    if _events_log.isEnabledFor(DEBUG):
+        parts = []
+        if event.content and event.content.parts:
+            for part in event.content.parts:
+                if hasattr(part, "executable_code") and part.executable_code:
+                    parts.append({"code": part.executable_code.code})
+                elif hasattr(part, "code_execution_result") and part.code_execution_result:
+                    parts.append({"code_outcome": str(part.code_execution_result.outcome),
+                                  "code_output": part.code_execution_result.output})
+                elif hasattr(part, "tool_response") and part.tool_response:
+                    parts.append({"tool_response": part.tool_response.output})
+                elif hasattr(part, "function_call") and part.function_call:
+                    parts.append({"function_call": part.function_call.name})
+                elif hasattr(part, "text") and part.text and not part.text.isspace():
+                    parts.append({"text": part.text.strip()})
+        logRecord(_events_log, DEBUG, "event", event_id = event.id, author = event.author,
+                  invocation_id = event.invocation_id, final = event.is_final_response(), parts = parts)
 
     # Check for final response after specific parts
     final_response = None
@@ -179,79 +171,205 @@ async def process_agent_response(event):
             and event.content.parts[0].text
         ):
             final_response = event.content.parts[0].text.strip()
-            print(
-                f"\n╔══ AGENT RESPONSE ═════════════════════════════════════════"
-            )
-            print(f"{final_response}")
-            print(
-                f"╚═════════════════════════════════════════════════════════════\n"
-            )
+            logRecord(_events_log, INFO, "Agent response", event_id = event.id, author = event.author,
+                      response = final_response)
         else:
-            print(
-                f"\n==> Final Agent Response: [No text content in final event]\n"
-            )
+            logRecord(_events_log, INFO, "Final event without text", event_id = event.id, author = event.author)
 
     return final_response
 
 
-async def call_agent_async(runner, user_id, session_id, query):
-    """Call the agent asynchronously with the user's query."""
+async def _notify(callback, text):
+    # Callbacks may be plain functions or coroutines
+    if callback is not None:
+        result = callback(text)
+        if inspect.isawaitable(result):
+            await result
+
+
+# Sent to the customer when the model stays rate limited after every retry
+MODEL_BUSY_MESSAGE = "Sorry, we are answering a lot of customers right now. Please send your message again in a minute (ෆ˙ᵕ˙ෆ)."
+
+
+async def call_agent_async(runner, user_id, session_id, query,
+                           stream = False,
+                           on_delta = None,
+                           on_response = None,
+                           timings = None):
+    """Call the agent asynchronously with the user's query.
+
+    The turn runs inside a HistoryBatch, so its interaction history rows are
+    written in a single transaction once the turn ends. If the agent run
+    fails, only the rows logged since the last event the runner saved are
+    dropped: the tools' state changes (orders) are persisted with their
+    events by the session service, so the rows of saved events are kept
+    to match them, as is run_turn's user query.
+
+    The state deltas themselves are not buffered here. They belong to the
+    events ADK appends, and the session service coalesces those writes
+    (see session_cache.py).
+
+    Args:
+        stream: ask the model for partial responses and pass each text
+            delta to `on_delta` as soon as it arrives
+        on_delta: callable (sync or async) taking the text delta
+        on_response: callable (sync or async) taking each final response
+            (e.g. the console printing it); nothing is printed here, the
+            server only logs the responses
+        timings: optional dict filled with "first_token" (time to first
+            text, in seconds), "total" (whole turn latency) and
+            "prompt_tokens_saved" (by the context budget)
+    """
+    # Imported here so importing utils doesn't pull in google.genai
+    from google.genai import types
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+
+    started = time.perf_counter()
+    first_token = None
+    streamed = False
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if stream else StreamingMode.NONE)
     
     content = types.Content(
         role="user", 
         parts=[types.Part(text=query)]
         )
     
-    print(
-        f"\n--- Running Query: {query} ---"
-    )
+    logRecord(_log, INFO, "Running query", user_id = user_id, session_id = session_id, query = query)
     final_response_text = None
     agent_name = None
+    invocation_id = None
 
     # Display state before processing
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        user_id,
-        session_id,
-        "State BEFORE processing",
-    )
+    state_view = None
+    if SHOW_STATE:
+        state_view = await _state_view(runner, user_id, session_id)
+        print_state(state_view, "State BEFORE processing")
 
-    try:
-        async for event in runner.run_async(
-            user_id=user_id, session_id=session_id, new_message=content
-        ):
-            # Capture the agent name from the event if available
-            if event.author:
-                agent_name = event.author
-
-            # Process each event and get the final response if available
-            response = await process_agent_response(event)
-            if response:
-                final_response_text = response
-    except Exception as e:
-        print(f"Error during agent call: {e}")
-        
-        
-     # Add the agent response to interaction history if we got a final response
-    if final_response_text and agent_name:
-        await add_agent_response_to_history(
-            runner.session_service,
-            runner.app_name,
-            user_id,
-            session_id,
-            agent_name,
-            final_response_text,
-        )
+    # All history writes of this turn are committed together at the end.
+    # If the agent call fails, rows after the last saved event are dropped
+    async with HistoryBatch() as turn:
+        saved_rows = turn.savepoint()
+        try:
+            async for event in runner.run_async(
+                user_id=user_id, session_id=session_id, new_message=content,
+                run_config=run_config,
+            ):
+                # Capture the agent name from the event if available
+                if event.author:
+                    agent_name = event.author
+                invocation_id = event.invocation_id or invocation_id
+
+                # Partial events only carry a text delta, push it right away
+                if event.partial:
+                    parts = event.content.parts if event.content and event.content.parts else []
+                    text = "".join(part.text for part in parts if part.text)
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        streamed = True
+                        await _notify(on_delta, text)
+                    continue
+
+                # The runner saved this event (and its state delta) before
+                # yielding it, so the rows logged so far are kept
+                saved_rows = turn.savepoint()
+
+                # Keep the debug view in sync with the state changes
+                if state_view is not None and event.actions and event.actions.state_delta:
+                    state_view.update(event.actions.state_delta)
+
+                # Process each event and get the final response if available
+                response = await process_agent_response(event)
+                if response:
+                    final_response_text = response
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    # Answers that came in one piece (e.g. from a cache)
+                    # still have to reach the client
+                    if stream and not streamed:
+                        await _notify(on_delta, response)
+                    await _notify(on_response, response)
+                streamed = False
+        except ModelBusyError as e:
+            # Out of quota even after the retries: answer instead of going silent
+            logRecord(_log, ERROR, "Model unavailable", session_id = session_id, error = str(e))
+            turn.rollback(saved_rows)
+            final_response_text = MODEL_BUSY_MESSAGE
+            agent_name = agent_name or runner.agent.name
+            if stream:
+                await _notify(on_delta, final_response_text)
+            await _notify(on_response, final_response_text)
+        except Exception as e:
+            logRecord(_log, ERROR, "Error during agent call", session_id = session_id,
+                      dropped_rows = turn.savepoint() - saved_rows, error = str(e))
+            turn.rollback(saved_rows)
+            
+            
+        # Add the agent response to interaction history if we got a final response
+        if final_response_text and agent_name:
+            await add_agent_response_to_history(
+                runner.session_service,
+                runner.app_name,
+                user_id,
+                session_id,
+                agent_name,
+                final_response_text,
+            )
 
 
+    tokens_saved = popTokensSaved(invocation_id) if invocation_id else 0
+    if timings is not None:
+        timings["first_token"] = first_token
+        timings["total"] = time.perf_counter() - started
+        timings["prompt_tokens_saved"] = tokens_saved
+
     # Display state after processing the message
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        user_id,
-        session_id,
-        "State AFTER processing",
-    )
+    if state_view is not None:
+        print_state(state_view, "State AFTER processing")
+
+    return final_response_text
+
+
+async def run_turn(runner, user_id, session_id, query, **kwargs):
+    """Handle one customer message: record it and run the agents on it.
+
+    One unit of work per turn: the user's query and everything the agents
+    write are committed together when the turn ends. Extra keyword
+    arguments (stream, on_delta, on_response, timings) go to
+    call_agent_async.
+    """
+    async with HistoryBatch():
+        # Update interaction history with the user's query
+        await add_user_query_to_history(
+            runner.session_service, runner.app_name, user_id, session_id, query
+        )
+
+        # Process the user query through the agent
+        response = await call_agent_async(runner, user_id, session_id, query, **kwargs)
+
+    # Fold old events into the session checkpoint once the session is long
+    if onlineCompactionEnabled():
+        try:
+            await compact_session(runner.session_service, runner.app_name, user_id, session_id)
+        except Exception as e:
+            logRecord(_log, ERROR, "Error compacting session", session_id = session_id, error = str(e))
+
+    return response
+
+
+async def compact_session(session_service, app_name, user_id, session_id):
+    """Online compaction that also works with the write-back session cache."""
+    peek = getattr(session_service, "peek", None)
+    cached = peek(app_name, user_id, session_id) if peek else None
+    if cached is not None:
+        # The cached copy knows the event count without a query
+        if len(cached.events) < onlineCompactionThreshold():
+            return 0
+        # The pending events have to be in the database to be folded
+        await session_service.flush_session(app_name, user_id, session_id)
 
-    return final_response_text
\ No newline at end of file
+    folded = await asyncio.to_thread(maybeCompact, app_name, user_id, session_id)
+    if folded and cached is not None:
+        # The cached copy predates the checkpoint: reload it next turn
+        await session_service.invalidate(app_name, user_id, session_id)
+    return folded